@@ -0,0 +1,62 @@
+"""
+Messages per second: one /send-summary per message vs batched /send-summaries,
+against the local fake Gmail server.
+
+Usage: python benchmarks/bench_bulk_send.py [messages] [latency_seconds]
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from unittest.mock import patch
+from google.oauth2.credentials import Credentials
+
+import google_services
+from fake_google import FakeGoogleServer
+from main import SummaryRequest, send_summary_endpoint, send_summaries_endpoint
+
+
+def _requests(n):
+    return [
+        SummaryRequest(doctor_email=f"doctor{i}@example.com", summary=f"End of shift note {i}",
+                       patient_name=f"Patient {i}", patient_id=str(1000 + i))
+        for i in range(n)
+    ]
+
+
+async def _one_by_one(requests):
+    for request in requests:
+        await send_summary_endpoint(request)
+
+
+def main(n=200, latency=0.02):
+    with FakeGoogleServer(latency=latency) as server, \
+         patch.dict(os.environ, {'GOOGLE_API_ROOT_URL': server.url}), \
+         patch('google_services.load_credentials', return_value=Credentials(token='bench-token')), \
+         patch.dict('rate_limit.QUOTAS', {'gmail': (1e9, 1e9)}):
+        # Measure transport cost, not the Gmail quota smoothing
+        google_services.clear_cache()
+        requests = _requests(n)
+
+        start = time.perf_counter()
+        asyncio.run(_one_by_one(requests))
+        single = n / (time.perf_counter() - start)
+        single_http = server.requests
+
+        start = time.perf_counter()
+        response = asyncio.run(send_summaries_endpoint(requests))
+        bulk = n / (time.perf_counter() - start)
+        assert response['sent'] == n, response
+        bulk_http = server.requests - single_http
+
+    print(f"{n} messages, {latency * 1000:.0f} ms fake Gmail latency")
+    print(f"/send-summary x{n}   {single:8.1f} msg/s  ({single_http} HTTP requests)")
+    print(f"/send-summaries      {bulk:8.1f} msg/s  ({bulk_http} HTTP requests)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200,
+         float(sys.argv[2]) if len(sys.argv) > 2 else 0.02)
@@ -0,0 +1,54 @@
+"""
+Fragments per second through the dateparser fallback: uncached vs the relative-date cache.
+
+The reference time advances with the wall clock, as it does in the server, so
+cached rules must be re-applied to a new `now` on every call.
+
+Usage: python benchmarks/bench_date_cache.py [seconds_per_mode]
+"""
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from date_cache import RelativeDateCache
+from date_intent import _dateparser_fallback
+
+# Phrases the fast path does not cover
+FRAGMENTS = [
+    "blood test on the 5th of next month",
+    "20 minutes from now",
+    "follow up next week",
+    "march 3rd at 10",
+    "3 days from now",
+    "i may have a rash",
+]
+
+
+def fragments_per_second(resolve, seconds):
+    for fragment in FRAGMENTS:
+        resolve(fragment, datetime.now())
+
+    done = 0
+    deadline = time.perf_counter() + seconds
+    start = time.perf_counter()
+    while time.perf_counter() < deadline:
+        for fragment in FRAGMENTS:
+            resolve(fragment, datetime.now())
+        done += len(FRAGMENTS)
+    return done / (time.perf_counter() - start)
+
+
+def main(seconds=3.0):
+    cache = RelativeDateCache(_dateparser_fallback)
+    uncached = fragments_per_second(_dateparser_fallback, seconds)
+    cached = fragments_per_second(cache.resolve, seconds)
+    print(f"uncached {uncached:10.0f} fragments/s")
+    print(f"cached   {cached:10.0f} fragments/s  (hit rate {cache.state()['hit_rate']:.3f})")
+    print(f"speedup  {cached / uncached:10.1f}x")
+
+
+if __name__ == "__main__":
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else 3.0)
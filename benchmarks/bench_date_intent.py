@@ -0,0 +1,51 @@
+"""
+Fragments per second through date detection: legacy dateparser vs the layered classifier.
+
+Usage: python benchmarks/bench_date_intent.py [seconds_per_mode]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from date_intent import extract_datetime, MODE_FAST, MODE_LEGACY
+
+FRAGMENTS = [
+    "take insulin at 7pm",
+    "i have some allergic on my hand",
+    "check sugar tomorrow 8am",
+    "metformin at 9pm",
+    "my headache is worse since yesterday",
+    "see doctor on monday",
+    "in 2 hours take pills",
+    "feeling dizzy after breakfast",
+    "blood pressure was 120 over 80",
+    "i may have a rash",
+]
+
+
+def fragments_per_second(mode, seconds):
+    # Warm-up: dateparser loads its language data lazily
+    for fragment in FRAGMENTS:
+        extract_datetime(fragment, mode=mode)
+
+    done = 0
+    deadline = time.perf_counter() + seconds
+    start = time.perf_counter()
+    while time.perf_counter() < deadline:
+        for fragment in FRAGMENTS:
+            extract_datetime(fragment, mode=mode)
+        done += len(FRAGMENTS)
+    return done / (time.perf_counter() - start)
+
+
+def main(seconds=3.0):
+    results = {mode: fragments_per_second(mode, seconds) for mode in (MODE_LEGACY, MODE_FAST)}
+    for mode, rate in results.items():
+        print(f"{mode:8s} {rate:10.0f} fragments/s")
+    print(f"speedup  {results[MODE_FAST] / results[MODE_LEGACY]:10.1f}x")
+
+
+if __name__ == "__main__":
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else 3.0)
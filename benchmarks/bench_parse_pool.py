@@ -0,0 +1,71 @@
+"""
+Command parse throughput with and without the parse process pool.
+
+`clients` threads call orchestrator.plan_command concurrently (the way
+executor workers do under load) on commands whose fragments need dateparser.
+
+  inline        parsing on the calling threads (GIL-bound)
+  N processes   parse_pool.ParsePool with N children, fragments batched across clients
+
+Throughput only scales with processes up to the number of free cores.
+
+Usage: python benchmarks/bench_parse_pool.py [commands] [clients] [max_processes]
+"""
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from orchestrator import plan_command
+from parse_pool import ParsePool
+from warmup import warm_date_parser
+
+# Phrasings that miss date_intent's fast path and reach dateparser
+COMMANDS = [
+    "blood test on the 5th of next month and my knee hurts when I climb stairs",
+    "follow up appointment march 3rd at 10, also the rash is spreading",
+    "dentist on 14 november at 3 then pick up the prescription",
+    "physio session the day after tomorrow at 11; I slept badly again",
+]
+
+
+def _run(commands, clients):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(clients) as pool:
+        list(pool.map(lambda i: plan_command(COMMANDS[i % len(COMMANDS)]), range(commands)))
+    return time.perf_counter() - start
+
+
+def main(commands=400, clients=16, max_processes=None):
+    max_processes = max_processes or os.cpu_count()
+    warm_date_parser()
+    fragments = commands * 2
+    print(f"{commands} commands ({fragments} fragments), {clients} client threads, "
+          f"{os.cpu_count()} CPU(s), {len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else '?'} usable")
+
+    _run(20, clients)
+    elapsed = _run(commands, clients)
+    print(f"{'inline':14s} {fragments / elapsed:8.0f} fragments/s")
+
+    processes = 1
+    while processes <= max_processes:
+        pool = ParsePool(processes).warm_up()
+        try:
+            with patch('orchestrator.get_parse_pool', return_value=pool):
+                _run(20, clients)
+                elapsed = _run(commands, clients)
+            state = pool.state()
+            print(f"{f'{processes} processes':14s} {fragments / elapsed:8.0f} fragments/s  "
+                  f"mean batch {state['mean_batch_size']:.1f}")
+        finally:
+            pool.shutdown()
+        processes *= 2
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 400,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 16,
+         int(sys.argv[3]) if len(sys.argv) > 3 else None)
@@ -0,0 +1,86 @@
+"""
+Command segmentation throughput on multi-kilobyte dictated transcripts.
+
+  legacy      re.split on " and " plus the endpoint's separate email regex
+              (what plan_command and _resolve_command did before segmenter.py)
+  segment     segmenter.segment: one scan for fragments, time tokens and emails
+  plan        orchestrator.plan_command on the same transcript (segmentation
+              plus date classification of the fragments that need it)
+  legacy plan the old plan_command: split on " and ", classify every part
+
+The segment cache is bypassed so every iteration scans the text.
+
+Usage: python benchmarks/bench_segmenter.py [iterations]
+"""
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from date_intent import extract_datetime
+from orchestrator import plan_command
+import segmenter
+
+SENTENCES = [
+    "take insulin at 7pm and i have some allergic on my hand",
+    "then at 9 take metformin, also my rash is worse; remind me Friday",
+    "my blood pressure was 140/90 this morning and I felt a little dizzy after breakfast",
+    "I slept badly again. After that the headache came back behind my left eye",
+    "walk every monday and thursday at 7am",
+    "send the notes to dr.smith@clinic.example.com",
+    "the new cream helps a bit but the itching is still there at night",
+]
+
+_LEGACY_EMAIL_RE = r'[\w\.-]+@[\w\.-]+\.\w+'
+
+
+def transcript(size):
+    parts = []
+    total = 0
+    i = 0
+    while total < size:
+        sentence = SENTENCES[i % len(SENTENCES)]
+        parts.append(sentence)
+        total += len(sentence) + 2
+        i += 1
+    return ". ".join(parts)
+
+
+def legacy(text):
+    parts = [p.strip() for p in re.split(r'\s+and\s+', text, flags=re.IGNORECASE)]
+    re.search(_LEGACY_EMAIL_RE, text)
+    return parts
+
+
+def legacy_plan(text):
+    return [extract_datetime(part) for part in legacy(text)]
+
+
+def _time(func, text, iterations):
+    func(text)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func(text)
+    return (time.perf_counter() - start) / iterations
+
+
+def main(iterations=200):
+    scan = segmenter.segment.__wrapped__
+    print(f"{'transcript':>10s} {'fragments':>9s} {'legacy MB/s':>12s} {'segment MB/s':>13s} "
+          f"{'segment us':>11s} {'plan ms':>8s} {'legacy plan ms':>15s}")
+    for size in (1024, 4096, 16384, 65536):
+        text = transcript(size)
+        legacy_s = _time(legacy, text, iterations)
+        segment_s = _time(scan, text, iterations)
+        plan_s = _time(plan_command, text, max(1, iterations // 20))
+        legacy_plan_s = _time(legacy_plan, text, max(1, iterations // 20))
+        fragments = len(scan(text)[0])
+        print(f"{len(text):>9d}B {fragments:>9d} {len(text) / legacy_s / 1e6:>12.1f} "
+              f"{len(text) / segment_s / 1e6:>13.1f} {segment_s * 1e6:>11.0f} {plan_s * 1000:>8.1f} "
+              f"{legacy_plan_s * 1000:>15.1f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
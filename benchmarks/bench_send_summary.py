@@ -0,0 +1,61 @@
+"""
+Latency of a single /send-summary call against a mocked Gmail transport.
+
+"cold" clears the service registry before every call, which is what each
+request used to pay (token load + discovery parse + build).
+"warm" reuses the cached client.
+
+Usage: python benchmarks/bench_send_summary.py [iterations]
+"""
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from unittest.mock import patch
+from google.oauth2.credentials import Credentials
+import httplib2
+
+import google_services
+import idempotency
+from main import SummaryRequest, send_summary_endpoint
+
+
+class FakeGmailHttp:
+    """Answers every request with a canned messages.send response."""
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        return httplib2.Response({'status': '200'}), b'{"id": "bench-msg", "threadId": "t"}'
+
+
+def _time_call(request, cold):
+    # Identical bodies would be answered from the idempotency cache
+    idempotency.reset_idempotency_cache()
+    if cold:
+        google_services.clear_cache()
+    start = time.perf_counter()
+    asyncio.run(send_summary_endpoint(request))
+    return (time.perf_counter() - start) * 1000
+
+
+def main(iterations=50):
+    request = SummaryRequest(doctor_email="doctor@example.com", summary="Dizzy after breakfast. BP 120/80.")
+    fake_creds = Credentials(token='bench-token')
+
+    with patch('google_services.load_credentials', return_value=fake_creds), \
+         patch('google_services.new_http', lambda creds: FakeGmailHttp()), \
+         patch.dict('rate_limit.QUOTAS', {'gmail': (1e9, 1e9)}):
+        # Measure request-path cost, not the Gmail quota smoothing
+        for cold in (True, False):
+            _time_call(request, cold)  # prime imports
+            samples = [_time_call(request, cold) for _ in range(iterations)]
+            label = "cold (rebuild per request)" if cold else "warm (cached service)"
+            print(f"{label:30s} median {statistics.median(samples):7.2f} ms  "
+                  f"p95 {sorted(samples)[int(len(samples) * 0.95) - 1]:7.2f} ms")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50)
@@ -0,0 +1,117 @@
+"""
+Startup, first-request latency and throughput of the server modes,
+run as real uvicorn processes against the local fake Google server.
+
+  reload  `python main.py --reload` without warm-up (the previous default)
+  serve   `python main.py` : one warmed-up worker per core
+
+Usage: python benchmarks/bench_serve.py [seconds] [concurrency]
+"""
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from fake_google import FakeGoogleServer
+
+PORT = 8765
+# Reaches dateparser (not the pattern fast path) and sends an email
+FIRST_COMMAND = "blood test on the 5th of next month and I feel dizzy"
+
+
+def _wait_for_port(port, timeout=120):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.2):
+                return
+        except OSError:
+            time.sleep(0.02)
+    raise RuntimeError(f"Server did not open port {port}")
+
+
+def _post(conn, text):
+    body = json.dumps({"text": text, "doctor_email": "doctor@example.com"})
+    conn.request('POST', '/process-command', body, {'Content-Type': 'application/json'})
+    response = conn.getresponse()
+    response.read()
+    if response.status != 200:
+        raise RuntimeError(f"HTTP {response.status}")
+
+
+def _load(seconds, concurrency):
+    done = [0] * concurrency
+    deadline = time.perf_counter() + seconds
+
+    def client(slot):
+        conn = http.client.HTTPConnection('127.0.0.1', PORT, timeout=30)
+        n = 0
+        while time.perf_counter() < deadline:
+            # Unique text so the idempotency cache never answers
+            _post(conn, f"remind me at 7pm to take insulin and note {slot}-{n}: mild headache")
+            n += 1
+        done[slot] = n
+        conn.close()
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(done) / (time.perf_counter() - start)
+
+
+def run_mode(name, args, env, seconds, concurrency):
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, 'main.py', '--port', str(PORT), '--host', '127.0.0.1', *args],
+                               cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        _wait_for_port(PORT)
+        ready = time.perf_counter() - start
+
+        conn = http.client.HTTPConnection('127.0.0.1', PORT, timeout=60)
+        t0 = time.perf_counter()
+        _post(conn, FIRST_COMMAND)
+        first = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        _post(conn, FIRST_COMMAND + " again")
+        second = time.perf_counter() - t0
+        conn.close()
+
+        rps = _load(seconds, concurrency)
+    finally:
+        process.terminate()
+        process.wait(timeout=60)
+
+    print(f"{name:8s} ready {ready * 1000:7.0f} ms   first request {first * 1000:7.1f} ms   "
+          f"second {second * 1000:6.1f} ms   {rps:7.1f} req/s")
+
+
+def main(seconds=10, concurrency=8):
+    with FakeGoogleServer() as server:
+        env = dict(
+            os.environ,
+            GOOGLE_API_ROOT_URL=server.url,
+            GOOGLE_TOKEN_DATA=json.dumps({'token': 'bench-token', 'refresh_token': 'r',
+                                          'client_id': 'c', 'client_secret': 's',
+                                          'expiry': '2099-01-01T00:00:00Z'}),
+            SPEAKSPACE_GMAIL_UNITS_PER_SECOND='1e9', SPEAKSPACE_GMAIL_BURST_UNITS='1e9',
+            SPEAKSPACE_CALENDAR_UNITS_PER_SECOND='1e9', SPEAKSPACE_CALENDAR_BURST_UNITS='1e9',
+            SPEAKSPACE_JOB_DB=os.path.join(REPO_ROOT, 'bench-jobs.db.missing'),
+        )
+        print(f"{os.cpu_count()} CPU(s), {concurrency} concurrent clients, {seconds}s load per mode")
+        run_mode('reload', ['--reload'], dict(env, SPEAKSPACE_WARMUP='0'), seconds, concurrency)
+        run_mode('serve', [], env, seconds, concurrency)
+
+
+if __name__ == "__main__":
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else 10,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 8)
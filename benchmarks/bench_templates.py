@@ -0,0 +1,69 @@
+"""
+Email render throughput: the original string-assembly format_email_body
+vs the precompiled templates (single and batch render).
+
+Usage: python benchmarks/bench_templates.py [iterations]
+"""
+import html
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from templates import render, render_many
+
+
+def legacy_format_email_body(summary, patient_name=None, patient_id=None, include_metadata=True):
+    """The pre-template implementation, kept here as the baseline."""
+    current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    safe_summary = html.escape(summary).replace('\n', '<br>')
+    safe_p_name = html.escape(patient_name) if patient_name else "N/A"
+    safe_p_id = html.escape(patient_id) if patient_id else "N/A"
+    text_parts = []
+    if include_metadata:
+        text_parts.append(f"Patient Name: {patient_name if patient_name else 'N/A'}")
+        text_parts.append(f"Patient ID: {patient_id if patient_id else 'N/A'}")
+        text_parts.append(f"Date: {current_time}")
+        text_parts.append("-" * 20)
+    text_parts.append("Summary Report:")
+    text_parts.append(summary)
+    plain_text = "\n".join(text_parts)
+    html_parts = []
+    html_parts.append("<div style='font-family: Arial, sans-serif; color: #333;'>")
+    if include_metadata:
+        html_parts.append("<div style='background-color: #f4f4f4; padding: 10px; border-radius: 5px; margin-bottom: 20px;'>")
+        html_parts.append(f"<p><strong>Patient Name:</strong> {safe_p_name}</p>")
+        html_parts.append(f"<p><strong>Patient ID:</strong> {safe_p_id}</p>")
+        html_parts.append(f"<p><strong>Date:</strong> {current_time}</p>")
+        html_parts.append("</div>")
+    html_parts.append(f"<h3>Summary Report</h3>")
+    html_parts.append(f"<div style='line-height: 1.5;'>{safe_summary}</div>")
+    html_parts.append("<br><hr>")
+    html_parts.append("<p style='font-size: 12px; color: #888;'>Generated by SpeakSpace Health Assistant</p>")
+    html_parts.append("</div>")
+    return plain_text, "\n".join(html_parts)
+
+
+ITEM = {"summary": "Dizzy after breakfast.\nBP 120/80, mild headache & nausea.",
+        "patient_name": "Anusha S", "patient_id": "54321"}
+
+
+def _rate(fn, n):
+    start = time.perf_counter()
+    fn(n)
+    return n / (time.perf_counter() - start)
+
+
+def main(n=100000):
+    legacy = _rate(lambda n: [legacy_format_email_body(**ITEM) for _ in range(n)], n)
+    single = _rate(lambda n: [render('summary', **ITEM) for _ in range(n)], n)
+    batch = _rate(lambda n: render_many('summary', [ITEM] * n), n)
+    print(f"legacy string assembly  {legacy:10.0f} renders/s")
+    print(f"precompiled render      {single:10.0f} renders/s  ({single / legacy:.1f}x)")
+    print(f"precompiled render_many {batch:10.0f} renders/s  ({batch / legacy:.1f}x)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,90 @@
+"""
+TLS handshakes and latency per Gmail send for each HTTP transport,
+against the local fake Google server over HTTPS (self-signed certificate).
+
+  httplib2, new per call   a fresh client per send (every send handshakes)
+  httplib2, per thread     ThreadLocalHttp: one keep-alive connection per thread
+  pooled                   PooledHttp: one shared keep-alive pool
+
+Each transport sends the messages sequentially and then from `threads` threads.
+Needs the `cryptography` package for the certificate.
+
+Usage: python benchmarks/bench_transport.py [messages] [threads] [latency_seconds]
+"""
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from unittest.mock import patch
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+
+from fake_google import FakeGoogleServer, make_self_signed_cert
+from gmail_client import send_email
+from google_services import ThreadLocalHttp
+from transport import PooledHttp
+
+
+def _gmail(root_url, http):
+    doc = json.loads(get_static_doc('gmail', 'v1'))
+    doc['rootUrl'] = root_url
+    return build_from_document(doc, http=http)
+
+
+def _send(service):
+    start = time.perf_counter()
+    send_email(service, "doctor@example.com", "Benchmark", "Plain body", "<p>HTML body</p>")
+    return time.perf_counter() - start
+
+
+def _run(server, make_service, messages, threads):
+    results = {}
+    for label, workers in (('sequential', 1), (f'{threads} threads', threads)):
+        connections = server.connections
+        start = time.perf_counter()
+        with ThreadPoolExecutor(workers) as pool:
+            samples = list(pool.map(lambda _: _send(make_service()), range(messages)))
+        elapsed = time.perf_counter() - start
+        results[label] = {
+            'handshakes': server.connections - connections,
+            'p50_ms': statistics.median(samples) * 1000,
+            'mean_ms': statistics.fmean(samples) * 1000,
+            'sends_per_second': messages / elapsed,
+        }
+    return results
+
+
+def main(messages=200, threads=8, latency=0.0):
+    creds = Credentials(token='bench-token')
+    with tempfile.TemporaryDirectory() as directory:
+        cert, key = make_self_signed_cert(directory)
+        with FakeGoogleServer(latency=latency, tls=(cert, key)) as server, \
+             patch('google_services.CA_BUNDLE', cert), \
+             patch.dict('rate_limit.QUOTAS', {'gmail': (1e9, 1e9)}):
+            url = server.url
+            per_thread = _gmail(url, ThreadLocalHttp(creds))
+            pooled = _gmail(url, PooledHttp(creds, pool_size=threads, ca_bundle=cert))
+            transports = {
+                'httplib2, new per call': lambda: _gmail(url, ThreadLocalHttp(creds)),
+                'httplib2, per thread': lambda: per_thread,
+                'pooled': lambda: pooled,
+            }
+            print(f"{messages} sends over HTTPS, {latency * 1000:.0f} ms fake latency, {os.cpu_count()} CPU(s)")
+            for name, make_service in transports.items():
+                for label, r in _run(server, make_service, messages, threads).items():
+                    print(f"{name:24s} {label:11s} {r['handshakes']:4d} handshakes  "
+                          f"p50 {r['p50_ms']:6.2f} ms  mean {r['mean_ms']:6.2f} ms  "
+                          f"{r['sends_per_second']:7.1f} sends/s")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 8,
+         float(sys.argv[3]) if len(sys.argv) > 3 else 0.0)
@@ -0,0 +1,284 @@
+"""
+Local stand-in for the Google API endpoints the app calls.
+
+Serves Gmail messages.send (including media and resumable uploads),
+Calendar events.insert and the batch endpoint over plain HTTP so benchmarks can run the real googleapiclient request path
+without network access. Point the clients at it with
+GOOGLE_API_ROOT_URL=server.url.
+
+    with FakeGoogleServer(latency=0.02, error_rate=0.05) as server:
+        os.environ['GOOGLE_API_ROOT_URL'] = server.url
+        ...
+"""
+import datetime
+import email.parser
+import ipaddress
+import itertools
+import json
+import os
+import random
+import ssl
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upload bodies are read and discarded in pieces of this size, so the fake
+# never holds a large upload in memory
+_READ_CHUNK_BYTES = 1024 * 1024
+
+
+def make_self_signed_cert(directory, host='127.0.0.1'):
+    """
+    Writes a throwaway certificate for `host` and returns (cert_path, key_path).
+    The cert doubles as the CA bundle clients must trust. Needs `cryptography`.
+    """
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, host)])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name).issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(minutes=5))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .add_extension(x509.SubjectAlternativeName([x509.IPAddress(ipaddress.ip_address(host))]), critical=False)
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+        .sign(key, hashes.SHA256())
+    )
+    cert_path = os.path.join(directory, 'fake-google.crt')
+    key_path = os.path.join(directory, 'fake-google.key')
+    with open(cert_path, 'wb') as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    with open(key_path, 'wb') as f:
+        f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                  serialization.NoEncryption()))
+    return cert_path, key_path
+
+
+class _CountingServer(ThreadingHTTPServer):
+    """
+    Counts accepted connections (= TLS handshakes when serving HTTPS).
+    The handshake runs on the handler thread so slow ones do not block accept().
+    """
+    daemon_threads = True
+    ssl_context = None
+
+    def get_request(self):
+        sock, address = super().get_request()
+        with self.counter_lock:
+            self.connections += 1
+        if self.ssl_context is not None:
+            sock = self.ssl_context.wrap_socket(sock, server_side=True, do_handshake_on_connect=False)
+        return sock, address
+
+
+class FakeGoogleServer:
+    """
+    :param latency: Seconds each HTTP request (single or batch) waits before answering
+    :param error_rate: Fraction of API calls answered with error_status instead
+    :param error_status: Status used for injected errors (503 is retried by rate_limit.execute)
+    :param seed: Seed for the error injection, so runs are repeatable
+    :param tls: (cert_path, key_path) to serve HTTPS, e.g. from make_self_signed_cert
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, error_rate=0.0, error_status=503, seed=0,
+                 tls=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.requests = 0          # HTTP requests received, a batch counts once
+        self.calls = 0             # API calls served, each batch part counts
+        self.errors = 0            # API calls answered with an injected error
+        self.uploaded_bytes = 0    # Message bytes received through resumable uploads
+        self._uploads = {}         # resumable session id -> bytes received so far
+        self._random = random.Random(seed)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._httpd = _CountingServer((host, port), self._handler_class())
+        self._httpd.connections = 0
+        self._httpd.counter_lock = self._lock
+        if tls is not None:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(*tls)
+            self._httpd.ssl_context = context
+        self._thread = None
+
+    @property
+    def connections(self):
+        """Connections accepted so far; with TLS each one is a full handshake."""
+        return self._httpd.connections
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        scheme = 'https' if self._httpd.ssl_context is not None else 'http'
+        return f"{scheme}://{host}:{port}/"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # --- API behaviour -------------------------------------------------
+
+    def handle_call(self, method, path, body):
+        """
+        Answers one API call. Returns (status, json-serialisable body).
+        """
+        with self._lock:
+            self.calls += 1
+            n = next(self._ids)
+            inject = self.error_rate and self._random.random() < self.error_rate
+            if inject:
+                self.errors += 1
+
+        if inject:
+            return self.error_status, {'error': {'code': self.error_status, 'message': 'Injected error'}}
+
+        path = path.split('?', 1)[0]
+        if method == 'POST' and path.endswith('/messages/send'):
+            return 200, {'id': f'fake-msg-{n}', 'threadId': f'fake-thread-{n}', 'labelIds': ['SENT']}
+        if method == 'POST' and path.startswith('/calendar/v3/calendars/') and path.endswith('/events'):
+            try:
+                event = json.loads(body or '{}')
+            except ValueError:
+                return 400, {'error': {'code': 400, 'message': 'Invalid JSON'}}
+            return 200, {
+                **event,
+                'id': f'fakeevent{n}',
+                'status': 'confirmed',
+                'htmlLink': f'https://calendar.example.com/event?eid=fakeevent{n}',
+            }
+        return 404, {'error': {'code': 404, 'message': f'No fake for {method} {path}'}}
+
+    def start_upload(self):
+        """
+        Opens a resumable upload session and returns its path.
+        """
+        with self._lock:
+            session = next(self._ids)
+            self._uploads[session] = 0
+        return f'upload-session/{session}'
+
+    def handle_upload_chunk(self, path, content_range, length, read):
+        """
+        Consumes one PUT of a resumable upload. Returns (status, headers, json body or None):
+        308 with the received Range while incomplete, the API response once the last byte arrived.
+        """
+        session = int(path.rsplit('/', 1)[1])
+        received = 0
+        while received < length:
+            received += len(read(min(_READ_CHUNK_BYTES, length - received)))
+        # "bytes 0-262143/1000000", "bytes 0-262143/*" or "bytes */1000000" (status query)
+        spec, _, total = (content_range or 'bytes */*').split(' ', 1)[1].partition('/')
+        with self._lock:
+            if session not in self._uploads:
+                return 404, {}, {'error': {'code': 404, 'message': 'No such upload session'}}
+            self._uploads[session] += received
+            self.uploaded_bytes += received
+            progress = self._uploads[session]
+            done = total != '*' and progress >= int(total)
+            if done:
+                del self._uploads[session]
+        if not done:
+            headers = {'Range': f'bytes=0-{progress - 1}'} if progress else {}
+            return 308, headers, None
+        status, response = self.handle_call('POST', '/gmail/v1/users/me/messages/send', b'')
+        return status, {}, response
+
+    def handle_batch(self, content_type, body):
+        """
+        Splits a multipart/mixed batch into calls and answers them in one multipart response.
+        """
+        message = email.parser.BytesParser().parsebytes(
+            b'Content-Type: ' + content_type.encode() + b'\r\n\r\n' + body
+        )
+        boundary = 'fake_batch_boundary'
+        out = []
+        for part in message.get_payload():
+            request_line, _, rest = part.get_payload().partition('\n')
+            method, path, _ = request_line.split(' ', 2)
+            _, _, call_body = rest.replace('\r\n', '\n').partition('\n\n')
+            status, response = self.handle_call(method, path, call_body)
+            content_id = part['Content-ID']
+            out.append(
+                f'--{boundary}\r\n'
+                f'Content-Type: application/http\r\n'
+                f'Content-ID: <response-{content_id[1:-1]}>\r\n\r\n'
+                f'HTTP/1.1 {status} {"OK" if status < 400 else "Error"}\r\n'
+                f'Content-Type: application/json; charset=UTF-8\r\n\r\n'
+                f'{json.dumps(response)}\r\n'
+            )
+        out.append(f'--{boundary}--\r\n')
+        return f'multipart/mixed; boundary={boundary}', ''.join(out).encode()
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body go out in separate writes; with Nagle on, the body
+            # waits for the client's delayed ACK and every call gains ~40 ms
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status, content_type, payload, headers=None):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(payload)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _begin(self):
+                with server._lock:
+                    server.requests += 1
+                if server.latency:
+                    time.sleep(server.latency)
+
+            def do_PUT(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                self._begin()
+                status, headers, response = server.handle_upload_chunk(
+                    self.path.split('?', 1)[0], self.headers.get('Content-Range'), length, self.rfile.read)
+                payload = json.dumps(response).encode() if response is not None else b''
+                self._reply(status, 'application/json; charset=UTF-8', payload, headers)
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length)
+                self._begin()
+
+                if 'uploadType=resumable' in self.path:
+                    location = server.url + server.start_upload()
+                    self._reply(200, 'application/json; charset=UTF-8', b'', {'Location': location})
+                    return
+
+                if self.path.split('?', 1)[0].rstrip('/').endswith('batch') or '/batch/' in self.path:
+                    content_type, payload = server.handle_batch(self.headers['Content-Type'], body)
+                    self._reply(200, content_type, payload)
+                    return
+
+                status, response = server.handle_call('POST', self.path, body)
+                self._reply(status, 'application/json; charset=UTF-8', json.dumps(response).encode())
+
+        return Handler
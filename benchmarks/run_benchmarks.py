@@ -0,0 +1,213 @@
+"""
+Benchmark suite for the request path, against the local fake Google server.
+
+Cases:
+  format_email_body     template rendering only
+  plan_command          orchestrator parse step (splitting + date detection)
+  send_email            MIME build + googleapiclient + HTTP to the fake Gmail
+  post_send_summary     POST /send-summary through the ASGI app
+  post_process_command  POST /process-command (one reminder + one note) through the ASGI app
+
+Results are written as JSON so runs can be diffed between releases:
+
+    python benchmarks/run_benchmarks.py --output before.json
+    python benchmarks/run_benchmarks.py --output after.json --compare before.json
+
+Usage: python benchmarks/run_benchmarks.py [--iterations N] [--latency S] [--error-rate F]
+                                           [--only CASE ...] [--output FILE] [--compare FILE]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from unittest.mock import patch
+from google.oauth2.credentials import Credentials
+
+import google_services
+import idempotency
+import rate_limit
+from fake_google import FakeGoogleServer
+from gmail_client import get_gmail_service, send_email
+from main import app
+from orchestrator import plan_command
+from utils import format_email_body
+
+COMMANDS = [
+    "Remind me to take insulin at 7pm and tell the doctor I feel dizzy",
+    "I have had a mild headache since this morning",
+    "Schedule a blood test tomorrow at 9am and my blood pressure was 140/90",
+    "Remind me in 2 hours to check my sugar",
+]
+
+
+async def asgi_request(method, path, body=b'', headers=()):
+    """
+    Sends one request straight through the ASGI app. Returns (status, body bytes).
+    """
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    sent = []
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        await asyncio.sleep(3600)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method,
+        'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'',
+        'root_path': '', 'headers': [(b'content-type', b'application/json'), *headers],
+        'client': ('127.0.0.1', 1234), 'server': ('bench', 80),
+    }
+    await app(scope, receive, send)
+    status = next(m['status'] for m in sent if m['type'] == 'http.response.start')
+    return status, b''.join(m.get('body', b'') for m in sent if m['type'] == 'http.response.body')
+
+
+def _post_json(path, payload):
+    status, body = asyncio.run(asgi_request('POST', path, json.dumps(payload).encode()))
+    if status != 200:
+        raise RuntimeError(f"{path} returned {status}: {body[:200]!r}")
+
+
+def _cases():
+    """
+    name -> callable(i) running one iteration. Bodies vary with i so the
+    idempotency cache never short-circuits a request.
+    """
+    gmail = get_gmail_service()
+    return {
+        'format_email_body': lambda i: format_email_body(
+            f"Patient reported dizziness after breakfast ({i}). BP 120/80.", "John Doe", "12345"),
+        'plan_command': lambda i: plan_command(COMMANDS[i % len(COMMANDS)]),
+        'send_email': lambda i: send_email(
+            gmail, "doctor@example.com", f"Benchmark {i}", "Plain body", "<p>HTML body</p>"),
+        'post_send_summary': lambda i: _post_json('/send-summary', {
+            'doctor_email': 'doctor@example.com', 'summary': f"Benchmark note {i}"}),
+        'post_process_command': lambda i: _post_json('/process-command', {
+            'text': f"Remind me to take insulin at 7pm and note {i}: I feel dizzy",
+            'doctor_email': 'doctor@example.com'}),
+    }
+
+
+def _measure(func, iterations, warmup):
+    for i in range(warmup):
+        func(-1 - i)
+    samples = []
+    start = time.perf_counter()
+    for i in range(iterations):
+        t0 = time.perf_counter()
+        func(i)
+        samples.append(time.perf_counter() - t0)
+    total = time.perf_counter() - start
+    samples.sort()
+
+    def pct(p):
+        return samples[min(len(samples) - 1, int(len(samples) * p))] * 1000
+
+    return {
+        'iterations': iterations,
+        'total_seconds': round(total, 4),
+        'ops_per_second': round(iterations / total, 1),
+        'mean_ms': round(statistics.fmean(samples) * 1000, 4),
+        'p50_ms': round(pct(0.50), 4),
+        'p95_ms': round(pct(0.95), 4),
+        'p99_ms': round(pct(0.99), 4),
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(iterations=200, latency=0.0, error_rate=0.0, only=None, warmup=5):
+    results = {}
+    with FakeGoogleServer(latency=latency, error_rate=error_rate) as server, \
+         patch.dict(os.environ, {'GOOGLE_API_ROOT_URL': server.url}), \
+         patch('google_services.load_credentials', return_value=Credentials(token='bench-token')), \
+         patch.dict('rate_limit.QUOTAS', {'gmail': (1e9, 1e9), 'calendar': (1e9, 1e9)}), \
+         patch('rate_limit.BACKOFF_BASE_SECONDS', 0.01):
+        # Measure the request path, not quota smoothing or production-sized backoff
+        google_services.clear_cache()
+        rate_limit.reset()
+        idempotency.reset_idempotency_cache()
+
+        for name, func in _cases().items():
+            if only and name not in only:
+                continue
+            requests_before, errors_before = server.requests, server.errors
+            results[name] = _measure(func, iterations, warmup)
+            results[name]['fake_http_requests'] = server.requests - requests_before
+            results[name]['injected_errors'] = server.errors - errors_before
+
+    return {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'fake_latency_seconds': latency,
+            'fake_error_rate': error_rate,
+        },
+        'results': results,
+    }
+
+
+def compare(report, baseline):
+    """
+    Prints p50 and throughput changes against an earlier report.
+    """
+    print(f"\nvs {baseline['meta'].get('commit')} ({baseline['meta'].get('timestamp')})")
+    for name, result in report['results'].items():
+        old = baseline['results'].get(name)
+        if not old:
+            continue
+        p50 = (result['p50_ms'] / old['p50_ms'] - 1) * 100 if old['p50_ms'] else 0
+        ops = (result['ops_per_second'] / old['ops_per_second'] - 1) * 100 if old['ops_per_second'] else 0
+        print(f"{name:22s} p50 {p50:+7.1f}%   ops/s {ops:+7.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SpeakSpace request-path benchmarks")
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.0, help="Fake Google latency per HTTP request (s)")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of fake Google calls that fail with 503")
+    parser.add_argument('--only', nargs='*', help="Run only these cases")
+    parser.add_argument('--output', help="Write the JSON report here")
+    parser.add_argument('--compare', help="Earlier JSON report to diff against")
+    args = parser.parse_args()
+
+    report = run(args.iterations, args.latency, args.error_rate, args.only)
+
+    for name, result in report['results'].items():
+        print(f"{name:22s} {result['ops_per_second']:10.1f} ops/s  p50 {result['p50_ms']:8.3f} ms  "
+              f"p95 {result['p95_ms']:8.3f} ms  p99 {result['p99_ms']:8.3f} ms")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,43 +1,25 @@
-import os.path
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+import rate_limit
+from google_services import get_service, quota_user
+from tenants import get_tenant_service
 
-from auth_config import SCOPES
+# Shares the credentials (and token.json) with the Gmail client.
+# Ideally, one token file has multiple scopes; see auth_config.SCOPES.
 
-# Minimal wrapper reusing the same token logic but for Calendar scopes
-# This ensures we don't accidentally overwrite token.json with missing scopes
-# unless handled carefully.Ideally, one token file has multiple scopes.
-
-CREDENTIALS_FILE = 'credentials.json'
-TOKEN_FILE = 'token.json'
-
-def get_calendar_service():
-    creds = None
-    if os.path.exists(TOKEN_FILE):
-        # We try to load credentials. Verify scopes in a real app.
-        creds = Credentials.from_authorized_user_file(TOKEN_FILE, SCOPES)
-    
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            flow = InstalledAppFlow.from_client_secrets_file(CREDENTIALS_FILE, SCOPES)
-            creds = flow.run_local_server(port=0)
-        
-        with open(TOKEN_FILE, 'w') as token:
-            token.write(creds.to_json())
+def get_calendar_service(tenant_id=None):
+    """
+    Returns the shared Calendar API client, or the tenant's own (see tenants.py).
+    """
+    if tenant_id is not None:
+        return get_tenant_service(tenant_id, 'calendar', 'v3')
+    return get_service('calendar', 'v3')
 
-    return build('calendar', 'v3', credentials=creds)
+# The Calendar API accepts at most 50 calls per batch request
+MAX_BATCH_SIZE = 50
 
-def create_event(service, summary, start_time, duration_minutes=30, description=None):
+def build_event_body(summary, start_time, duration_minutes=30, description=None, recurrence=None):
     """
-    Creates a simple event in the primary calendar.
-    :param service: Calendar API service instance
-    :param summary: Title of the event
-    :param start_time: datetime object
-    :param duration_minutes: Duration in minutes
+    Builds the events.insert body for a timed event, optionally recurring.
+    :param recurrence: An 'RRULE:...' line, or a list of RRULE/EXDATE lines
     """
     from datetime import timedelta
     from tzlocal import get_localzone_name
@@ -47,7 +29,7 @@ def create_event(service, summary, start_time, duration_minutes=30, description=
     
     end_time = start_time + timedelta(minutes=duration_minutes)
     
-    event = {
+    body = {
         'summary': summary,
         'description': description,
         'start': {
@@ -59,9 +41,62 @@ def create_event(service, summary, start_time, duration_minutes=30, description=
             'timeZone': local_tz,
         },
     }
+    if recurrence:
+        # Recurring events expand in the timeZone above, so "8pm" stays 8pm across DST changes
+        body['recurrence'] = [recurrence] if isinstance(recurrence, str) else list(recurrence)
+    return body
+
+def create_event(service, summary, start_time, duration_minutes=30, description=None, recurrence=None):
+    """
+    Creates an event in the primary calendar.
+    :param service: Calendar API service instance
+    :param summary: Title of the event
+    :param start_time: datetime object (the first occurrence of a recurring event)
+    :param duration_minutes: Duration in minutes
+    :param recurrence: Optional 'RRULE:...' line (see recurrence.build_rrule) for one recurring event
+    """
+    event = build_event_body(summary, start_time, duration_minutes, description, recurrence)
 
-    event = service.events().insert(calendarId='primary', body=event).execute()
+    event = rate_limit.execute(service.events().insert(calendarId='primary', body=event), 'calendar.insert',
+                               user=quota_user(service))
     print(f"Event created: {event.get('htmlLink')}")
     return event
 
+def create_events_batch(service, events):
+    """
+    Creates many events with one batch HTTP request per MAX_BATCH_SIZE events.
+    Items the batch rejected are retried once with an individual insert, but only
+    when they certainly were not created (rate_limit.not_applied).
+    :param service: Calendar API service instance
+    :param events: List of dicts of create_event keyword arguments (summary, start_time, ...)
+    :return: List aligned with events; each item is the created event or the Exception it failed with
+    """
+    results = [None] * len(events)
+
+    def on_response(request_id, response, exception):
+        results[int(request_id)] = exception if exception is not None else response
+
+    for chunk_start in range(0, len(events), MAX_BATCH_SIZE):
+        chunk = range(chunk_start, min(chunk_start + MAX_BATCH_SIZE, len(events)))
+        batch = service.new_batch_http_request(callback=on_response)
+        for i in chunk:
+            body = build_event_body(**events[i])
+            batch.add(service.events().insert(calendarId='primary', body=body), request_id=str(i))
+        try:
+            rate_limit.execute(batch, 'calendar.insert', user=quota_user(service),
+                               units=rate_limit.CALL_UNITS['calendar.insert'] * len(chunk))
+        except Exception as e:
+            # The whole batch request failed; every item in it falls back below
+            for i in chunk:
+                results[i] = e
+
+    for i, result in enumerate(results):
+        if result is None or (isinstance(result, Exception) and rate_limit.not_applied(result)):
+            try:
+                results[i] = create_event(service, **events[i])
+            except Exception as e:
+                results[i] = e
+        elif not isinstance(result, Exception):
+            print(f"Event created: {result.get('htmlLink')}")
 
+    return results
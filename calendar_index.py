@@ -0,0 +1,366 @@
+import os
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+
+from dateutil.rrule import rrulestr
+from googleapiclient.errors import HttpError
+
+import google_services
+import rate_limit
+from date_intent import _CLOCK_RE, _DAY_RE, _RELATIVE_RE
+from recurrence import _LIMIT_RE, _REPEAT_RE
+
+# Local index of the primary calendar's timed events, for duplicate-reminder
+# suppression without a Calendar round trip per command.
+#
+# The first sync lists the whole calendar and keeps Google's sync token; later
+# syncs (a background thread, every SYNC_INTERVAL_SECONDS) fetch only what
+# changed since. A 410 Gone means the token expired and triggers a new full
+# sync. Events the app creates are added straight away, so a repeat of a
+# reminder is caught before the next sync. One-off events that ended more than
+# RETENTION_DAYS ago, and recurring ones with no occurrences left, are evicted;
+# beyond MAX_EVENTS the earliest events go first.
+#
+# The index is only started by the server (see main.lifespan); SPEAKSPACE_CALENDAR_DEDUP=0
+# turns duplicate suppression off.
+
+DEDUP_ENABLED = os.environ.get('SPEAKSPACE_CALENDAR_DEDUP', '1').lower() not in ('0', 'false', 'no')
+SYNC_INTERVAL_SECONDS = float(os.environ.get('SPEAKSPACE_CALENDAR_SYNC_SECONDS', 60))
+RETENTION_DAYS = float(os.environ.get('SPEAKSPACE_CALENDAR_RETENTION_DAYS', 2))
+MAX_EVENTS = int(os.environ.get('SPEAKSPACE_CALENDAR_INDEX_MAX_EVENTS', 10000))
+# Reminders with the same title this close together count as the same reminder
+DUPLICATE_WINDOW_MINUTES = float(os.environ.get('SPEAKSPACE_DUPLICATE_WINDOW_MINUTES', 10))
+
+# Largest page events.list allows
+PAGE_SIZE = 2500
+# Only what the index needs, instead of full event resources
+LIST_FIELDS = 'items(id,status,summary,start,end,recurrence,htmlLink),nextPageToken,nextSyncToken'
+
+_FILLER_RE = re.compile(r'\b(?:please|remind me to|remind me|reminder to|reminder|at|on|to|the|my)\b')
+_NON_WORD_RE = re.compile(r'[^a-z0-9]+')
+
+
+def normalise_title(text):
+    """
+    Title key for matching reminders: lowercase words without the date, time,
+    recurrence and filler phrases ("Take insulin at 7pm!" -> "take insulin").
+    """
+    text = text or ''
+    for pattern in (_REPEAT_RE, _LIMIT_RE, _RELATIVE_RE, _CLOCK_RE, _DAY_RE):
+        text = pattern.sub(' ', text)
+    text = _FILLER_RE.sub(' ', text.lower())
+    return ' '.join(_NON_WORD_RE.sub(' ', text).split())
+
+
+def _local_time(value):
+    """
+    Event dateTime (RFC 3339, with offset) as a naive local datetime, like the app's reminder times.
+    """
+    dt = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return dt.astimezone().replace(tzinfo=None) if dt.tzinfo else dt
+
+
+class _Entry:
+    def __init__(self, event_id, title_key, start, end, recurrence, link):
+        self.event_id = event_id
+        self.title_key = title_key
+        self.start = start
+        self.end = end
+        self.recurrence = recurrence   # tuple of RRULE lines, or None
+        self.link = link
+
+    def _rule(self):
+        # ignoretz: Google writes UNTIL in UTC, the index keeps naive local times;
+        # close enough for matching reminders
+        try:
+            return rrulestr('\n'.join(self.recurrence), dtstart=self.start, ignoretz=True)
+        except (ValueError, TypeError):
+            return None
+
+    def matches(self, start_time, recurrence, window):
+        if self.recurrence != recurrence and recurrence is not None:
+            # A new series never duplicates a one-off event or a different series
+            return False
+        if self.recurrence is None:
+            return abs(self.start - start_time) <= window
+        # A one-off reminder (or the same series) landing on an occurrence of this series
+        rule = self._rule()
+        occurrence = rule.after(start_time - window, inc=True) if rule is not None else None
+        return occurrence is not None and occurrence <= start_time + window
+
+    def expired(self, cutoff):
+        if self.recurrence is None:
+            return self.end < cutoff
+        rule = self._rule()
+        return rule is not None and rule.after(cutoff) is None
+
+
+def _entry(event):
+    """
+    Index entry for an events resource, or None for events the index does not track
+    (cancelled, all-day).
+    """
+    if event.get('status') == 'cancelled':
+        return None
+    start = (event.get('start') or {}).get('dateTime')
+    end = (event.get('end') or {}).get('dateTime')
+    if not start or not end:
+        return None
+    # EXDATE/RDATE lines are ignored: a deleted occurrence still counts as a duplicate
+    recurrence = tuple(line for line in event.get('recurrence') or () if line.startswith('RRULE'))
+    return _Entry(event['id'], normalise_title(event.get('summary')), _local_time(start), _local_time(end),
+                  recurrence or None, event.get('htmlLink'))
+
+
+class CalendarIndex:
+    """
+    :param service_factory: Callable returning a Calendar API client, or None while not authorised
+    :param calendar_id: Calendar to mirror
+    :param retention_days: How long one-off events stay indexed after they end
+    :param max_events: Index size cap
+    """
+
+    def __init__(self, service_factory, calendar_id='primary', retention_days=RETENTION_DAYS,
+                 max_events=MAX_EVENTS, window_minutes=DUPLICATE_WINDOW_MINUTES):
+        self._service_factory = service_factory
+        self.calendar_id = calendar_id
+        self.retention = timedelta(days=retention_days)
+        self.max_events = max_events
+        self.window = timedelta(minutes=window_minutes)
+        self.sync_token = None
+        self.last_sync = None
+        self.full_syncs = 0
+        self.incremental_syncs = 0
+        self.evicted = 0
+        self.duplicates_found = 0
+        self._events = {}      # event id -> _Entry
+        self._by_title = {}    # title key -> set of event ids
+        self._lock = threading.Lock()        # guards the maps
+        self._sync_lock = threading.Lock()   # one sync at a time
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def ready(self):
+        """True once a full sync completed; before that nothing is reported as a duplicate."""
+        return self.sync_token is not None
+
+    # --- index maintenance ----------------------------------------------
+
+    def _put(self, events, by_title, entry):
+        self._drop(events, by_title, entry.event_id)
+        events[entry.event_id] = entry
+        by_title.setdefault(entry.title_key, set()).add(entry.event_id)
+
+    @staticmethod
+    def _drop(events, by_title, event_id):
+        old = events.pop(event_id, None)
+        if old is not None:
+            ids = by_title.get(old.title_key)
+            ids.discard(event_id)
+            if not ids:
+                del by_title[old.title_key]
+
+    def _apply(self, events, by_title, event, cutoff):
+        entry = _entry(event)
+        if entry is None or entry.expired(cutoff):
+            self._drop(events, by_title, event['id'])
+        else:
+            self._put(events, by_title, entry)
+
+    def add(self, event):
+        """
+        Records an event the app just created (an events.insert response).
+        """
+        with self._lock:
+            self._apply(self._events, self._by_title, event, datetime.now() - self.retention)
+
+    def _evict(self, now):
+        cutoff = now - self.retention
+        with self._lock:
+            expired = {event_id for event_id, entry in self._events.items() if entry.expired(cutoff)}
+            overflow = len(self._events) - len(expired) - self.max_events
+            if overflow > 0:
+                remaining = sorted((entry.start, event_id) for event_id, entry in self._events.items()
+                                   if event_id not in expired)
+                expired.update(event_id for _, event_id in remaining[:overflow])
+            for event_id in expired:
+                self._drop(self._events, self._by_title, event_id)
+            self.evicted += len(expired)
+
+    # --- sync ----------------------------------------------------------
+
+    def _pages(self, service, **params):
+        """
+        Yields the pages of one events.list run; the last one carries nextSyncToken.
+        """
+        page_token = None
+        while True:
+            request = service.events().list(calendarId=self.calendar_id, maxResults=PAGE_SIZE,
+                                            pageToken=page_token, fields=LIST_FIELDS, **params)
+            page = rate_limit.execute(request, 'calendar.list')
+            yield page
+            page_token = page.get('nextPageToken')
+            if not page_token:
+                return
+
+    def _full_sync(self, service, now):
+        # Built aside and swapped in, so lookups keep working during a long first sync.
+        # No timeMin: Google does not allow it with sync tokens; old events are evicted locally.
+        events, by_title = {}, {}
+        cutoff = now - self.retention
+        for page in self._pages(service):
+            for event in page.get('items', []):
+                self._apply(events, by_title, event, cutoff)
+        with self._lock:
+            self._events, self._by_title = events, by_title
+        self.full_syncs += 1
+        return page.get('nextSyncToken')
+
+    def _incremental_sync(self, service, now):
+        cutoff = now - self.retention
+        for page in self._pages(service, syncToken=self.sync_token):
+            with self._lock:
+                for event in page.get('items', []):
+                    self._apply(self._events, self._by_title, event, cutoff)
+        self.incremental_syncs += 1
+        return page.get('nextSyncToken')
+
+    def sync(self):
+        """
+        Brings the index up to date: a full sync the first time (or after the
+        sync token expired), otherwise only the changes since the last sync.
+        :return: False if there is no authorised Calendar client yet
+        """
+        service = self._service_factory()
+        if service is None:
+            return False
+        with self._sync_lock:
+            now = datetime.now()
+            if self.sync_token is None:
+                self.sync_token = self._full_sync(service, now)
+            else:
+                try:
+                    self.sync_token = self._incremental_sync(service, now)
+                except HttpError as e:
+                    if e.resp.status != 410:
+                        raise
+                    # Sync token expired or invalidated: start over
+                    print("Calendar sync token expired; running a full sync")
+                    self.sync_token = None
+                    self.sync_token = self._full_sync(service, now)
+            self._evict(now)
+            self.last_sync = time.time()
+        return True
+
+    def _run(self):
+        while True:
+            try:
+                self.sync()
+            except Exception as e:
+                print(f"Calendar index sync failed: {e}")
+            if self._stop.wait(SYNC_INTERVAL_SECONDS):
+                return
+
+    def start(self):
+        """
+        Syncs in a background thread now and every SYNC_INTERVAL_SECONDS.
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='speakspace-calendar-sync', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    # --- queries -------------------------------------------------------
+
+    def find(self, title, start=None, end=None):
+        """
+        Indexed events whose normalised title matches `title` and that start within [start, end].
+        """
+        with self._lock:
+            entries = [self._events[event_id] for event_id in self._by_title.get(normalise_title(title), ())]
+        return [entry for entry in entries
+                if (start is None or entry.start >= start) and (end is None or entry.start <= end)]
+
+    def find_duplicate(self, summary, start_time, recurrence=None):
+        """
+        An existing event for the same reminder, or None.
+        :param recurrence: The new event's 'RRULE:...' line, if it repeats
+        :return: {'id', 'htmlLink'} of the existing event
+        """
+        if not self.ready:
+            return None
+        recurrence = (recurrence,) if isinstance(recurrence, str) else recurrence
+        with self._lock:
+            entries = [self._events[event_id] for event_id in self._by_title.get(normalise_title(summary), ())]
+        for entry in entries:
+            if entry.matches(start_time, recurrence, self.window):
+                self.duplicates_found += 1
+                return {'id': entry.event_id, 'htmlLink': entry.link}
+        return None
+
+    def state(self):
+        with self._lock:
+            size = len(self._events)
+        return {
+            'ready': self.ready,
+            'events': size,
+            'last_sync': self.last_sync,
+            'full_syncs': self.full_syncs,
+            'incremental_syncs': self.incremental_syncs,
+            'evicted': self.evicted,
+            'duplicates_found': self.duplicates_found,
+        }
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def _authorised_calendar_service():
+    """
+    The Calendar client if stored credentials exist; never starts the login flow.
+    """
+    if google_services.get_credentials(interactive=False) is None:
+        return None
+    return google_services.get_service('calendar', 'v3')
+
+
+def start_calendar_index(service_factory=_authorised_calendar_service):
+    """
+    Creates, syncs (in the background) and returns the process-wide index.
+    """
+    global _index
+    if not DEDUP_ENABLED:
+        return None
+    with _index_lock:
+        if _index is None:
+            _index = CalendarIndex(service_factory).start()
+        return _index
+
+
+def get_calendar_index():
+    """
+    The running index, or None when it was not started (CLI, tests) or dedup is off.
+    """
+    return _index
+
+
+def stop_calendar_index():
+    global _index
+    with _index_lock:
+        index, _index = _index, None
+    if index is not None:
+        index.stop()
+
+
+def calendar_index_state():
+    index = _index
+    if index is None:
+        return {'enabled': DEDUP_ENABLED, 'running': False}
+    return {'enabled': DEDUP_ENABLED, 'running': True, **index.state()}
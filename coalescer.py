@@ -0,0 +1,187 @@
+import os
+import atexit
+import threading
+from concurrent.futures import Future
+
+import metrics
+
+# Coalescing of doctor summaries.
+#
+# Patients often dictate several short notes within a few minutes. Instead of
+# one email per note, summaries for the same (doctor, patient) are held for a
+# short window, or until a size cap, and go out together as one message.
+# Pending summaries are flushed on shutdown so nothing dictated is dropped.
+# A batch whose send fails is handed to an on_failure callback (the
+# orchestrator moves it to the durable job queue) and counted in metrics.
+
+# 0 disables coalescing: every summary is sent straight away
+COALESCE_WINDOW_SECONDS = float(os.environ.get('SPEAKSPACE_COALESCE_WINDOW', 0))
+COALESCE_MAX_ITEMS = int(os.environ.get('SPEAKSPACE_COALESCE_MAX_ITEMS', 10))
+
+
+class _Batch:
+    def __init__(self):
+        self.summaries = []
+        self.futures = []
+        self.timer = None
+
+
+class SummaryCoalescer:
+    """
+    :param send: Callable(doctor_email, patient, summaries) sending one email for the list
+    :param window_seconds: How long the first summary of a batch waits for others
+    :param max_items: Batch size that triggers an immediate send
+    :param on_failure: Optional Callable(doctor_email, patient, summaries, error) called when
+                       a send fails; returns what became of the batch ('requeued', ...)
+    """
+
+    def __init__(self, send, window_seconds=COALESCE_WINDOW_SECONDS, max_items=COALESCE_MAX_ITEMS,
+                 on_failure=None):
+        self._send = send
+        self._on_failure = on_failure
+        self.window_seconds = window_seconds
+        self.max_items = max_items
+        self.summaries_received = 0
+        self.summaries_sent = 0
+        self.emails_sent = 0
+        self.failed_sends = 0
+        self.summaries_failed = 0
+        self._batches = {}   # (doctor_email, patient) -> _Batch
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def add(self, doctor_email, patient, summary):
+        """
+        Queues a summary. Returns a Future resolved with the send result of
+        the email it ends up in (or its exception).
+        """
+        key = (doctor_email, patient)
+        future = Future()
+        with self._lock:
+            self.summaries_received += 1
+            batch = self._batches.get(key)
+            if batch is None:
+                batch = self._batches[key] = _Batch()
+                if not self._closed:
+                    batch.timer = threading.Timer(self.window_seconds, self.flush, args=(key,))
+                    batch.timer.daemon = True
+                    batch.timer.start()
+            batch.summaries.append(summary)
+            batch.futures.append(future)
+            full = self._closed or len(batch.summaries) >= self.max_items
+        if full:
+            self.flush(key)
+        return future
+
+    def flush(self, key):
+        """
+        Sends the pending batch for (doctor_email, patient), if any.
+        """
+        with self._lock:
+            batch = self._batches.pop(key, None)
+            if batch is None:
+                return
+        if batch.timer is not None:
+            batch.timer.cancel()
+
+        doctor_email, patient = key
+        try:
+            result = self._send(doctor_email, patient, batch.summaries)
+        except Exception as e:
+            outcome = self._handle_failure(doctor_email, patient, batch.summaries, e)
+            print(f"Failed to send {len(batch.summaries)} coalesced summaries to {doctor_email} ({outcome}): {e}")
+            for future in batch.futures:
+                future.set_exception(e)
+            return
+        with self._lock:
+            self.emails_sent += 1
+            self.summaries_sent += len(batch.summaries)
+        if len(batch.summaries) > 1:
+            print(f"Sent {len(batch.summaries)} coalesced summaries to {doctor_email} in one email")
+        for future in batch.futures:
+            future.set_result(result)
+
+    def _handle_failure(self, doctor_email, patient, summaries, error):
+        with self._lock:
+            self.failed_sends += 1
+            self.summaries_failed += len(summaries)
+        outcome = 'dropped'
+        if self._on_failure is not None:
+            try:
+                outcome = self._on_failure(doctor_email, patient, summaries, error)
+            except Exception as e:
+                print(f"Could not hand over {len(summaries)} failed summaries for {doctor_email}: {e}")
+        metrics.inc(metrics.COALESCED_SEND_FAILURES, outcome=outcome)
+        return outcome
+
+    def flush_all(self):
+        with self._lock:
+            keys = list(self._batches)
+        for key in keys:
+            self.flush(key)
+
+    def close(self):
+        """
+        Flushes everything pending; later summaries are sent without waiting.
+        """
+        with self._lock:
+            self._closed = True
+        self.flush_all()
+
+    def stats(self):
+        with self._lock:
+            pending = sum(len(batch.summaries) for batch in self._batches.values())
+            stats = {
+                'summaries_received': self.summaries_received,
+                'emails_sent': self.emails_sent,
+                'sends_saved': self.summaries_sent - self.emails_sent,
+                'failed_sends': self.failed_sends,
+                'summaries_failed': self.summaries_failed,
+            }
+        return {
+            **stats,
+            'pending_summaries': pending,
+            'window_seconds': self.window_seconds,
+            'max_items': self.max_items,
+        }
+
+
+_coalescer = None
+_coalescer_lock = threading.Lock()
+
+
+def coalescing_enabled():
+    return COALESCE_WINDOW_SECONDS > 0
+
+
+def get_summary_coalescer(send, on_failure=None):
+    """
+    Process-wide coalescer, created on first use with the given send and failure functions.
+    """
+    global _coalescer
+    with _coalescer_lock:
+        if _coalescer is None:
+            # Read the settings now rather than the constructor's import-time defaults
+            _coalescer = SummaryCoalescer(send, COALESCE_WINDOW_SECONDS, COALESCE_MAX_ITEMS, on_failure)
+            atexit.register(_coalescer.close)
+        return _coalescer
+
+
+def close_summary_coalescer():
+    """
+    Flushes pending summaries (app shutdown) and forgets the coalescer.
+    """
+    global _coalescer
+    with _coalescer_lock:
+        coalescer, _coalescer = _coalescer, None
+    if coalescer is not None:
+        atexit.unregister(coalescer.close)
+        coalescer.close()
+
+
+def coalescer_state():
+    with _coalescer_lock:
+        coalescer = _coalescer
+    if coalescer is None:
+        return {'enabled': coalescing_enabled()}
+    return {'enabled': coalescing_enabled(), **coalescer.stats()}
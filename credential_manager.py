@@ -0,0 +1,222 @@
+import os
+import json
+import random
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+from google.auth.transport.requests import Request
+
+try:
+    import fcntl
+except ImportError:  # Windows: token writes stay atomic but are not locked across processes
+    fcntl = None
+
+# OAuth token lifecycle shared by every Google client in the process.
+#
+# A background thread refreshes the access token REFRESH_MARGIN_SECONDS before
+# it expires, so requests never wait on Google's token endpoint. Refreshes are
+# single-flight: concurrent callers (and other processes, via a lock file next
+# to token.json) wait for the one refresh in progress and reuse its result
+# instead of each asking for a new token. token.json is replaced atomically.
+
+REFRESH_MARGIN_SECONDS = float(os.environ.get('SPEAKSPACE_TOKEN_REFRESH_MARGIN', 300))
+# Wait before retrying a failed background refresh
+REFRESH_RETRY_SECONDS = 30
+
+
+@contextmanager
+def token_file_lock(token_path):
+    """
+    Exclusive lock on `<token_path>.lock`, shared by all processes using the file.
+    """
+    if fcntl is None:
+        yield
+        return
+    with open(token_path + '.lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def write_token_file(token_path, creds):
+    """
+    Writes creds to token_path atomically: readers see the old or the new file, never half of one.
+    Callers that may race other writers should hold token_file_lock.
+    """
+    directory = os.path.dirname(os.path.abspath(token_path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.token-', suffix='.json', dir=directory)
+    try:
+        with os.fdopen(fd, 'w') as tmp:
+            tmp.write(creds.to_json())
+            tmp.flush()
+            os.fsync(tmp.fileno())
+        os.chmod(tmp_path, 0o600)
+        os.replace(tmp_path, token_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _utcnow():
+    # google-auth keeps expiry as naive UTC
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _expiry(creds):
+    expiry = getattr(creds, 'expiry', None)
+    return expiry if isinstance(expiry, datetime) else None
+
+
+def _needs_refresh(creds, margin):
+    expiry = _expiry(creds)
+    if expiry is None:
+        return not creds.valid
+    return expiry - timedelta(seconds=margin) <= _utcnow()
+
+
+def _adopt_newer_token(creds, token_path, margin, rejected_token=None):
+    """
+    Copies the access token from token_path if another process refreshed it
+    recently enough. Returns True when no refresh is needed any more.
+    :param rejected_token: A token the API just refused; never adopted
+    """
+    try:
+        with open(token_path) as f:
+            info = json.load(f)
+    except (OSError, ValueError):
+        return False
+    if info.get('refresh_token') != creds.refresh_token or not info.get('token') or not info.get('expiry'):
+        return False
+    # Our own token (or one the API refused) is no improvement
+    if info['token'] in (creds.token, rejected_token):
+        return False
+    try:
+        expiry = datetime.strptime(info['expiry'].rstrip('Z').split('.')[0], '%Y-%m-%dT%H:%M:%S')
+    except ValueError:
+        return False
+    if expiry - timedelta(seconds=margin) <= _utcnow():
+        return False
+    creds.token = info['token']
+    creds.expiry = expiry
+    return True
+
+
+class CredentialManager:
+    """
+    :param creds: google.oauth2 Credentials shared by all clients (refreshed in place)
+    :param token_path: File to persist refreshed tokens to, or None (e.g. tokens from the environment)
+    :param on_persist: Called after token_path was rewritten by this process
+    """
+
+    def __init__(self, creds, token_path=None, on_persist=None, margin=REFRESH_MARGIN_SECONDS):
+        self.creds = creds
+        self.token_path = token_path
+        self.on_persist = on_persist
+        self.margin = margin
+        self.refreshes = 0
+        self.refresh_failures = 0
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def refreshable(self):
+        return bool(getattr(self.creds, 'refresh_token', None)) and _expiry(self.creds) is not None
+
+    def refresh(self, force=False):
+        """
+        Refreshes the token unless it is still fresh. Concurrent callers share
+        one refresh: whoever gets the lock second finds a fresh token and returns.
+        """
+        with self._refresh_lock:
+            if not force and not _needs_refresh(self.creds, self.margin):
+                return self.creds
+            persisted = self._refresh_and_save(rejected_token=self.creds.token if force else None)
+        if persisted and self.on_persist is not None:
+            self.on_persist()
+        return self.creds
+
+    def refresh_if_token(self, token):
+        """
+        Refreshes after the API rejected `token` (a 401), unless another
+        thread already replaced it while this one waited.
+        """
+        with self._refresh_lock:
+            if self.creds.token != token:
+                return self.creds
+            persisted = self._refresh_and_save(rejected_token=token)
+        if persisted and self.on_persist is not None:
+            self.on_persist()
+        return self.creds
+
+    def _refresh_and_save(self, rejected_token=None):
+        """
+        Refreshes under the token file lock. Returns True if token_path was rewritten.
+        """
+        if self.token_path is None:
+            self._refresh()
+            return False
+        with token_file_lock(self.token_path):
+            if _adopt_newer_token(self.creds, self.token_path, self.margin, rejected_token):
+                return False
+            self._refresh()
+            write_token_file(self.token_path, self.creds)
+        return True
+
+    def _refresh(self):
+        try:
+            self.creds.refresh(Request())
+        except Exception:
+            self.refresh_failures += 1
+            raise
+        self.refreshes += 1
+
+    def ensure_valid(self):
+        """
+        Request-path check. Normally a no-op because the background thread keeps
+        the token fresh; refreshes inline only if the token already expired.
+        """
+        if not self.creds.valid:
+            self.refresh()
+        return self.creds
+
+    def _seconds_until_refresh(self):
+        expiry = _expiry(self.creds)
+        remaining = (expiry - _utcnow()).total_seconds() - self.margin
+        # A little jitter keeps workers that loaded the same token from refreshing in lockstep
+        return max(0.0, remaining) + random.uniform(0, min(30.0, self.margin / 10))
+
+    def _run(self):
+        while not self._stop.wait(self._seconds_until_refresh()):
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Background token refresh failed: {e}")
+                if self._stop.wait(REFRESH_RETRY_SECONDS):
+                    return
+
+    def start(self):
+        """
+        Starts background refreshes (only for credentials that expire and can be refreshed).
+        """
+        if self._thread is None and self.refreshable:
+            self._thread = threading.Thread(target=self._run, name='speakspace-token-refresh', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def state(self):
+        expiry = _expiry(self.creds)
+        return {
+            'valid': bool(self.creds.valid),
+            'expiry': expiry.isoformat() + 'Z' if expiry else None,
+            'background_refresh': self._thread is not None and self._thread.is_alive(),
+            'refreshes': self.refreshes,
+            'refresh_failures': self.refresh_failures,
+        }
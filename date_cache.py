@@ -0,0 +1,177 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+
+import metrics
+
+# Memoised relative-date resolution for the dateparser fallback.
+#
+# "blood test on the 5th of next month" means a different datetime depending
+# on when it is said, so a parse cannot be cached as a datetime. A cached entry
+# is a rule relative to the reference time instead:
+#   ('now', delta)     reference + delta       ("20 minutes from now", "next week")
+#   ('bucket', delta)  bucket start + delta    (one datetime for the whole bucket)
+#   ('none',)          no date in the fragment
+# keyed by (normalised fragment, reference bucket). Buckets are BUCKET_MINUTES
+# of naive local wall-clock time (the clock the parser itself works in) and
+# never cross midnight, so a new day or a DST change starts a new bucket.
+#
+# A rule is only stored after it was checked: the second time a fragment is
+# seen in a bucket it is parsed at the bucket's first and last second, and the
+# rule derived from those must also reproduce the first sighting. A fragment
+# whose result flips inside the bucket (a time of day that passes during it)
+# is marked uncacheable for that bucket and parsed every time. A fragment seen
+# only once costs one parse, as without the cache.
+
+DATE_CACHE_SIZE = int(os.environ.get('SPEAKSPACE_DATE_CACHE_SIZE', 4096))
+BUCKET_MINUTES = int(os.environ.get('SPEAKSPACE_DATE_CACHE_BUCKET_MINUTES', 60))
+
+_SPACE_RE = re.compile(r'\s+')
+_EDGE_CHARS = ' .,!?;:'
+
+_UNCACHEABLE = 'uncacheable'
+
+
+class _Sighting:
+    """
+    First parse of a fragment in a bucket, kept to check the rule against.
+    """
+    __slots__ = ('now', 'result')
+
+    def __init__(self, now, result):
+        self.now = now
+        self.result = result
+
+
+def normalise(fragment):
+    """
+    Cache key text: case, runs of whitespace and edge punctuation do not change a parse.
+    """
+    return _SPACE_RE.sub(' ', fragment.lower()).strip(_EDGE_CHARS)
+
+
+def _derive_rule(first, first_result, last, last_result):
+    """
+    The rule reproducing both probes of a bucket, or None if there is none.
+    """
+    if first_result is None and last_result is None:
+        return ('none',)
+    if first_result is None or last_result is None:
+        return None
+    if first_result == last_result:
+        return ('bucket', first_result - first)
+    if last_result - first_result == last - first:
+        return ('now', first_result - first)
+    return None
+
+
+def _apply(rule, now, bucket_start):
+    kind = rule[0]
+    if kind == 'now':
+        return now + rule[1]
+    if kind == 'bucket':
+        return bucket_start + rule[1]
+    return None
+
+
+class RelativeDateCache:
+    """
+    :param parse: Callable(fragment, now) -> datetime or None, the parser being memoised
+    :param max_entries: Entries kept (least recently used go first); 0 disables the cache
+    :param bucket_minutes: Width of a reference-time bucket
+    """
+
+    def __init__(self, parse, max_entries=DATE_CACHE_SIZE, bucket_minutes=BUCKET_MINUTES):
+        self._parse = parse
+        self.max_entries = max_entries
+        self.bucket = timedelta(minutes=bucket_minutes)
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+        self.uncacheable = 0
+        self.evictions = 0
+        self._entries = OrderedDict()   # (normalised fragment, bucket start) -> rule, _Sighting or _UNCACHEABLE
+        self._lock = threading.Lock()
+
+    def bucket_bounds(self, now):
+        """
+        (start, end) of the bucket holding `now`; end is exclusive and at most the next midnight.
+        """
+        midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        start = midnight + ((now - midnight) // self.bucket) * self.bucket
+        return start, min(start + self.bucket, midnight + timedelta(days=1))
+
+    def resolve(self, fragment, now):
+        """
+        Same result as parse(fragment, now), from the cache when possible.
+        """
+        if self.max_entries <= 0:
+            return self._parse(fragment, now)
+        start, end = self.bucket_bounds(now)
+        key = (normalise(fragment), start)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            if isinstance(entry, tuple):
+                self.hits += 1
+            elif entry is _UNCACHEABLE:
+                self.uncacheable += 1
+            else:
+                self.misses += 1
+        if isinstance(entry, tuple):
+            metrics.inc(metrics.DATE_CACHE, result='hit')
+            return _apply(entry, now, start)
+        if entry is _UNCACHEABLE:
+            metrics.inc(metrics.DATE_CACHE, result='uncacheable')
+            return self._parse(fragment, now)
+
+        metrics.inc(metrics.DATE_CACHE, result='miss')
+        if entry is None:
+            result = self._parse(fragment, now)
+            self._store(key, _Sighting(now, result))
+            return result
+
+        # Seen before in this bucket: worth finding the rule
+        last = end - timedelta(seconds=1)
+        rule = _derive_rule(start, self._parse(fragment, start), last, self._parse(fragment, last))
+        if rule is None or _apply(rule, entry.now, start) != entry.result:
+            self._store(key, _UNCACHEABLE)
+            return self._parse(fragment, now)
+        self._store(key, rule)
+        return _apply(rule, now, start)
+
+    def _store(self, key, value):
+        evicted = 0
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            if isinstance(value, tuple):
+                self.stored += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                evicted += 1
+            self.evictions += evicted
+        if evicted:
+            metrics.inc(metrics.DATE_CACHE, evicted, result='eviction')
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def state(self):
+        with self._lock:
+            lookups = self.hits + self.misses + self.uncacheable
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'bucket_minutes': self.bucket.total_seconds() / 60,
+                'hits': self.hits,
+                'misses': self.misses,
+                'rules_stored': self.stored,
+                'uncacheable': self.uncacheable,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
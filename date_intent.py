@@ -0,0 +1,217 @@
+import os
+import re
+from datetime import datetime, timedelta
+from dateparser.search import search_dates
+
+from date_cache import RelativeDateCache
+
+# Layered date detection for command fragments.
+#
+# 1. Precompiled patterns resolve the common reminder phrasings
+#    ("at 7pm", "tomorrow 8am", "on monday", "in 2 hours") without dateparser.
+#    Fragments naming an explicit or past date ("march 3", "the 20th", "12/11",
+#    "yesterday") skip them.
+# 2. Fragments with no digits and no date words are rejected outright.
+# 3. Everything else falls back to dateparser, restricted to known languages
+#    so it skips detection across every locale it supports. Its results are
+#    memoised as rules relative to the reference time (see date_cache.py).
+#
+# SPEAKSPACE_DATE_PARSER=legacy restores the original behaviour
+# (plain search_dates with language detection) for every fragment.
+
+MODE_FAST = 'fast'
+MODE_LEGACY = 'legacy'
+
+PARSER_MODE = os.environ.get('SPEAKSPACE_DATE_PARSER', MODE_FAST)
+LANGUAGES = [l.strip() for l in os.environ.get('SPEAKSPACE_DATE_LANGUAGES', 'en').split(',') if l.strip()]
+
+DATEPARSER_SETTINGS = {'PREFER_DATES_FROM': 'future'}
+
+WEEKDAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+
+_NUMBER_WORDS = {
+    'a': 1, 'an': 1, 'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5,
+    'six': 6, 'seven': 7, 'eight': 8, 'nine': 9, 'ten': 10, 'twelve': 12,
+}
+
+_UNIT_SECONDS = {'minute': 60, 'min': 60, 'hour': 3600, 'hr': 3600, 'day': 86400, 'week': 604800}
+
+_RELATIVE_RE = re.compile(
+    r'\bin\s+(?P<n>\d+|' + '|'.join(_NUMBER_WORDS) + r')\s+'
+    r'(?P<unit>minute|min|hour|hr|day|week)s?\b',
+    re.IGNORECASE
+)
+_CLOCK_RE = re.compile(
+    r'\b(?:at\s+)?(?P<hour>\d{1,2})(?::(?P<minute>[0-5]\d))?\s*(?P<ampm>a\.?m\.?|p\.?m\.?)(?=\W|$)'
+    r'|\bat\s+(?P<hour24>[01]?\d|2[0-3]):(?P<minute24>[0-5]\d)\b'
+    r'|\b(?:at\s+)?(?P<named>noon|midnight)\b',
+    re.IGNORECASE
+)
+_MONTHS = ('january', 'february', 'march', 'april', 'june', 'july', 'august', 'september', 'october',
+           'november', 'december', 'jan', 'feb', 'mar', 'apr', 'jun', 'jul', 'aug', 'sep', 'sept', 'oct',
+           'nov', 'dec')
+# Dates the fast path cannot resolve; a fragment naming one goes to the full parser
+_EXPLICIT_DATE_RE = re.compile(
+    r'\b\d{1,2}(?:st|nd|rd|th)\b'                                  # "on the 20th"
+    r'|\b(?:\d{1,2}[/.-]\d{1,2}(?:[/.-]\d{2,4})?|\d{4}-\d{1,2}-\d{1,2})\b'  # "12/11", "2026-11-12"
+    r'|\b(?:' + '|'.join(_MONTHS) + r')\b'                           # "march 3", "in november"
+    r'|\bmay\s+\d|\b\d{1,2}\s+(?:of\s+)?may\b'                      # "may 3", "3 may" but not "i may"
+    r'|\b(?:week|month|year|weekend|fortnight)s?\b',                 # "next week at 5pm"
+    re.IGNORECASE
+)
+_DAY_RE = re.compile(
+    r'\b(?P<day>today|tonight|tomorrow)\b'
+    r'|\b(?:(?:on|(?P<next>next)|this)\s+)?(?P<weekday>' + '|'.join(WEEKDAYS) + r')\b',
+    re.IGNORECASE
+)
+# Past references ("yesterday at 5pm", "last monday", "2 days ago") are left to the full parser
+_PAST_RE = re.compile(r'\b(?:yesterday|last|ago)\b', re.IGNORECASE)
+
+# Words (besides digits) that can make dateparser find a date in English text.
+DATE_WORDS = (
+    'jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'sept', 'oct', 'nov', 'dec',
+    'january', 'february', 'march', 'april', 'june', 'july', 'august', 'september', 'october',
+    'november', 'december',
+    'mon', 'tue', 'tues', 'wed', 'thu', 'thur', 'thurs', 'fri', 'sat', 'sun', *WEEKDAYS,
+    'today', 'tonight', 'tomorrow', 'yesterday', 'now', 'noon', 'midnight', 'morning', 'afternoon',
+    'evening', 'night', 'weekend', 'fortnight', 'ago', 'next', 'last', 'this',
+    'sec', 'secs', 'second', 'seconds', 'min', 'mins', 'minute', 'minutes', 'hour', 'hours', 'hr', 'hrs',
+    'day', 'days', 'week', 'weeks', 'month', 'months', 'year', 'years',
+)
+_DATE_WORD_RE = re.compile(r'\b(?:' + '|'.join(DATE_WORDS) + r')\b', re.IGNORECASE)
+
+
+def _clock_time(match):
+    """
+    Returns (hour, minute) for a _CLOCK_RE match, or None if it is not a valid time.
+    """
+    if match.group('named'):
+        return (12, 0) if match.group('named').lower() == 'noon' else (0, 0)
+    if match.group('hour24') is not None:
+        return int(match.group('hour24')), int(match.group('minute24'))
+
+    hour = int(match.group('hour'))
+    minute = int(match.group('minute') or 0)
+    if not 1 <= hour <= 12:
+        return None
+    is_pm = match.group('ampm').lower().startswith('p')
+    if hour == 12:
+        hour = 0
+    return (hour + 12 if is_pm else hour), minute
+
+
+def fast_path(fragment, now):
+    """
+    Resolves common reminder phrasings with precompiled patterns.
+    Returns a datetime, or None if the fragment needs the full parser.
+    """
+    relative = _RELATIVE_RE.search(fragment)
+    if relative and _CLOCK_RE.search(fragment):
+        # "in 3 days at 5pm": the full parser combines the two
+        return None
+    if relative:
+        n = relative.group('n').lower()
+        count = int(n) if n.isdigit() else _NUMBER_WORDS[n]
+        return now + timedelta(seconds=count * _UNIT_SECONDS[relative.group('unit').lower()])
+
+    if _EXPLICIT_DATE_RE.search(fragment) or _PAST_RE.search(fragment):
+        # A time on an explicit or past date ("march 3 at 5pm") is not the next occurrence of that time
+        return None
+
+    clock_match = _CLOCK_RE.search(fragment)
+    clock = _clock_time(clock_match) if clock_match else None
+    if clock_match and clock is None:
+        return None
+
+    day_match = _DAY_RE.search(fragment)
+    if not clock and not day_match:
+        return None
+
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    if day_match is None:
+        # Time only: the next occurrence of that time
+        candidate = today.replace(hour=clock[0], minute=clock[1])
+        return candidate if candidate > now else candidate + timedelta(days=1)
+
+    day = (day_match.group('day') or '').lower()
+    if day in ('today', 'tonight'):
+        base, offset = today, 0
+    elif day == 'tomorrow':
+        base, offset = today, 1
+    else:
+        target = WEEKDAYS.index(day_match.group('weekday').lower())
+        offset = (target - now.weekday()) % 7
+        base = today
+        if offset == 0 and (day_match.group('next') or clock is None
+                            or today.replace(hour=clock[0], minute=clock[1]) <= now):
+            # "next friday" said on a Friday is a week away, like dateparser reads it
+            offset = 7
+
+    if clock is None:
+        if day == 'tonight':
+            # dateparser does not treat a bare "tonight" as a date either
+            return None
+        if day_match.group('weekday'):
+            # Same as dateparser: a bare weekday means the start of that day
+            return base + timedelta(days=offset)
+        # Same as dateparser: "tomorrow" keeps the current time of day
+        return now + timedelta(days=offset)
+
+    return base.replace(hour=clock[0], minute=clock[1]) + timedelta(days=offset)
+
+
+def _pick_match(dates):
+    """
+    Returns the first meaningful dateparser match.
+    """
+    if dates:
+        for match_text, dt in dates:
+            # Filter out trivial matches like "on", "at" that dateparser sometimes catches aggressively
+            # "on" (2 chars) is too short. "May" (3) is fine. "7pm" (3) is fine.
+            if len(match_text) > 2 or any(c.isdigit() for c in match_text):
+                return dt
+    return None
+
+
+def extract_datetime(fragment, now=None, mode=None):
+    """
+    Finds the date/time a command fragment refers to.
+    :param fragment: One piece of the dictated command
+    :param now: Reference time (defaults to datetime.now())
+    :param mode: MODE_FAST or MODE_LEGACY (defaults to PARSER_MODE)
+    :return: datetime, or None if the fragment has no date
+    """
+    mode = mode or PARSER_MODE
+    if mode == MODE_LEGACY:
+        return _pick_match(search_dates(fragment, settings=DATEPARSER_SETTINGS))
+
+    now = now or datetime.now()
+    dt = fast_path(fragment, now)
+    if dt is not None:
+        return dt
+
+    # The vocabulary pre-filter only knows English date words
+    if LANGUAGES == ['en'] and not any(c.isdigit() for c in fragment) and not _DATE_WORD_RE.search(fragment):
+        return None
+
+    return _date_cache.resolve(fragment, now)
+
+
+def _dateparser_fallback(fragment, now):
+    settings = dict(DATEPARSER_SETTINGS, RELATIVE_BASE=now)
+    return _pick_match(search_dates(fragment, languages=LANGUAGES, settings=settings))
+
+
+_date_cache = RelativeDateCache(_dateparser_fallback)
+
+
+def date_cache_state():
+    """
+    Size and hit/miss counters of the dateparser fallback's cache (per process).
+    """
+    return _date_cache.state()
+
+
+def clear_date_cache():
+    _date_cache.clear()
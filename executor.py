@@ -0,0 +1,114 @@
+import os
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Bounded thread pool for the blocking work behind the FastAPI endpoints
+# (dateparser, httplib2 calls to Gmail/Calendar).
+# SPEAKSPACE_MAX_WORKERS threads run jobs; up to SPEAKSPACE_MAX_QUEUE more may wait.
+# Anything beyond that is rejected immediately instead of queueing without limit.
+
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_MAX_QUEUE = 32
+
+
+class ExecutorSaturated(Exception):
+    """Raised when every worker is busy and the wait queue is full."""
+
+
+class BoundedExecutor:
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS, max_queue=DEFAULT_MAX_QUEUE):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='speakspace')
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+
+    @property
+    def pending(self):
+        """Number of jobs running or waiting for a worker."""
+        return self._pending
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Schedules func on the pool and returns a concurrent.futures.Future.
+        Raises ExecutorSaturated instead of blocking when no slot is free.
+        """
+        if not self._slots.acquire(blocking=False):
+            raise ExecutorSaturated(
+                f"All {self.max_workers} workers busy and {self.max_queue} jobs queued"
+            )
+        with self._pending_lock:
+            self._pending += 1
+        try:
+            future = self._pool.submit(func, *args, **kwargs)
+        except Exception:
+            self._release(None)
+            raise
+        # Release on completion, not when the awaiting request goes away,
+        # so an abandoned job still counts against the limit while it runs.
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, _future):
+        with self._pending_lock:
+            self._pending -= 1
+        self._slots.release()
+
+    async def run(self, func, *args, **kwargs):
+        """
+        Runs a blocking callable without stalling the event loop.
+        """
+        return await asyncio.wrap_future(self.submit(func, *args, **kwargs))
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Returns the process-wide executor, sized from the environment on first use.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = BoundedExecutor(
+                max_workers=int(os.environ.get('SPEAKSPACE_MAX_WORKERS', DEFAULT_MAX_WORKERS)),
+                max_queue=int(os.environ.get('SPEAKSPACE_MAX_QUEUE', DEFAULT_MAX_QUEUE)),
+            )
+        return _executor
+
+
+def configure_executor(max_workers=DEFAULT_MAX_WORKERS, max_queue=DEFAULT_MAX_QUEUE):
+    """
+    Replaces the process-wide executor (e.g. from tests or server startup).
+    """
+    global _executor
+    with _executor_lock:
+        old, _executor = _executor, BoundedExecutor(max_workers, max_queue)
+    if old is not None:
+        old.shutdown(wait=False)
+    return _executor
+
+
+def shutdown_executor(wait=True):
+    """
+    Shuts down the process-wide executor; the next get_executor() creates a new one.
+    """
+    global _executor
+    with _executor_lock:
+        old, _executor = _executor, None
+    if old is not None:
+        old.shutdown(wait=wait)
+
+
+async def run_blocking(func, *args, **kwargs):
+    """
+    Shortcut for get_executor().run(...).
+    """
+    return await get_executor().run(func, *args, **kwargs)
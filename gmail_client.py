@@ -1,72 +1,78 @@
-import os.path
 import base64
+import mimetypes
+import os
+import tempfile
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from email.mime.base import MIMEBase
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaIoBaseUpload
 
-from auth_config import SCOPES
+import metrics
+import rate_limit
+from google_services import get_service, can_use_env_creds, quota_user
+from tenants import get_tenant_service
 
 # If modifying these scopes, delete the file token.json.
 
-CREDENTIALS_FILE = 'credentials.json'
-TOKEN_FILE = 'token.json'
+def get_gmail_service(tenant_id=None):
+    """
+    Returns the shared Gmail API client, or the tenant's own (see tenants.py).
+    Credentials and the discovery document are loaded once per process;
+    see google_services.get_service.
+    """
+    if tenant_id is not None:
+        return get_tenant_service(tenant_id, 'gmail', 'v1')
+    return get_service('gmail', 'v1')
+
+# Gmail accepts up to 100 calls per batch but rate-limits large ones; 50 is the documented sweet spot
+GMAIL_BATCH_SIZE = 50
+# How many batch requests may be in flight at once
+MAX_PARALLEL_BATCHES = 4
+
+# Messages with attachments are written to a temporary file and uploaded from
+# disk in chunks of this size (a multiple of 256 KB, as the upload protocol requires),
+# so memory stays bounded whatever the attachment size.
+ATTACHMENT_UPLOAD_CHUNK_BYTES = int(os.environ.get('SPEAKSPACE_ATTACHMENT_CHUNK_BYTES', 8 * 1024 * 1024))
+# Raw bytes base64-encoded at a time; a multiple of 57 so every chunk ends on a full 76-char line
+_BASE64_CHUNK_BYTES = 57 * 4096
+
+def _address_headers(message, to, subject, cc=None, bcc=None):
+    message['to'] = to
+    message['subject'] = subject
+    if cc:
+        message['cc'] = cc
+    if bcc:
+        message['bcc'] = bcc
+
+def _body_part(text_body, html_body=None):
+    message = MIMEMultipart('alternative')
+    # Attach parts into message container.
+    # According to RFC 2046, the last part of a multipart message, in this case
+    # the HTML message, is best and preferred.
+    part1 = MIMEText(text_body, 'plain')
+    message.attach(part1)
 
-def get_gmail_service():
-    """Shows basic usage of the Gmail API.
-    Lists the user's Gmail labels.
+    if html_body:
+        part2 = MIMEText(html_body, 'html')
+        message.attach(part2)
+    return message
+
+def build_message(to, subject, text_body, html_body=None, cc=None, bcc=None):
     """
-    creds = None
-    
-    # 1. Try environment variable (for Render/Production)
-    token_data = os.environ.get('GOOGLE_TOKEN_DATA')
-    if token_data:
-        try:
-            import json
-            info = json.loads(token_data)
-            creds = Credentials.from_authorized_user_info(info, SCOPES)
-        except Exception as e:
-            print(f"Error loading creds from env: {e}")
-            creds = None
-
-    # 2. Try local file if env var didn't work
-    if not can_use_env_creds(creds):
-        # The file token.json stores the user's access and refresh tokens, and is
-        # created automatically when the authorization flow completes for the first
-        # time.
-        if os.path.exists(TOKEN_FILE):
-            creds = Credentials.from_authorized_user_file(TOKEN_FILE, SCOPES)
-    
-    # If there are no (valid) credentials available, let the user log in.
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            try:
-                creds.refresh(Request())
-            except Exception:
-                # If refresh fails (e.g. scopes changed or token revoked), re-auth
-                creds = None
-        
-        if not creds:
-            # We cannot do interactive login in production/headless
-            if not os.path.exists(CREDENTIALS_FILE) and not os.environ.get('GOOGLE_TOKEN_DATA'):
-                 # If we are here, we are likely in prod but env var failed or missing
-                 print("WARNING: No credentials found and interactive login is not possible in this environment.")
-            
-            if os.path.exists(CREDENTIALS_FILE):
-                flow = InstalledAppFlow.from_client_secrets_file(CREDENTIALS_FILE, SCOPES)
-                creds = flow.run_local_server(port=0)
-                # Save the credentials for the next run
-                with open(TOKEN_FILE, 'w') as token:
-                    token.write(creds.to_json())
-
-    service = build('gmail', 'v1', credentials=creds)
-    return service
-
-def can_use_env_creds(creds):
-    return creds and creds.valid
+    Builds the messages.send body (base64url-encoded MIME message).
+    """
+    message = _body_part(text_body, html_body)
+    _address_headers(message, to, subject, cc, bcc)
+
+    # Encode the message (Base64url)
+    encoded_message = base64.urlsafe_b64encode(message.as_bytes()).decode()
+
+    return {
+        'raw': encoded_message
+    }
 
 def send_email(service, to, subject, text_body, html_body=None, cc=None, bcc=None):
     """Create and send an email message
@@ -78,34 +84,14 @@ def send_email(service, to, subject, text_body, html_body=None, cc=None, bcc=Non
     for guides on implementing OAuth2 for the application.
     """
     try:
-        message = MIMEMultipart('alternative')
-        message['to'] = to
-        message['subject'] = subject
-        
-        if cc:
-            message['cc'] = cc
-        if bcc:
-            message['bcc'] = bcc
-
-        # Attach parts into message container.
-        # According to RFC 2046, the last part of a multipart message, in this case
-        # the HTML message, is best and preferred.
-        part1 = MIMEText(text_body, 'plain')
-        message.attach(part1)
-
-        if html_body:
-            part2 = MIMEText(html_body, 'html')
-            message.attach(part2)
-
-        # Encode the message (Base64url)
-        encoded_message = base64.urlsafe_b64encode(message.as_bytes()).decode()
-
-        create_message = {
-            'raw': encoded_message
-        }
-        # pylint: disable=E1101
-        send_message = (service.users().messages().send
-                        (userId="me", body=create_message).execute())
+        with metrics.stage('send_email'):
+            with metrics.stage('mime_encode'):
+                create_message = build_message(to, subject, text_body, html_body, cc, bcc)
+            # pylint: disable=E1101
+            send_message = rate_limit.execute(
+                service.users().messages().send(userId="me", body=create_message),
+                'gmail.send', user=quota_user(service)
+            )
         
         return send_message
 
@@ -114,10 +100,139 @@ def send_email(service, to, subject, text_body, html_body=None, cc=None, bcc=Non
         send_message = None
         raise error
 
-# Placeholder for future PDF attachment functionality
-def send_email_with_attachments(service, to, subject, body, file_attachments=None):
+def _send_batch(service, messages, indices, results):
     """
-    Future implementation to support sending emails with PDF attachments.
-    :param file_attachments: List of file paths or byte streams
+    Sends messages[i] for i in indices as one batch HTTP request, filling results[i].
     """
-    raise NotImplementedError("Attachment support is not yet implemented.")
+    def on_response(request_id, response, exception):
+        results[int(request_id)] = exception if exception is not None else response
+
+    batch = service.new_batch_http_request(callback=on_response)
+    for i in indices:
+        body = build_message(**messages[i])
+        batch.add(service.users().messages().send(userId="me", body=body), request_id=str(i))
+    try:
+        rate_limit.execute(batch, 'gmail.send', user=quota_user(service),
+                           units=rate_limit.CALL_UNITS['gmail.send'] * len(indices))
+    except Exception as e:
+        # The whole batch request failed; every item in it falls back to a single send
+        # if the batch certainly was not delivered (see below)
+        for i in indices:
+            results[i] = e
+
+def send_emails_batch(service, messages, batch_size=GMAIL_BATCH_SIZE, max_parallel_batches=MAX_PARALLEL_BATCHES):
+    """
+    Sends many emails using batched messages.send calls, several batches at a time.
+    Items the batch rejected are retried once with an individual send_email, but
+    only when they certainly were not sent (rate_limit.not_applied), so a lost
+    response never emails the doctor twice.
+    :param service: Gmail API service instance
+    :param messages: List of dicts of send_email keyword arguments (to, subject, text_body, ...)
+    :return: List aligned with messages; each item is the sent message or the Exception it failed with
+    """
+    results = [None] * len(messages)
+    chunks = [range(start, min(start + batch_size, len(messages)))
+              for start in range(0, len(messages), batch_size)]
+
+    if len(chunks) == 1:
+        _send_batch(service, messages, chunks[0], results)
+    elif chunks:
+        with ThreadPoolExecutor(max_workers=max_parallel_batches, thread_name_prefix='gmail-batch') as pool:
+            list(pool.map(lambda chunk: _send_batch(service, messages, chunk, results), chunks))
+
+    for i, result in enumerate(results):
+        if result is None or (isinstance(result, Exception) and rate_limit.not_applied(result)):
+            try:
+                results[i] = send_email(service, **messages[i])
+            except Exception as e:
+                results[i] = e
+
+    return results
+
+def _open_attachment(attachment):
+    """
+    Returns (filename, binary file object, should_close) for a path, a binary
+    stream, or a (filename, path-or-stream) tuple.
+    """
+    if isinstance(attachment, tuple):
+        filename, source = attachment
+    else:
+        source = attachment
+        filename = getattr(source, 'name', None) if hasattr(source, 'read') else source
+        filename = os.path.basename(os.fspath(filename)) if filename else 'attachment'
+    if hasattr(source, 'read'):
+        return filename, source, False
+    return filename, open(source, 'rb'), True
+
+def _headers_only(part):
+    """
+    Serialised headers of a MIME part, up to and including the blank line.
+    """
+    return part.as_bytes().split(b'\n\n', 1)[0] + b'\n\n'
+
+def write_mime_message(fp, to, subject, text_body, html_body=None, cc=None, bcc=None, attachments=()):
+    """
+    Writes a multipart/mixed message with attachments to the binary file fp.
+    Attachments are read and base64-encoded a chunk at a time, never whole.
+    :param attachments: File paths, binary streams or (filename, path-or-stream) tuples
+    """
+    boundary = f'===============speakspace{uuid.uuid4().hex}=='
+    message = MIMEBase('multipart', 'mixed', boundary=boundary)
+    _address_headers(message, to, subject, cc, bcc)
+    fp.write(_headers_only(message))
+
+    fp.write(f'--{boundary}\n'.encode())
+    fp.write(_body_part(text_body, html_body).as_bytes())
+
+    for attachment in attachments:
+        filename, source, should_close = _open_attachment(attachment)
+        try:
+            maintype, subtype = (mimetypes.guess_type(filename)[0] or 'application/octet-stream').split('/', 1)
+            part = MIMEBase(maintype, subtype)
+            part.add_header('Content-Disposition', 'attachment', filename=filename)
+            part['Content-Transfer-Encoding'] = 'base64'
+            fp.write(f'\n--{boundary}\n'.encode())
+            fp.write(_headers_only(part))
+            while True:
+                chunk = source.read(_BASE64_CHUNK_BYTES)
+                if not chunk:
+                    break
+                fp.write(base64.encodebytes(chunk))
+        finally:
+            if should_close:
+                source.close()
+
+    fp.write(f'\n--{boundary}--\n'.encode())
+
+def send_email_with_attachments(service, to, subject, body, file_attachments=None, html_body=None,
+                                chunk_size=ATTACHMENT_UPLOAD_CHUNK_BYTES):
+    """
+    Sends an email with attachments (e.g. PDF reports) through Gmail's media upload.
+    The MIME message is spooled to a temporary file and uploaded from disk in
+    chunk_size pieces over a resumable upload, so memory use does not grow with
+    the attachment size. Messages up to one chunk go out in a single request.
+    Gmail rejects messages over 35 MB (MediaUploadSizeError before anything is sent).
+    :param file_attachments: List of file paths or byte streams, or (filename, path-or-stream) tuples
+    :return: The sent message
+    """
+    with tempfile.NamedTemporaryFile(prefix='speakspace-mail-', suffix='.eml', delete=False) as tmp:
+        tmp_path = tmp.name
+    try:
+        with metrics.stage('send_email'):
+            with metrics.stage('mime_encode'):
+                with open(tmp_path, 'wb') as fp:
+                    write_mime_message(fp, to, subject, body, html_body, attachments=file_attachments or ())
+            with open(tmp_path, 'rb') as fp:
+                size = os.fstat(fp.fileno()).st_size
+                media = MediaIoBaseUpload(fp, mimetype='message/rfc822', chunksize=chunk_size,
+                                          resumable=size > chunk_size)
+                # pylint: disable=E1101
+                return rate_limit.execute(
+                    service.users().messages().send(userId="me", media_body=media),
+                    'gmail.send', user=quota_user(service)
+                )
+    except HttpError as error:
+        print(f'An error occurred: {error}')
+        raise error
+    finally:
+        os.unlink(tmp_path)
@@ -0,0 +1,277 @@
+import os.path
+import json
+import threading
+
+import httplib2
+import google_auth_httplib2
+from google.oauth2.credentials import Credentials
+from google_auth_oauthlib.flow import InstalledAppFlow
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+
+import metrics
+from auth_config import SCOPES
+from credential_manager import CredentialManager, token_file_lock, write_token_file
+from transport import CA_BUNDLE, TRANSPORT, TRANSPORT_HTTPLIB2, PooledHttp
+
+# Process-wide registry of Google API clients.
+# Building a client parses a ~300KB discovery document and reading the token
+# costs file/env I/O, so we do both once and hand out the same client until the
+# credentials actually change (new GOOGLE_TOKEN_DATA or a rewritten token.json).
+# A CredentialManager keeps the shared access token fresh in the background.
+
+CREDENTIALS_FILE = 'credentials.json'
+TOKEN_FILE = 'token.json'
+
+_lock = threading.RLock()
+_discovery_docs = {}   # (api, version) -> parsed discovery document
+_services = {}         # (api, version) -> (fingerprint, service)
+_credentials = None    # (fingerprint, creds)
+_manager = None        # CredentialManager for the cached creds
+
+
+def can_use_env_creds(creds):
+    return creds and creds.valid
+
+
+def _credentials_fingerprint():
+    """
+    Cheap identity of the current credential sources.
+    Changes whenever GOOGLE_TOKEN_DATA is replaced or token.json is rewritten.
+    """
+    try:
+        stat = os.stat(TOKEN_FILE)
+        file_id = (stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        file_id = None
+    return (os.environ.get('GOOGLE_TOKEN_DATA'), file_id)
+
+
+def _save_token(creds):
+    with token_file_lock(TOKEN_FILE):
+        write_token_file(TOKEN_FILE, creds)
+
+
+def load_credentials(interactive=True):
+    """
+    Loads user credentials from GOOGLE_TOKEN_DATA (Render/Production) or token.json,
+    refreshing or running the interactive flow if needed.
+    :param interactive: Whether the browser login flow may run when nothing else works
+    """
+    creds = None
+    token_path = None  # where refreshed tokens are saved
+
+    # 1. Try environment variable (for Render/Production)
+    token_data = os.environ.get('GOOGLE_TOKEN_DATA')
+    if token_data:
+        try:
+            info = json.loads(token_data)
+            creds = Credentials.from_authorized_user_info(info, SCOPES)
+        except Exception as e:
+            print(f"Error loading creds from env: {e}")
+            creds = None
+
+    # 2. Try local file if env var didn't work
+    if not can_use_env_creds(creds):
+        # The file token.json stores the user's access and refresh tokens, and is
+        # created automatically when the authorization flow completes for the first
+        # time.
+        if os.path.exists(TOKEN_FILE):
+            creds = Credentials.from_authorized_user_file(TOKEN_FILE, SCOPES)
+            token_path = TOKEN_FILE
+
+    # If there are no (valid) credentials available, let the user log in.
+    if not creds or not creds.valid:
+        if creds and creds.expired and creds.refresh_token:
+            try:
+                # Reuses a token another worker just refreshed, else refreshes and saves it
+                CredentialManager(creds, token_path).refresh()
+            except Exception:
+                # If refresh fails (e.g. scopes changed or token revoked), re-auth
+                creds = None
+
+        if not creds:
+            # We cannot do interactive login in production/headless
+            if not os.path.exists(CREDENTIALS_FILE) and not os.environ.get('GOOGLE_TOKEN_DATA'):
+                # If we are here, we are likely in prod but env var failed or missing
+                print("WARNING: No credentials found and interactive login is not possible in this environment.")
+
+            if interactive and os.path.exists(CREDENTIALS_FILE):
+                flow = InstalledAppFlow.from_client_secrets_file(CREDENTIALS_FILE, SCOPES)
+                creds = flow.run_local_server(port=0)
+                # Save the credentials for the next run
+                _save_token(creds)
+
+    return creds
+
+
+def _token_rewritten():
+    """
+    Called after our CredentialManager saved a refreshed token: the new token.json
+    holds the same credentials, so keep the cached clients instead of rebuilding them.
+    """
+    global _credentials
+    with _lock:
+        if _credentials is None:
+            return
+        old, new = _credentials[0], _credentials_fingerprint()
+        _credentials = (new, _credentials[1])
+        for key, (fingerprint, service) in list(_services.items()):
+            if fingerprint == old:
+                _services[key] = (new, service)
+
+
+def _manage(creds):
+    """
+    Starts background refreshes for newly loaded credentials.
+    """
+    global _manager
+    if _manager is not None:
+        _manager.stop()
+    # Tokens from GOOGLE_TOKEN_DATA are refreshed in memory only
+    token_path = TOKEN_FILE if os.path.exists(TOKEN_FILE) and not os.environ.get('GOOGLE_TOKEN_DATA') else None
+    _manager = CredentialManager(creds, token_path, on_persist=_token_rewritten).start()
+
+
+def get_credentials(interactive=True):
+    """
+    Returns the shared credentials, reloading them only when their source changed.
+    """
+    global _credentials
+    with _lock:
+        fingerprint = _credentials_fingerprint()
+        if _credentials is not None and _credentials[0] == fingerprint:
+            return _credentials[1]
+
+        with metrics.stage('load_credentials'):
+            creds = load_credentials(interactive)
+        if creds is not None:
+            # Re-read the fingerprint: load_credentials may have written token.json
+            _credentials = (_credentials_fingerprint(), creds)
+            _manage(creds)
+        return creds
+
+
+def get_discovery_document(api, version):
+    """
+    Returns the parsed discovery document bundled with googleapiclient (no network fetch).
+    GOOGLE_API_ROOT_URL points the clients at another host, e.g. a local fake server.
+    """
+    key = (api, version)
+    doc = _discovery_docs.get(key)
+    if doc is None:
+        content = get_static_doc(api, version)
+        if content is None:
+            raise ValueError(f"No bundled discovery document for {api} {version}")
+        doc = json.loads(content)
+        root_url = os.environ.get('GOOGLE_API_ROOT_URL')
+        if root_url:
+            doc['rootUrl'] = root_url.rstrip('/') + '/'
+        _discovery_docs[key] = doc
+    return doc
+
+
+class ThreadLocalHttp:
+    """
+    httplib2-compatible transport that gives each thread its own AuthorizedHttp.
+    httplib2.Http is not thread-safe, so a shared client must not share one.
+    """
+
+    def __init__(self, credentials, manager=None):
+        self.credentials = credentials
+        self.manager = manager
+        self._local = threading.local()
+
+    def _http(self):
+        http = getattr(self._local, 'http', None)
+        if http is None:
+            http = google_auth_httplib2.AuthorizedHttp(self.credentials, http=httplib2.Http(ca_certs=CA_BUNDLE))
+            self._local.http = http
+        return http
+
+    def request(self, *args, **kwargs):
+        manager = self.manager or _manager
+        if manager is not None and manager.creds is self.credentials:
+            # No-op while the background refresh keeps up; otherwise one thread
+            # refreshes and the rest wait, instead of each refreshing the token
+            manager.ensure_valid()
+        return self._http().request(*args, **kwargs)
+
+    def __getattr__(self, name):
+        # e.g. redirect_codes, used by resumable media uploads
+        return getattr(self._http(), name)
+
+
+def new_http(credentials, manager=None):
+    """
+    HTTP transport for a client: the shared keep-alive pool by default,
+    or per-thread httplib2 with SPEAKSPACE_HTTP_TRANSPORT=httplib2.
+    :param manager: CredentialManager refreshing credentials (default: the process-wide one, if it manages them)
+    """
+    if TRANSPORT == TRANSPORT_HTTPLIB2:
+        return ThreadLocalHttp(credentials, manager)
+    if manager is None and _manager is not None and _manager.creds is credentials:
+        manager = _manager
+    return PooledHttp(credentials, manager)
+
+
+def build_service(api, version, credentials, http=None):
+    """
+    Builds a client from the bundled discovery document.
+    :param http: Transport to use, e.g. one shared by a tenant's clients (default: a new one)
+    """
+    doc = get_discovery_document(api, version)
+    if credentials is None:
+        # Let googleapiclient fall back to application default credentials
+        return build_from_document(doc, credentials=None)
+    return build_from_document(doc, http=http or new_http(credentials))
+
+
+# Attribute naming the Google account a client's calls are charged to in rate_limit
+_QUOTA_USER_ATTR = '_speakspace_quota_user'
+
+
+def set_quota_user(service, user):
+    setattr(service, _QUOTA_USER_ATTR, user)
+
+
+def quota_user(service):
+    """
+    rate_limit user for calls made with `service`: its tenant, or 'me' for the shared account.
+    """
+    user = getattr(service, _QUOTA_USER_ATTR, None)
+    return user if isinstance(user, str) else 'me'
+
+
+def get_service(api, version):
+    """
+    Returns the shared client for an API, building it on first use or after
+    the credentials changed. Safe to call from multiple threads.
+    """
+    key = (api, version)
+    with metrics.stage('get_service'), _lock:
+        creds = get_credentials()
+        fingerprint = _credentials[0] if _credentials else None
+        cached = _services.get(key)
+        if cached is not None and fingerprint is not None and cached[0] == fingerprint:
+            return cached[1]
+
+        with metrics.stage('discovery_build'):
+            service = build_service(api, version, creds)
+        if fingerprint is not None:
+            _services[key] = (fingerprint, service)
+        return service
+
+
+def clear_cache():
+    """
+    Drops cached credentials and clients so the next call rebuilds them.
+    """
+    global _credentials, _manager
+    with _lock:
+        if _manager is not None:
+            _manager.stop()
+        _credentials = None
+        _manager = None
+        _services.clear()
+        _discovery_docs.clear()
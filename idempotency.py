@@ -0,0 +1,200 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import closing
+
+# Result cache for retried requests.
+#
+# A request is identified by its Idempotency-Key header or, failing that, by a
+# hash of its endpoint and body. The first execution's result is kept in a
+# bounded in-memory LRU with TTL (and optionally on disk, so it survives
+# restarts); repeats get the stored result without touching Google, and
+# concurrent duplicates wait on the single in-flight execution.
+# Failures are never stored, so a retry after an error runs again. A stored
+# result the caller marks as unfinished (e.g. an action Google turned away) is
+# handed back to the caller to finish on the next retry, without redoing the
+# parts that succeeded.
+
+MAX_ENTRIES = int(os.environ.get('SPEAKSPACE_IDEMPOTENCY_MAX_ENTRIES', 10000))
+# Explicit keys are kept for a day, like most payment-style APIs
+KEY_TTL_SECONDS = float(os.environ.get('SPEAKSPACE_IDEMPOTENCY_TTL', 24 * 3600))
+# Content hashes only catch quick retries; the same command later in the day is a new request
+HASH_TTL_SECONDS = float(os.environ.get('SPEAKSPACE_IDEMPOTENCY_HASH_TTL', 600))
+IDEMPOTENCY_DB = os.environ.get('SPEAKSPACE_IDEMPOTENCY_DB')
+
+REPLAYED_HEADER = 'Idempotent-Replayed'
+
+
+def request_key(endpoint, idempotency_key=None, payload=None):
+    """
+    Returns (cache key, ttl) for a request.
+    :param payload: JSON-serialisable request body, hashed when no key is given
+    """
+    if idempotency_key:
+        return f"{endpoint}:key:{idempotency_key}", KEY_TTL_SECONDS
+    canonical = json.dumps(payload, sort_keys=True, separators=(',', ':'), default=str)
+    digest = hashlib.sha256(canonical.encode()).hexdigest()
+    return f"{endpoint}:sha256:{digest}", HASH_TTL_SECONDS
+
+
+class DiskStore:
+    """
+    SQLite-backed second level for IdempotencyCache.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with closing(self._connect()) as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS idempotency ('
+                'key TEXT PRIMARY KEY, result TEXT NOT NULL, expires_at REAL NOT NULL)'
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def get(self, key):
+        with closing(self._connect()) as conn:
+            row = conn.execute('SELECT result, expires_at FROM idempotency WHERE key = ?', (key,)).fetchone()
+        if row is None or row[1] <= time.time():
+            return None
+        return json.loads(row[0]), row[1]
+
+    def put(self, key, result, expires_at):
+        with closing(self._connect()) as conn:
+            conn.execute('INSERT OR REPLACE INTO idempotency (key, result, expires_at) VALUES (?, ?, ?)',
+                         (key, json.dumps(result, default=str), expires_at))
+            # Opportunistic cleanup keeps the file from growing without bound
+            conn.execute('DELETE FROM idempotency WHERE expires_at <= ?', (time.time(),))
+
+
+class IdempotencyCache:
+    """
+    :param max_entries: In-memory LRU bound
+    :param store: Optional DiskStore consulted on memory misses
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES, store=None):
+        self.max_entries = max_entries
+        self.store = store
+        self.hits = 0
+        self.misses = 0
+        self.collapsed = 0
+        self.resumed = 0
+        self._entries = OrderedDict()   # key -> (expires_at, result)
+        self._lock = threading.Lock()
+        self._in_flight = {}            # key -> asyncio.Future
+
+    def get(self, key, use_store=True):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > time.time():
+                    self._entries.move_to_end(key)
+                    return entry[1]
+                del self._entries[key]
+        if use_store and self.store is not None:
+            stored = self.store.get(key)
+            if stored is not None:
+                result, expires_at = stored
+                self._remember(key, result, expires_at)
+                return result
+        return None
+
+    def _remember(self, key, result, expires_at):
+        with self._lock:
+            self._entries[key] = (expires_at, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def put(self, key, result, ttl):
+        expires_at = time.time() + ttl
+        self._remember(key, result, expires_at)
+        if self.store is not None:
+            self.store.put(key, result, expires_at)
+
+    def __len__(self):
+        return len(self._entries)
+
+    async def run(self, key, ttl, compute, unfinished=None, resume=None):
+        """
+        Returns (result, replayed). Runs `await compute()` at most once per key
+        while the result is cached; concurrent callers share one execution.
+        :param unfinished: Optional callable(result) -> bool for stored results that
+                           still have work left
+        :param resume: Async callable(stored result) -> result, run instead of compute
+                       for an unfinished result; its result replaces the stored one
+        """
+        cached = self.get(key, use_store=False)
+        if cached is None and self.store is not None and key not in self._in_flight:
+            # Blocking SQLite read; memory may have been filled meanwhile, so fall back to it
+            cached = await asyncio.to_thread(self.get, key) or self.get(key, use_store=False)
+        if cached is not None and not (unfinished is not None and unfinished(cached)):
+            self.hits += 1
+            return cached, True
+
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            self.collapsed += 1
+            return await asyncio.shield(in_flight), True
+
+        if cached is not None:
+            self.resumed += 1
+            work = lambda: resume(cached)
+        else:
+            self.misses += 1
+            work = compute
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            result = await work()
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved in case no duplicate was waiting
+            future.exception()
+            del self._in_flight[key]
+            raise
+
+        # Stored before the key leaves _in_flight, so a duplicate arriving while
+        # the disk write runs waits for this result instead of running again
+        try:
+            if self.store is not None:
+                await asyncio.to_thread(self.put, key, result, ttl)
+            else:
+                self.put(key, result, ttl)
+        except Exception as e:
+            # The work is done; failing to remember it must not fail the request
+            print(f"Could not store the result for {key}: {e}")
+        finally:
+            future.set_result(result)
+            del self._in_flight[key]
+        return result, False
+
+    def stats(self):
+        return {'entries': len(self), 'hits': self.hits, 'misses': self.misses, 'collapsed': self.collapsed,
+                'resumed': self.resumed}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_idempotency_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            store = DiskStore(IDEMPOTENCY_DB) if IDEMPOTENCY_DB else None
+            _cache = IdempotencyCache(store=store)
+        return _cache
+
+
+def reset_idempotency_cache():
+    global _cache
+    with _cache_lock:
+        _cache = None
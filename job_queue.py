@@ -0,0 +1,289 @@
+import os
+import json
+import time
+import uuid
+import random
+import sqlite3
+import threading
+from contextlib import closing, contextmanager
+
+import rate_limit
+
+# Durable outbound job queue for /process-command in async mode.
+#
+# The endpoint persists the planned actions (see orchestrator.plan_actions) to
+# SQLite and returns 202 right away; worker threads then drain the queue
+# through orchestrator.run_action. Each action's outcome is written back as
+# soon as it completes, so a crash never re-sends an action that already went
+# out, and jobs whose worker died are picked up again once their lease expires
+# (live workers keep renewing theirs).
+
+JOB_DB = os.environ.get('SPEAKSPACE_JOB_DB', 'jobs.db')
+JOB_WORKERS = int(os.environ.get('SPEAKSPACE_JOB_WORKERS', 2))
+MAX_ATTEMPTS = int(os.environ.get('SPEAKSPACE_JOB_MAX_ATTEMPTS', 5))
+# A running job whose lease expired is assumed abandoned (worker crashed or restarted).
+# The worker running a job renews its lease every LEASE_RENEW_SECONDS, so a job that
+# is slow (e.g. Google calls backing off) is not claimed by a second worker meanwhile.
+LEASE_SECONDS = 300
+LEASE_RENEW_SECONDS = LEASE_SECONDS / 5
+RETRY_BASE_SECONDS = 2
+POLL_SECONDS = 1.0
+
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    actions TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    lease_expires_at REAL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, next_attempt_at);
+'''
+
+
+class JobQueue:
+    """
+    :param db_path: SQLite file holding the queue
+    :param handler: Callable executing one action dict and returning its result
+    :param workers: Number of worker threads draining the queue
+    """
+
+    def __init__(self, db_path, handler, workers=JOB_WORKERS, max_attempts=MAX_ATTEMPTS):
+        self.db_path = db_path
+        self.handler = handler
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self._wakeup = threading.Condition()
+        self._stopping = False
+        self._threads = []
+        with closing(self._connect()) as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    # --- producer side --------------------------------------------------
+
+    def enqueue(self, actions):
+        """
+        Persists a job and returns its id. Each action is a JSON-serialisable dict.
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        actions = [dict(action, status='pending') for action in actions]
+        with closing(self._connect()) as conn:
+            conn.execute(
+                'INSERT INTO jobs (id, status, actions, next_attempt_at, created_at, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (job_id, STATUS_QUEUED, json.dumps(actions), now, now, now)
+            )
+        with self._wakeup:
+            self._wakeup.notify()
+        return job_id
+
+    def get(self, job_id):
+        """
+        Returns the job as a dict, or None if it does not exist.
+        """
+        with closing(self._connect()) as conn:
+            row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            'id': row['id'],
+            'status': row['status'],
+            'attempts': row['attempts'],
+            'actions': json.loads(row['actions']),
+            'created_at': row['created_at'],
+            'updated_at': row['updated_at'],
+        }
+
+    # --- worker side ----------------------------------------------------
+
+    def claim(self):
+        """
+        Atomically takes the next ready job, returning (job_id, actions, attempts) or None.
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(
+                'SELECT id, actions, attempts FROM jobs '
+                'WHERE (status = ? AND next_attempt_at <= ?) OR (status = ? AND lease_expires_at <= ?) '
+                'ORDER BY created_at LIMIT 1',
+                (STATUS_QUEUED, now, STATUS_RUNNING, now)
+            ).fetchone()
+            if row is None:
+                conn.execute('COMMIT')
+                return None
+            conn.execute(
+                'UPDATE jobs SET status = ?, attempts = attempts + 1, lease_expires_at = ?, updated_at = ? '
+                'WHERE id = ?',
+                (STATUS_RUNNING, now + LEASE_SECONDS, now, row['id'])
+            )
+            conn.execute('COMMIT')
+            return row['id'], json.loads(row['actions']), row['attempts'] + 1
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+    def renew_lease(self, job_id, attempts):
+        """
+        Extends the lease on a job this worker claimed (attempt number `attempts`).
+        Returns False if the job is no longer ours, e.g. it finished or was taken over.
+        """
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                'UPDATE jobs SET lease_expires_at = ? WHERE id = ? AND status = ? AND attempts = ?',
+                (time.time() + LEASE_SECONDS, job_id, STATUS_RUNNING, attempts)
+            )
+            return cursor.rowcount == 1
+
+    @contextmanager
+    def _lease_kept(self, job_id, attempts):
+        """
+        Renews the job's lease in the background for as long as the block runs.
+        """
+        finished = threading.Event()
+
+        def renew():
+            while not finished.wait(LEASE_RENEW_SECONDS):
+                try:
+                    if not self.renew_lease(job_id, attempts):
+                        print(f"Lost the lease on job {job_id}")
+                        return
+                except Exception as e:
+                    # Try again next round; the lease only lapses after LEASE_SECONDS
+                    print(f"Could not renew the lease on job {job_id}: {e}")
+
+        thread = threading.Thread(target=renew, name=f'speakspace-lease-{job_id[:8]}', daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            finished.set()
+            thread.join()
+
+    def _save_actions(self, job_id, actions, status=None, next_attempt_at=None):
+        now = time.time()
+        with closing(self._connect()) as conn:
+            if status is None:
+                conn.execute('UPDATE jobs SET actions = ?, updated_at = ? WHERE id = ?',
+                             (json.dumps(actions), now, job_id))
+            else:
+                conn.execute(
+                    'UPDATE jobs SET actions = ?, status = ?, next_attempt_at = ?, lease_expires_at = NULL, '
+                    'updated_at = ? WHERE id = ?',
+                    (json.dumps(actions), status, next_attempt_at or now, now, job_id)
+                )
+
+    def run_job(self, job_id, actions, attempts):
+        """
+        Executes every action not yet done, recording each outcome as it completes.
+        """
+        with self._lease_kept(job_id, attempts):
+            for action in actions:
+                if action['status'] in ('done', 'unknown'):
+                    continue
+                payload = {k: v for k, v in action.items() if k not in ('status', 'result', 'error')}
+                try:
+                    action['result'] = self.handler(payload)
+                    action['status'] = 'done'
+                    action.pop('error', None)
+                except Exception as e:
+                    action['status'] = 'unknown' if rate_limit.may_have_applied(e) else 'failed'
+                    action['error'] = str(e)
+                self._save_actions(job_id, actions)
+
+        if all(action['status'] == 'done' for action in actions):
+            self._save_actions(job_id, actions, status=STATUS_DONE)
+        elif attempts >= self.max_attempts or all(action['status'] != 'failed' for action in actions):
+            self._save_actions(job_id, actions, status=STATUS_FAILED)
+        else:
+            # Jittered exponential backoff before retrying the failed actions
+            delay = RETRY_BASE_SECONDS * (2 ** (attempts - 1)) * random.uniform(0.5, 1.5)
+            self._save_actions(job_id, actions, status=STATUS_QUEUED, next_attempt_at=time.time() + delay)
+
+    def run_pending(self):
+        """
+        Drains every job that is ready now (used by workers and tests). Returns the number run.
+        """
+        count = 0
+        while not self._stopping:
+            claimed = self.claim()
+            if claimed is None:
+                return count
+            self.run_job(*claimed)
+            count += 1
+        return count
+
+    def _worker(self):
+        while not self._stopping:
+            try:
+                ran = self.run_pending()
+            except Exception as e:
+                print(f"Job worker error: {e}")
+                ran = 0
+            if not ran:
+                with self._wakeup:
+                    if not self._stopping:
+                        self._wakeup.wait(POLL_SECONDS)
+
+    def start(self):
+        if self._threads:
+            return self
+        self._stopping = False
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f'speakspace-job-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self, timeout=None):
+        """
+        Stops the workers after their current job. Unfinished jobs stay in the queue.
+        """
+        with self._wakeup:
+            self._stopping = True
+            self._wakeup.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    """
+    Returns the process-wide queue, starting its workers on first use.
+    """
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            from orchestrator import run_action
+            _queue = JobQueue(JOB_DB, run_action).start()
+        return _queue
+
+
+def stop_job_queue(timeout=None):
+    global _queue
+    with _queue_lock:
+        queue, _queue = _queue, None
+    if queue is not None:
+        queue.stop(timeout)
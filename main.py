@@ -1,14 +1,64 @@
+import os
+import json
+import asyncio
 import argparse
 import uvicorn
-from fastapi import FastAPI, HTTPException, Body
-from pydantic import BaseModel, EmailStr
-from typing import Optional
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Body, Request, Header, Response
+from fastapi.exception_handlers import http_exception_handler
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, EmailStr, ValidationError
+from typing import Annotated, List, Optional
 from googleapiclient.errors import HttpError
 
-from gmail_client import get_gmail_service, send_email
+from gmail_client import get_gmail_service, send_email, send_emails_batch
+from executor import run_blocking, shutdown_executor, ExecutorSaturated
+from rate_limit import CircuitOpenError, QuotaExhausted, limiter_state
+from job_queue import JOB_DB, get_job_queue, stop_job_queue
 from utils import format_email_body
+from templates import render_many
+import metrics
+from coalescer import close_summary_coalescer, coalescer_state
+from idempotency import REPLAYED_HEADER, get_idempotency_cache, request_key
+from warmup import WARMUP_ENABLED, warm_up
+from calendar_index import calendar_index_state, start_calendar_index, stop_calendar_index
+from date_intent import date_cache_state
+from parse_pool import PARSE_PROCESSES, start_parse_pool, stop_parse_pool
+from tenants import (DEFAULT_PATIENT, TENANT_HEADER, TENANT_KEY_HEADER, TenantAuthError, UnknownTenant,
+                     authenticate_tenant, get_patient, reset_tenants, tenant_state)
 
-app = FastAPI(title="SpeakSpace Doctor Summary Sender")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The server only accepts connections once startup finishes, so the first
+    # request does not pay for dateparser data or building Google clients
+    if WARMUP_ENABLED:
+        await asyncio.to_thread(warm_up)
+    if PARSE_PROCESSES > 0:
+        # Children load dateparser before the first command needs them
+        await asyncio.to_thread(start_parse_pool)
+    # Mirror of the calendar for duplicate-reminder checks; syncs in the background
+    start_calendar_index()
+    # Pick up jobs left in the queue by a previous run
+    if os.path.exists(JOB_DB):
+        get_job_queue()
+    yield
+    # uvicorn has stopped accepting connections and drained open requests by now.
+    # Send summaries still waiting in their coalescing window
+    close_summary_coalescer()
+    stop_calendar_index()
+    stop_job_queue(timeout=30)
+    # Let blocking work that outlived its request (e.g. after a client disconnect) finish
+    shutdown_executor(wait=True)
+    stop_parse_pool()
+    reset_tenants()
+
+app = FastAPI(title="SpeakSpace Doctor Summary Sender", lifespan=lifespan)
+
+@app.exception_handler(HTTPException)
+async def count_http_errors(request: Request, exc: HTTPException):
+    route = request.scope.get("route")
+    metrics.inc(metrics.HTTP_ERRORS, route=route.path if route else "unmatched", status=exc.status_code)
+    return await http_exception_handler(request, exc)
 
 class SummaryRequest(BaseModel):
     doctor_email: EmailStr
@@ -17,40 +67,241 @@ class SummaryRequest(BaseModel):
     patient_name: Optional[str] = None
     patient_id: Optional[str] = None
 
+BUSY_RETRY_AFTER_SECONDS = "1"
+
+def _busy_response(e: ExecutorSaturated):
+    return HTTPException(
+        status_code=503,
+        detail=f"Server busy: {e}",
+        headers={"Retry-After": BUSY_RETRY_AFTER_SECONDS}
+    )
+
+def _unknown_tenant(e: UnknownTenant):
+    return HTTPException(status_code=404, detail=str(e))
+
+def _tenant_denied(e: TenantAuthError):
+    return HTTPException(status_code=401, detail=str(e))
+
+async def _check_tenant(tenant_id: Optional[str], tenant_key: Optional[str]):
+    """
+    Refuses a request naming a tenant unless it carries that tenant's key.
+    Runs before anything is sent or replayed from the idempotency cache.
+    """
+    if tenant_id is not None:
+        await run_blocking(authenticate_tenant, tenant_id, tenant_key)
+
+def _with_tenant(payload: dict, tenant_id: Optional[str]):
+    """
+    Idempotency payload including the tenant, so one patient's request never replays another's.
+    """
+    return {**payload, "tenant_id": tenant_id} if tenant_id is not None else payload
+
+def _summary_fields(request: SummaryRequest, patient=DEFAULT_PATIENT):
+    """
+    Template slots for a summary request.
+    Falls back to the tenant's (or default) patient when the request does not name one.
+    """
+    return {
+        "summary": request.summary,
+        "patient_name": request.patient_name or patient.name,
+        "patient_id": request.patient_id or patient.patient_id
+    }
+
+def _render_summary(request: SummaryRequest, patient=DEFAULT_PATIENT):
+    """
+    Returns (text_body, html_body) for a summary request.
+    """
+    return format_email_body(**_summary_fields(request, patient))
+
+def _send_summary(request: SummaryRequest, tenant_id: Optional[str] = None):
+    """
+    Blocking part of /send-summary; runs on the bounded executor.
+    """
+    patient = get_patient(tenant_id)
+    service = get_gmail_service(tenant_id)
+
+    text_body, html_body = _render_summary(request, patient)
+
+    return send_email(
+        service=service,
+        to=request.doctor_email,
+        subject=request.subject,
+        text_body=text_body,
+        html_body=html_body
+    )
+
+def _send_summaries(requests: List[SummaryRequest], tenant_id: Optional[str] = None):
+    """
+    Blocking part of /send-summaries; runs on the bounded executor.
+    """
+    patient = get_patient(tenant_id)
+    service = get_gmail_service(tenant_id)
+
+    bodies = render_many('summary', [_summary_fields(request, patient) for request in requests])
+
+    messages = []
+    for request, (text_body, html_body) in zip(requests, bodies):
+        messages.append({
+            "to": request.doctor_email,
+            "subject": request.subject,
+            "text_body": text_body,
+            "html_body": html_body
+        })
+
+    return send_emails_batch(service, messages)
+
+def _unfinished(body: dict):
+    """
+    True if a stored /process-command result has actions that failed before Google
+    acted on them; a retry runs just those again (see orchestrator.retry_failed_actions).
+    """
+    actions = (body.get("results") or {}).get("actions", [])
+    return any(action.get("status") == "error" and action.get("retriable") for action in actions)
+
+async def _run_once(endpoint: str, idempotency_key: Optional[str], payload, compute, response: Response = None,
+                    resume=None):
+    """
+    Runs `await compute()` unless the same request already ran, in which case
+    its stored result is returned and the response is marked as replayed.
+    Requests without an Idempotency-Key are matched on a hash of their body.
+    :param resume: Async callable(stored result) that finishes an unfinished result
+    """
+    key, ttl = request_key(endpoint, idempotency_key, payload)
+    unfinished = _unfinished if resume is not None else None
+    result, replayed = await get_idempotency_cache().run(key, ttl, compute, unfinished, resume)
+    if replayed and response is not None:
+        response.headers[REPLAYED_HEADER] = "true"
+    return result, replayed
+
 @app.post("/send-summary")
-async def send_summary_endpoint(request: SummaryRequest):
+async def send_summary_endpoint(
+    request: SummaryRequest,
+    response: Response = None,
+    idempotency_key: Annotated[Optional[str], Header(alias="Idempotency-Key")] = None,
+    tenant_id: Annotated[Optional[str], Header(alias=TENANT_HEADER)] = None,
+    tenant_key: Annotated[Optional[str], Header(alias=TENANT_KEY_HEADER)] = None
+):
     """
     Accepts a summary and sends it to the specified doctor's email.
+    A retried request (same Idempotency-Key, or same body shortly after) gets
+    the first result back instead of sending a second email.
+    With an X-Tenant-ID header (and that tenant's X-Tenant-Key) it is sent
+    from that patient's account.
     """
-    try:
-        service = get_gmail_service()
-        
-        text_body, html_body = format_email_body(
-            summary=request.summary,
-            patient_name="Anusha S",
-            patient_id="54321"
-        )
-        
-        result = send_email(
-            service=service,
-            to=request.doctor_email,
-            subject=request.subject,
-            text_body=text_body,
-            html_body=html_body
-        )
-        
+    async def send():
+        result = await run_blocking(_send_summary, request, tenant_id)
         return {
             "success": True,
             "gmail_message_id": result.get('id'),
             "sent_to": request.doctor_email
         }
-        
+
+    try:
+        await _check_tenant(tenant_id, tenant_key)
+        payload = _with_tenant(request.model_dump(mode="json"), tenant_id)
+        body, _ = await _run_once("send-summary", idempotency_key, payload, send, response)
+        return body
+
+    except UnknownTenant as e:
+        raise _unknown_tenant(e)
+    except TenantAuthError as e:
+        raise _tenant_denied(e)
+    except ExecutorSaturated as e:
+        raise _busy_response(e)
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(max(1, round(e.retry_after)))})
+    except QuotaExhausted as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": BUSY_RETRY_AFTER_SECONDS})
     except HttpError as e:
         # Google API specific errors
         raise HTTPException(status_code=502, detail=f"Gmail API Error: {e}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Upper bound on items per /send-summaries call
+MAX_BULK_SUMMARIES = 500
+
+@app.post("/send-summaries")
+async def send_summaries_endpoint(
+    requests: List[SummaryRequest],
+    tenant_id: Annotated[Optional[str], Header(alias=TENANT_HEADER)] = None,
+    tenant_key: Annotated[Optional[str], Header(alias=TENANT_KEY_HEADER)] = None
+):
+    """
+    Sends many summaries at once using batched Gmail calls.
+    Returns a per-item status in request order.
+    """
+    if len(requests) > MAX_BULK_SUMMARIES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BULK_SUMMARIES} summaries per request")
+
+    try:
+        await _check_tenant(tenant_id, tenant_key)
+        outcomes = await run_blocking(_send_summaries, requests, tenant_id)
+    except UnknownTenant as e:
+        raise _unknown_tenant(e)
+    except TenantAuthError as e:
+        raise _tenant_denied(e)
+    except ExecutorSaturated as e:
+        raise _busy_response(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    results = []
+    for request, outcome in zip(requests, outcomes):
+        if isinstance(outcome, Exception):
+            results.append({"success": False, "sent_to": request.doctor_email, "error": str(outcome)})
+        else:
+            results.append({"success": True, "sent_to": request.doctor_email, "gmail_message_id": outcome.get('id')})
+
+    return {
+        "success": all(r["success"] for r in results),
+        "sent": sum(r["success"] for r in results),
+        "failed": sum(not r["success"] for r in results),
+        "results": results
+    }
+
+@app.get("/quota")
+async def quota_endpoint():
+    """
+    Shows how close each Google user/API runs to its quota and the circuit breaker states.
+    """
+    return limiter_state()
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """
+    Stage latencies, Google call latencies and error/retry counters in Prometheus text format.
+    """
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+@app.get("/coalescing")
+async def coalescing_endpoint():
+    """
+    Shows how many doctor emails summary coalescing has saved.
+    """
+    return coalescer_state()
+
+@app.get("/calendar-index")
+async def calendar_index_endpoint():
+    """
+    Shows the local calendar index used to skip duplicate reminders.
+    """
+    return calendar_index_state()
+
+@app.get("/date-cache")
+async def date_cache_endpoint():
+    """
+    Shows the hit rate of the cache in front of the dateparser fallback (this process only).
+    """
+    return date_cache_state()
+
+@app.get("/tenants")
+async def tenants_endpoint():
+    """
+    Shows how many patients are registered and how the per-tenant client cache is doing.
+    """
+    return await run_blocking(tenant_state)
+
 def run_cli_test(test_email: str):
     """
     Run a CLI smoke test to send an email.
@@ -75,54 +326,271 @@ def run_cli_test(test_email: str):
         print(f"Failed to send email: {e}")
 
 
-import re
-from orchestrator import process_command
+from orchestrator import process_command, plan_actions, retry_failed_actions
+from segmenter import find_email
 
 class ExecuteRequest(BaseModel):
     text: Optional[str] = None
     prompt: Optional[str] = None
     doctor_email: Optional[EmailStr] = None
+    # Queue the actions and return 202 with a job id instead of waiting for Google
+    async_mode: bool = False
+
+def _resolve_command(request: ExecuteRequest):
+    """
+    Returns (command_text, doctor_email) for a request, raising a 400 if either is missing.
+    """
+    # 1. Resolve Text
+    command_text = request.prompt or request.text
+    if not command_text:
+        raise HTTPException(status_code=400, detail="No text or prompt provided")
+
+    # 2. Resolve Email
+    target_email = request.doctor_email
+    if not target_email:
+        # Try to extract from text (same cached scan the orchestrator splits the command with)
+        target_email = find_email(command_text)
+        if not target_email:
+            # Fallback: Raise error or use a default if configured? 
+            # For now, require it in text if not in field.
+            raise HTTPException(status_code=400, detail="Doctor email not provided and could not be found in text.")
+
+    return command_text, target_email
+
+def _enqueue_command(command_text: str, target_email: str, tenant_id: Optional[str] = None):
+    """
+    Parses the command and persists its actions to the job queue.
+    """
+    # Unknown tenants are refused now rather than failing in the background
+    get_patient(tenant_id)
+    return get_job_queue().enqueue(plan_actions(command_text, target_email, tenant_id))
+
+@app.get("/jobs/{job_id}")
+async def job_status_endpoint(job_id: str):
+    """
+    Returns the status and per-action results of a queued /process-command job.
+    """
+    job = await run_blocking(get_job_queue().get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
 
 @app.post("/process-command")
-async def process_command_endpoint(request: ExecuteRequest):
+async def process_command_endpoint(
+    request: ExecuteRequest,
+    response: Response = None,
+    idempotency_key: Annotated[Optional[str], Header(alias="Idempotency-Key")] = None,
+    tenant_id: Annotated[Optional[str], Header(alias=TENANT_HEADER)] = None,
+    tenant_key: Annotated[Optional[str], Header(alias=TENANT_KEY_HEADER)] = None
+):
     """
     Smart endpoint: Parses natural language to perform Reminder+Summary actions.
     Accepts 'text' or 'prompt' field.
+    Retries are deduplicated like /send-summary, so a repeated command does not
+    create duplicate events or emails; it only re-runs actions Google turned away.
+    An X-Tenant-ID header selects the patient profile and Google account;
+    X-Tenant-Key must carry that tenant's key.
     """
     try:
-        # 1. Resolve Text
-        command_text = request.prompt or request.text
-        if not command_text:
-            raise HTTPException(status_code=400, detail="No text or prompt provided")
+        await _check_tenant(tenant_id, tenant_key)
+        command_text, target_email = _resolve_command(request)
 
-        # 2. Resolve Email
-        target_email = request.doctor_email
-        if not target_email:
-            # Try to extract from text
-            match = re.search(r'[\w\.-]+@[\w\.-]+\.\w+', command_text)
-            if match:
-                target_email = match.group(0)
-            else:
-                # Fallback: Raise error or use a default if configured? 
-                # For now, require it in text if not in field.
-                raise HTTPException(status_code=400, detail="Doctor email not provided and could not be found in text.")
-
-        results = process_command(command_text, target_email)
-        return {"success": True, "results": results}
+        async def execute():
+            if request.async_mode:
+                job_id = await run_blocking(_enqueue_command, command_text, target_email, tenant_id)
+                return {
+                    "success": True,
+                    "job_id": job_id,
+                    "status": "queued",
+                    "status_url": f"/jobs/{job_id}"
+                }
+            results = await run_blocking(process_command, command_text, target_email, tenant_id)
+            return {"success": True, "results": results}
+
+        async def resume(previous):
+            # Actions that succeeded (or may have) are replayed; only the rest run again
+            results = await run_blocking(retry_failed_actions, previous["results"], target_email, tenant_id)
+            return {"success": True, "results": results}
+
+        payload = _with_tenant(
+            {"text": command_text, "doctor_email": target_email, "async_mode": request.async_mode}, tenant_id)
+        body, replayed = await _run_once("process-command", idempotency_key, payload, execute, response, resume)
+
+        if request.async_mode:
+            headers = {REPLAYED_HEADER: "true"} if replayed else None
+            return JSONResponse(status_code=202, content=body, headers=headers)
+        return body
+    except HTTPException:
+        raise
+    except UnknownTenant as e:
+        raise _unknown_tenant(e)
+    except TenantAuthError as e:
+        raise _tenant_denied(e)
+    except ExecutorSaturated as e:
+        raise _busy_response(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+# Commands from one /process-command/stream request processed at the same time.
+# While all slots are busy the server stops reading the body, pushing back on the client.
+STREAM_MAX_IN_FLIGHT = int(os.environ.get('SPEAKSPACE_STREAM_MAX_IN_FLIGHT', 4))
+STREAM_MAX_LINE_BYTES = 64 * 1024
+
+class DuplexStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse that leaves receive() to the endpoint.
+    Starlette's version reads receive() to watch for disconnects, which would
+    swallow request body chunks we are still consuming while results stream out.
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+async def _iter_lines(chunks):
+    """
+    Splits a byte stream into lines without buffering more than one line.
+    Each chunk is split once; only its trailing partial line is kept for the next.
+    """
+    partial = bytearray()
+    async for chunk in chunks:
+        lines = chunk.split(b"\n")
+        if len(lines) > 1:
+            partial += lines[0]
+            lines[0] = bytes(partial)
+            partial = bytearray(lines.pop())
+            for line in lines:
+                yield line
+        else:
+            partial += chunk
+        if len(partial) > STREAM_MAX_LINE_BYTES:
+            raise ValueError(f"Line longer than {STREAM_MAX_LINE_BYTES} bytes")
+    if partial:
+        yield bytes(partial)
+
+async def _process_stream_line(line_number: int, line: bytes, tenant_id: Optional[str] = None):
+    """
+    Runs one NDJSON command and returns its result line as a dict.
+    """
+    try:
+        request = ExecuteRequest.model_validate_json(line)
+        command_text, target_email = _resolve_command(request)
+        results = await run_blocking(process_command, command_text, target_email, tenant_id)
+        return {"line": line_number, "success": True, "results": results}
+    except UnknownTenant as e:
+        return {"line": line_number, "success": False, "status": 404, "error": str(e)}
+    except HTTPException as e:
+        return {"line": line_number, "success": False, "status": e.status_code, "error": e.detail}
+    except ExecutorSaturated as e:
+        return {"line": line_number, "success": False, "status": 503, "error": f"Server busy: {e}"}
+    except ValidationError as e:
+        return {"line": line_number, "success": False, "status": 422, "error": str(e)}
+    except Exception as e:
+        return {"line": line_number, "success": False, "status": 500, "error": str(e)}
+
+@app.post("/process-command/stream")
+async def process_command_stream_endpoint(request: Request):
+    """
+    Streaming variant of /process-command for continuous transcripts.
+    The body is newline-delimited JSON, one /process-command object per line.
+    Each result is streamed back as an NDJSON line as soon as it completes,
+    tagged with the 0-based line number of its command.
+    An X-Tenant-ID header (with its X-Tenant-Key) applies to every command in the stream.
+    """
+    tenant_id = request.headers.get(TENANT_HEADER)
+    try:
+        await _check_tenant(tenant_id, request.headers.get(TENANT_KEY_HEADER))
+    except UnknownTenant as e:
+        raise _unknown_tenant(e)
+    except TenantAuthError as e:
+        raise _tenant_denied(e)
+    except ExecutorSaturated as e:
+        raise _busy_response(e)
+    results = asyncio.Queue()
+    slots = asyncio.Semaphore(STREAM_MAX_IN_FLIGHT)
+
+    async def handle(line_number, line):
+        try:
+            outcome = await _process_stream_line(line_number, line, tenant_id)
+        finally:
+            slots.release()
+        await results.put(outcome)
+
+    async def read_commands():
+        tasks = []
+        try:
+            line_number = 0
+            async for line in _iter_lines(request.stream()):
+                if not line.strip():
+                    continue
+                await slots.acquire()
+                tasks.append(asyncio.create_task(handle(line_number, line)))
+                line_number += 1
+        except Exception as e:
+            await results.put({"success": False, "status": 400, "error": f"Invalid stream: {e}"})
+        finally:
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await results.put(None)
+
+    async def result_lines():
+        reader = asyncio.create_task(read_commands())
+        try:
+            while True:
+                outcome = await results.get()
+                if outcome is None:
+                    break
+                yield json.dumps(outcome, default=str) + "\n"
+        finally:
+            if not reader.done():
+                reader.cancel()
+
+    return DuplexStreamingResponse(result_lines(), media_type="application/x-ndjson")
     
+def default_workers():
+    """
+    WEB_CONCURRENCY if set (the convention on Render/Heroku), else one worker per usable core.
+    """
+    if os.environ.get("WEB_CONCURRENCY"):
+        return int(os.environ["WEB_CONCURRENCY"])
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+# Seconds uvicorn waits for open requests to finish on shutdown
+GRACEFUL_SHUTDOWN_SECONDS = int(os.environ.get("SPEAKSPACE_GRACEFUL_TIMEOUT", 30))
+
+def serve(host: str, port: int, workers: int, reload: bool = False):
+    """
+    Runs the API server. Production mode starts `workers` processes, each warmed
+    up before it accepts traffic; reload mode is a single auto-restarting process.
+    """
+    if reload:
+        uvicorn.run("main:app", host=host, port=port, reload=True)
+        return
+    print(f"Starting {workers} worker(s) on {host}:{port}")
+    uvicorn.run(
+        "main:app",
+        host=host,
+        port=port,
+        workers=workers,
+        lifespan="on",
+        timeout_graceful_shutdown=GRACEFUL_SHUTDOWN_SECONDS,
+    )
+
 if __name__ == "__main__":
 
     parser = argparse.ArgumentParser(description="SpeakSpace Doctor Email Service")
     parser.add_argument("--test-email", type=str, help="Send a test email to this address and exit")
+    parser.add_argument("--host", default=os.environ.get("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", 8000)))
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: one per core)")
+    parser.add_argument("--reload", action="store_true", help="Development mode: one process, restart on code changes")
     
     args = parser.parse_args()
     
     if args.test_email:
         run_cli_test(args.test_email)
     else:
-        import os
-        port = int(os.environ.get("PORT", 8000))
-        # Run the server
-        uvicorn.run("main:app", host="0.0.0.0", port=port, reload=True)
+        serve(args.host, args.port, args.workers or default_workers(), reload=args.reload)
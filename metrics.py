@@ -0,0 +1,187 @@
+import os
+import time
+import bisect
+import threading
+from contextlib import nullcontext
+
+# In-process counters and latency histograms, exported in Prometheus text format.
+#
+# Hot paths call timer()/inc() unconditionally; with SPEAKSPACE_METRICS=0 both
+# return immediately (timer() hands back a shared no-op context manager), so
+# the instrumentation costs one global lookup per call.
+
+ENABLED = os.environ.get('SPEAKSPACE_METRICS', '1').lower() not in ('0', 'false', 'no')
+
+# Seconds; covers sub-millisecond rendering up to slow Google round trips
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+STAGE_SECONDS = 'speakspace_stage_seconds'
+GOOGLE_CALL_SECONDS = 'speakspace_google_call_seconds'
+GOOGLE_RETRIES = 'speakspace_google_retries_total'
+GOOGLE_ERRORS = 'speakspace_google_errors_total'
+ACTION_ERRORS = 'speakspace_action_errors_total'
+HTTP_ERRORS = 'speakspace_http_errors_total'
+DATE_CACHE = 'speakspace_date_cache_total'
+COALESCED_SEND_FAILURES = 'speakspace_coalesced_send_failures_total'
+
+HELP = {
+    STAGE_SECONDS: 'Time spent in each stage of request handling',
+    GOOGLE_CALL_SECONDS: 'Latency of individual Google API calls, including failed attempts',
+    GOOGLE_RETRIES: 'Google API calls retried after a retriable failure',
+    GOOGLE_ERRORS: 'Google API calls that failed, by HTTP status',
+    ACTION_ERRORS: 'Calendar/email actions of a command that failed or timed out',
+    HTTP_ERRORS: 'Error responses returned by the API, by route and status',
+    DATE_CACHE: 'Relative-date cache lookups (hit, miss, uncacheable) and evictions',
+    COALESCED_SEND_FAILURES: 'Coalesced doctor emails that failed to send, by outcome (requeued, unknown, dropped)',
+}
+
+_NOOP = nullcontext()
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name):
+        self.name = name
+        self._values = {}   # label items -> value
+        self._lock = threading.Lock()
+
+    def inc(self, labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            yield self.name, labels, value
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.buckets = tuple(buckets)
+        self._series = {}   # label items -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def samples(self):
+        with self._lock:
+            series = {labels: list(values) for labels, values in self._series.items()}
+        for labels, values in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), values):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else f'{bound:g}'
+                yield f'{self.name}_bucket', labels + (('le', le),), cumulative
+            yield f'{self.name}_sum', labels, values[-1]
+            yield f'{self.name}_count', labels, cumulative
+
+
+_metrics = {}
+_registry_lock = threading.Lock()
+
+
+def _get(name, cls):
+    metric = _metrics.get(name)
+    if metric is None:
+        with _registry_lock:
+            metric = _metrics.setdefault(name, cls(name))
+    return metric
+
+
+def inc(name, amount=1, **labels):
+    """
+    Increments a counter, e.g. inc(GOOGLE_RETRIES, api='gmail.send').
+    """
+    if not ENABLED:
+        return
+    _get(name, Counter).inc(tuple(sorted(labels.items())), amount)
+
+
+def observe(name, value, **labels):
+    """
+    Records one value (seconds) in a histogram.
+    """
+    if not ENABLED:
+        return
+    _get(name, Histogram).observe(tuple(sorted(labels.items())), value)
+
+
+class _Timer:
+    __slots__ = ('name', 'labels', 'start')
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        _get(self.name, Histogram).observe(self.labels, time.perf_counter() - self.start)
+        return False
+
+
+def timer(name, **labels):
+    """
+    Context manager recording the duration of its block in a histogram.
+    Failed blocks are timed too.
+    """
+    if not ENABLED:
+        return _NOOP
+    return _Timer(name, tuple(sorted(labels.items())))
+
+
+def stage(name):
+    """
+    Shorthand for timer(STAGE_SECONDS, stage=name).
+    """
+    if not ENABLED:
+        return _NOOP
+    return _Timer(STAGE_SECONDS, (('stage', name),))
+
+
+def reset():
+    with _registry_lock:
+        _metrics.clear()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format(value):
+    if isinstance(value, int) or value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def render_prometheus():
+    """
+    All metrics in the Prometheus text exposition format (version 0.0.4).
+    """
+    with _registry_lock:
+        metrics = sorted(_metrics.items())
+    lines = []
+    for name, metric in metrics:
+        lines.append(f'# HELP {name} {HELP.get(name, name)}')
+        lines.append(f'# TYPE {name} {metric.kind}')
+        for sample, labels, value in metric.samples():
+            if labels:
+                label_text = ','.join(f'{key}="{_escape(val)}"' for key, val in labels)
+                lines.append(f'{sample}{{{label_text}}} {_format(value)}')
+            else:
+                lines.append(f'{sample} {_format(value)}')
+    return '\n'.join(lines) + '\n'
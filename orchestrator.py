@@ -1,84 +1,372 @@
-import re
-import dateparser
-from dateparser.search import search_dates
+import os
+import copy
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
 from datetime import datetime, timedelta
-from calendar_client import get_calendar_service, create_event
+import date_intent
+from date_intent import extract_datetime
+from segmenter import segment
+from recurrence import extract_recurrence, build_rrule, default_start, has_reminder_cue
+from calendar_client import get_calendar_service, create_event, create_events_batch
 from gmail_client import get_gmail_service, send_email
 from utils import format_email_body
+import metrics
+import rate_limit
+from coalescer import coalescing_enabled, get_summary_coalescer
+from calendar_index import get_calendar_index
+from parse_pool import get_parse_pool
+from job_queue import get_job_queue
+from tenants import DEFAULT_PATIENT, get_patient
 
-def process_command(text: str, doctor_email: str):
+# Side effects of a command run on their own pool; the caller is usually already
+# a worker of executor.BoundedExecutor, so sharing that pool could deadlock.
+ACTION_TIMEOUT_SECONDS = float(os.environ.get('SPEAKSPACE_ACTION_TIMEOUT', 30))
+_action_pool = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('SPEAKSPACE_ACTION_WORKERS', 16)),
+    thread_name_prefix='speakspace-action'
+)
+
+def _create_calendar_event(action_text, start_time, recurrence=None, tenant_id=None):
+    cal_service = get_calendar_service(tenant_id)
+    return create_event(cal_service, summary=action_text, start_time=start_time, recurrence=recurrence)
+
+def _create_calendar_events(calendar_intents, tenant_id=None):
+    cal_service = get_calendar_service(tenant_id)
+    return create_events_batch(cal_service, [
+        {"summary": action_text, "start_time": start_time, "recurrence": recurrence}
+        for action_text, start_time, recurrence in calendar_intents
+    ])
+
+def _existing_event(action_text, start_time, recurrence=None, tenant_id=None):
+    """
+    The calendar's event for this reminder if it already exists (see calendar_index), else None.
+    The index mirrors the shared account's calendar, so tenants' reminders are not checked.
+    """
+    index = get_calendar_index() if tenant_id is None else None
+    return index.find_duplicate(action_text, start_time, recurrence) if index is not None else None
+
+def _remember_event(event, tenant_id=None):
+    index = get_calendar_index() if tenant_id is None else None
+    if index is not None:
+        index.add(event)
+
+def _send_summary_email(summary_text, doctor_email, patient=DEFAULT_PATIENT):
+    """
+    :param patient: tenants.Patient; sent from the patient's tenant account if it has one
+    """
+    gmail_service = get_gmail_service(patient.tenant_id)
+    text_body, html_body = format_email_body(
+        summary=summary_text,
+        patient_name=patient.name,
+        patient_id=patient.patient_id,
+        include_metadata=True
+    )
+
+    return send_email(
+        service=gmail_service,
+        to=doctor_email,
+        subject="Patient Update / Symptom Report",
+        text_body=text_body,
+        html_body=html_body
+    )
+
+def _coalesced_text(summaries):
+    if len(summaries) == 1:
+        return summaries[0]
+    return "\n".join(f"- {summary}" for summary in summaries)
+
+def _send_coalesced_summaries(doctor_email, patient, summaries):
+    """
+    Sends several summaries for one doctor and patient as a single email.
+    """
+    return _send_summary_email(_coalesced_text(summaries), doctor_email, patient)
+
+def _requeue_coalesced_summaries(doctor_email, patient, summaries, error):
+    """
+    Hands a coalesced email that failed to the durable job queue, which retries it.
+    Not if Google may have sent it anyway: the doctor would get it twice.
+    :return: 'requeued' or 'unknown', for the coalescer's failure metric
+    """
+    if rate_limit.may_have_applied(error):
+        return 'unknown'
+    action = {"type": "email", "text": _coalesced_text(summaries), "to": doctor_email}
+    if patient.tenant_id is not None:
+        action["tenant"] = patient.tenant_id
+    job_id = get_job_queue().enqueue([action])
+    print(f"Queued {len(summaries)} unsent summaries for {doctor_email} as job {job_id}")
+    return 'requeued'
+
+def classify_fragment(part: str):
+    """
+    Date/recurrence classification of one fragment: (first start or None, rrule or None).
+    Pure CPU work; runs here or in a parse_pool child process.
+    """
+    recurrence, date_text = extract_recurrence(part)
+    if recurrence is not None and not has_reminder_cue(part):
+        # "i get headaches daily" reports a symptom; it is not a repeating reminder
+        recurrence, date_text = None, part
+    valid_date = extract_datetime(date_text)
+    rrule = None
+    if recurrence is not None:
+        valid_date, rrule = build_rrule(recurrence, valid_date or default_start(recurrence, datetime.now()))
+    return valid_date, rrule
+
+def plan_command(text: str):
+    """
+    Splits and classifies a command without side effects.
+    Returns (calendar_intents, summary_intents): [(text, datetime, rrule or None)], [text].
+    A repeating reminder ("every day at 8pm") is one intent with an RRULE,
+    starting at its first occurrence.
+    """
+    # 1. One pass over the transcript: fragments plus their date/time-like tokens
+    with metrics.stage('segment'):
+        fragments, _ = segment(text)
+
+    # 2. Classify parts. Fragments with nothing date-like are summaries without asking
+    # the classifier (the segmenter's vocabulary is English, like date_intent's pre-filter)
+    to_classify = [fragment.text for fragment in fragments
+                   if fragment.times or date_intent.LANGUAGES != ['en']]
+    pool = get_parse_pool()
+    if pool is not None and to_classify:
+        # CPU-bound dateparser work on other cores, batched with other requests' fragments
+        with metrics.stage('date_parse_pool'):
+            classified = dict(zip(to_classify, pool.classify(to_classify)))
+    else:
+        classified = {}
+        for part in to_classify:
+            # Pattern fast path first, language-restricted dateparser as fallback
+            with metrics.stage('date_parse'):
+                classified[part] = classify_fragment(part)
+
+    calendar_intents = []
+    summary_intents = []
+    for fragment in fragments:
+        part = fragment.text
+        valid_date, rrule = classified.get(part, (None, None))
+        if valid_date:
+            calendar_intents.append((part, valid_date, rrule))
+        else:
+            # It's likely a summary/note
+            summary_intents.append(part)
+
+    return calendar_intents, summary_intents
+
+def plan_actions(text: str, doctor_email: str, tenant_id=None):
+    """
+    Turns a command into JSON-serialisable actions, e.g. for the job queue.
+    """
+    calendar_intents, summary_intents = plan_command(text)
+    actions = [
+        {"type": "calendar", "text": action_text, "start_time": start_time.isoformat(), "recurrence": recurrence}
+        for action_text, start_time, recurrence in calendar_intents
+    ]
+    if summary_intents:
+        actions.append({"type": "email", "text": ". ".join(summary_intents), "to": doctor_email})
+    if tenant_id is not None:
+        for action in actions:
+            action["tenant"] = tenant_id
+    return actions
+
+def run_action(action: dict):
+    """
+    Executes one planned action and returns its JSON-serialisable result.
+    """
+    tenant_id = action.get("tenant")
+    if action["type"] == "calendar":
+        start_time = datetime.fromisoformat(action["start_time"])
+        existing = _existing_event(action["text"], start_time, action.get("recurrence"), tenant_id)
+        if existing is not None:
+            return {"link": existing.get('htmlLink'), "duplicate": True}
+        event = _create_calendar_event(action["text"], start_time, action.get("recurrence"), tenant_id)
+        _remember_event(event, tenant_id)
+        return {"link": event.get('htmlLink')}
+    if action["type"] == "email":
+        sent = _send_summary_email(action["text"], action["to"], get_patient(tenant_id))
+        return {"id": sent.get('id')}
+    raise ValueError(f"Unknown action type: {action['type']}")
+
+def process_command(text: str, doctor_email: str, tenant_id=None):
     """
     Parses natural language text into Calendar actions and/or Doctor Summaries.
     Returns a dict with results of operations.
+    :param tenant_id: Patient whose profile and Google account are used (see tenants.py);
+                      None for the default patient
     """
+    started = time.perf_counter()
+    # Raises tenants.UnknownTenant before anything is parsed or sent
+    patient = get_patient(tenant_id)
     results = {
         "calendar_event": None,
         "email_status": None,
         "parsed_intents": []
     }
 
-    # 1. Simple heuristic splitting
-    parts = [p.strip() for p in re.split(r'\s+and\s+', text, flags=re.IGNORECASE)]
+    with metrics.stage('plan_command'):
+        calendar_intents, summary_intents = plan_command(text)
 
-    calendar_intents = []
-    summary_intents = []
+    # Reminders the calendar already has are skipped, checked against the local index (no API call)
+    duplicates = []
+    if calendar_intents and tenant_id is None and get_calendar_index() is not None:
+        new_intents = []
+        for intent in calendar_intents:
+            existing = _existing_event(*intent)
+            if existing is not None:
+                duplicates.append((intent, existing))
+            else:
+                new_intents.append(intent)
+        calendar_intents = new_intents
 
-    # 2. Classify parts
-    for part in parts:
-        # scan for dates using search_dates for robustness
-        dates = search_dates(part, settings={'PREFER_DATES_FROM': 'future'})
-        
-        valid_date = None
-        if dates:
-            for match_text, dt in dates:
-                # Filter out trivial matches like "on", "at" that dateparser sometimes catches aggressively
-                # "on" (2 chars) is too short. "May" (3) is fine. "7pm" (3) is fine.
-                if len(match_text) > 2 or any(c.isdigit() for c in match_text):
-                    valid_date = dt
-                    break
+    # 3. Fan out side effects: the calendar inserts and the doctor email
+    # run concurrently, so latency is the slowest round trip, not the sum.
+    # Several reminders go out as one batch request instead of one insert each.
+    # A recurring reminder is a single event carrying its RRULE, not one insert per occurrence.
+    actions = []  # (kind, action_text, start_time, recurrence, future, index into a batch result or None)
+    if len(calendar_intents) > 1:
+        future = _action_pool.submit(_create_calendar_events, calendar_intents, tenant_id)
+        for i, (action_text, start_time, recurrence) in enumerate(calendar_intents):
+            actions.append(("calendar", action_text, start_time, recurrence, future, i))
+    else:
+        for action_text, start_time, recurrence in calendar_intents:
+            future = _action_pool.submit(_create_calendar_event, action_text, start_time, recurrence, tenant_id)
+            actions.append(("calendar", action_text, start_time, recurrence, future, None))
 
-        if valid_date:
-            calendar_intents.append((part, valid_date))
+    coalesced = None
+    if summary_intents:
+        summary_text = ". ".join(summary_intents)
+        if coalescing_enabled():
+            # Held briefly so notes dictated minutes apart reach the doctor as one email
+            coalescer = get_summary_coalescer(_send_coalesced_summaries, _requeue_coalesced_summaries)
+            coalescer.add(doctor_email, patient, summary_text)
+            coalesced = {"type": "email", "text": summary_text, "status": "queued"}
         else:
-            # It's likely a summary/note
-            summary_intents.append(part)
+            future = _action_pool.submit(_send_summary_email, summary_text, doctor_email, patient)
+            actions.append(("email", summary_text, None, None, future, None))
+
+    # 4. Collect per-action results; all actions share one deadline since they started together
+    results["actions"] = []
+    for (action_text, start_time, recurrence), existing in duplicates:
+        action = {"type": "calendar", "text": action_text, "status": "duplicate", "link": existing.get('htmlLink')}
+        if recurrence:
+            action["recurrence"] = recurrence
+        results["actions"].append(action)
+        results["calendar_event"] = action["link"]
+        results["parsed_intents"].append(f"Skipped Duplicate Calendar Event: {action_text} at {start_time}")
+    deadline = time.monotonic() + ACTION_TIMEOUT_SECONDS
+    for kind, action_text, start_time, recurrence, future, index in actions:
+        action = {"type": kind, "text": action_text, "status": "ok"}
+        if start_time is not None:
+            action["start_time"] = start_time.isoformat()
+        if recurrence:
+            action["recurrence"] = recurrence
+        try:
+            with metrics.stage('await_action'):
+                outcome = future.result(timeout=max(0, deadline - time.monotonic()))
+            if index is not None:
+                outcome = outcome[index]
+                if isinstance(outcome, Exception):
+                    raise outcome
+        except FuturesTimeoutError:
+            action["status"] = "timeout"
+            action["error"] = f"Timed out after {ACTION_TIMEOUT_SECONDS}s"
+        except Exception as e:
+            action["status"] = "error"
+            action["error"] = str(e)
+            # Safe to run again only if Google certainly did not act on it (see retry_failed_actions)
+            action["retriable"] = rate_limit.not_applied(e)
+        if action["status"] != "ok":
+            metrics.inc(metrics.ACTION_ERRORS, type=kind, status=action["status"])
+        results["actions"].append(action)
 
+        if kind == "calendar":
+            if action["status"] == "ok":
+                _remember_event(outcome, tenant_id)
+                action["link"] = outcome.get('htmlLink')
+                results["calendar_event"] = action["link"]
+                if recurrence:
+                    results["parsed_intents"].append(
+                        f"Created Recurring Calendar Event: {action_text} from {start_time} ({recurrence})")
+                else:
+                    results["parsed_intents"].append(f"Created Calendar Event: {action_text} at {start_time}")
+            else:
+                results["calendar_error"] = action["error"]
+        else:
+            if action["status"] == "ok":
+                action["id"] = outcome.get('id')
+                results["email_status"] = "Sent"
+                results["email_id"] = action["id"]
+                results["parsed_intents"].append(f"Sent Summary to Doctor: {action_text}")
+            else:
+                results["email_error"] = action["error"]
 
-    # 3. Execute Calendar Actions
-    if calendar_intents:
-        cal_service = get_calendar_service()
-        for action_text, start_time in calendar_intents:
-            try:
-                event = create_event(cal_service, summary=action_text, start_time=start_time)
-                results["calendar_event"] = event.get('htmlLink')
-                results["parsed_intents"].append(f"Created Calendar Event: {action_text} at {start_time}")
-            except Exception as e:
-                results["calendar_error"] = str(e)
+    if coalesced is not None:
+        results["actions"].append(coalesced)
+        results["email_status"] = "Queued"
+        results["parsed_intents"].append(f"Queued Summary for Doctor: {coalesced['text']}")
 
-    # 4. Execute Email Actions
-    if summary_intents:
-        summary_text = ". ".join(summary_intents)
-        
+    metrics.observe(metrics.STAGE_SECONDS, time.perf_counter() - started, stage='process_command')
+    return results
+
+def retry_failed_actions(results: dict, doctor_email: str, tenant_id=None):
+    """
+    Finishes an earlier process_command result, e.g. for a retried request.
+    Only actions that failed before Google acted on them ("retriable") run again;
+    the others, including timeouts that may still complete, are kept as they were.
+    Returns the updated copy of the result.
+    """
+    results = copy.deepcopy(results)
+    pending = []
+    for action in results.get("actions", []):
+        if action.get("status") != "error" or not action.get("retriable"):
+            continue
+        planned = {"type": action["type"], "text": action["text"]}
+        if action["type"] == "calendar":
+            planned["start_time"] = action["start_time"]
+            planned["recurrence"] = action.get("recurrence")
+        else:
+            planned["to"] = doctor_email
+        if tenant_id is not None:
+            planned["tenant"] = tenant_id
+        pending.append((action, _action_pool.submit(run_action, planned)))
+
+    deadline = time.monotonic() + ACTION_TIMEOUT_SECONDS
+    for action, future in pending:
+        del action["error"], action["retriable"]
+        action["status"] = "ok"
         try:
-            gmail_service = get_gmail_service()
-            text_body, html_body = format_email_body(
-                summary=summary_text,
-                patient_name="Anusha S",
-                patient_id="54321",
-                include_metadata=True
-            )
-            
-            send_result = send_email(
-                service=gmail_service,
-                to=doctor_email,
-                subject="Patient Update / Symptom Report",
-                text_body=text_body,
-                html_body=html_body
-            )
-            results["email_status"] = "Sent"
-            results["email_id"] = send_result.get('id')
-            results["parsed_intents"].append(f"Sent Summary to Doctor: {summary_text}")
+            with metrics.stage('await_action'):
+                outcome = future.result(timeout=max(0, deadline - time.monotonic()))
+        except FuturesTimeoutError:
+            action["status"] = "timeout"
+            action["error"] = f"Timed out after {ACTION_TIMEOUT_SECONDS}s"
         except Exception as e:
-            results["email_error"] = str(e)
-            
+            action["status"] = "error"
+            action["error"] = str(e)
+            action["retriable"] = rate_limit.not_applied(e)
+        if action["status"] != "ok":
+            metrics.inc(metrics.ACTION_ERRORS, type=action["type"], status=action["status"])
+            continue
+
+        if action["type"] == "calendar":
+            action["link"] = outcome.get("link")
+            results["calendar_event"] = action["link"]
+            if outcome.get("duplicate"):
+                action["status"] = "duplicate"
+                results["parsed_intents"].append(
+                    f"Skipped Duplicate Calendar Event: {action['text']} at {action['start_time']}")
+            else:
+                results["parsed_intents"].append(f"Created Calendar Event: {action['text']} at {action['start_time']}")
+        else:
+            action["id"] = outcome.get("id")
+            results["email_status"] = "Sent"
+            results["email_id"] = action["id"]
+            results["parsed_intents"].append(f"Sent Summary to Doctor: {action['text']}")
+
+    # The top-level errors describe what is still failing
+    for kind, key in (("calendar", "calendar_error"), ("email", "email_error")):
+        errors = [action["error"] for action in results.get("actions", [])
+                  if action["type"] == kind and action.get("error")]
+        if errors:
+            results[key] = errors[-1]
+        else:
+            results.pop(key, None)
     return results
@@ -0,0 +1,253 @@
+import os
+import queue
+import threading
+import time
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Optional process pool for the CPU-bound part of a command: date detection
+# (dateparser is pure Python and holds the GIL while it parses).
+#
+# Each child imports the parser and loads its language data once, when the
+# pool starts. Fragments from concurrent requests are gathered for up to
+# BATCH_WINDOW_SECONDS (or BATCH_SIZE fragments) and sent to a child as one
+# batch, so the pickling/IPC cost is paid per batch instead of per fragment.
+# Only classification moves: Calendar/Gmail calls stay in the server process.
+#
+# SPEAKSPACE_PARSE_PROCESSES=0 (the default) parses inline. Each server worker
+# gets its own pool, so size workers x processes to the machine.
+# If a child dies the pool is unusable; batches are parsed inline while a new
+# one is started, after a delay that doubles with each consecutive breakage.
+
+PARSE_PROCESSES = int(os.environ.get('SPEAKSPACE_PARSE_PROCESSES', 0))
+BATCH_SIZE = int(os.environ.get('SPEAKSPACE_PARSE_BATCH', 32))
+BATCH_WINDOW_SECONDS = float(os.environ.get('SPEAKSPACE_PARSE_BATCH_WINDOW_MS', 2)) / 1000
+REBUILD_BACKOFF_SECONDS = 1.0
+REBUILD_BACKOFF_MAX_SECONDS = 60.0
+
+
+def _init_child():
+    # Runs once per child: pay for imports and dateparser's language data up front
+    from warmup import warm_date_parser
+    import orchestrator  # noqa: F401
+    warm_date_parser()
+
+
+def _classify_batch(parts):
+    """
+    Child-side: classifies a batch of fragments with orchestrator.classify_fragment.
+    """
+    from orchestrator import classify_fragment
+    return [classify_fragment(part) for part in parts]
+
+
+def _ready(_):
+    # Long enough that a child which finished starting cannot take every warm-up task
+    time.sleep(0.05)
+    return os.getpid()
+
+
+def _start_method():
+    # fork is unsafe once the server runs threads; forkserver/spawn start clean children
+    methods = multiprocessing.get_all_start_methods()
+    return 'forkserver' if 'forkserver' in methods else 'spawn'
+
+
+class ParsePool:
+    """
+    :param processes: Child processes doing the parsing
+    :param batch_size: Fragments per batch sent to a child
+    :param window_seconds: How long the first queued fragment waits for others
+    """
+
+    def __init__(self, processes=PARSE_PROCESSES, batch_size=BATCH_SIZE, window_seconds=BATCH_WINDOW_SECONDS):
+        self.processes = processes
+        self.batch_size = batch_size
+        self.window_seconds = window_seconds
+        self.batches = 0
+        self.fragments = 0
+        self.rebuilds = 0
+        self._lock = threading.Lock()
+        self._broken = False
+        self._failures = 0      # consecutive breakages, for the rebuild backoff
+        self._rebuild_at = 0.0
+        self._executor = self._new_executor()
+        self._queue = queue.SimpleQueue()   # (fragment text, Future), or None to stop
+        self._dispatcher = threading.Thread(target=self._dispatch, name='speakspace-parse-batcher', daemon=True)
+        self._dispatcher.start()
+
+    def _new_executor(self):
+        return ProcessPoolExecutor(
+            max_workers=self.processes, mp_context=multiprocessing.get_context(_start_method()),
+            initializer=_init_child,
+        )
+
+    def warm_up(self):
+        """
+        Starts every child now (each runs _init_child) instead of on the first commands.
+        """
+        start = time.perf_counter()
+        pids = set()
+        while len(pids) < self.processes and time.perf_counter() - start < 60:
+            pids.update(self._executor.map(_ready, range(self.processes * 2)))
+        print(f"Parse pool: {len(pids)} processes ready in {(time.perf_counter() - start) * 1000:.0f} ms")
+        return self
+
+    def classify(self, parts):
+        """
+        Classifies fragments in the pool; blocks the calling thread until all are done.
+        :return: [(start datetime or None, rrule or None)] aligned with parts
+        """
+        futures = []
+        for part in parts:
+            future = Future()
+            self._queue.put((part, future))
+            futures.append(future)
+        return [future.result() for future in futures]
+
+    def _dispatch(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.window_seconds
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._submit(batch)
+                    return
+                batch.append(item)
+            self._submit(batch)
+
+    def _submit(self, batch):
+        self.batches += 1
+        self.fragments += len(batch)
+        executor = self._usable_executor()
+        if executor is None:
+            # Waiting to rebuild the pool
+            self._classify_inline(batch)
+            return
+        try:
+            pending = executor.submit(_classify_batch, [part for part, _ in batch])
+        except BrokenProcessPool as e:
+            self._mark_broken(executor)
+            self._fail(batch, e)
+            return
+        except RuntimeError as e:
+            self._fail(batch, e)
+            return
+
+        def deliver(done):
+            try:
+                results = done.result()
+            except BrokenProcessPool as e:
+                self._mark_broken(executor)
+                self._fail(batch, e)
+                return
+            except BaseException as e:
+                self._fail(batch, e)
+                return
+            with self._lock:
+                if executor is self._executor:
+                    self._failures = 0
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+        # Results are handed back as each batch finishes; the dispatcher goes on batching meanwhile
+        pending.add_done_callback(deliver)
+
+    def _mark_broken(self, executor):
+        with self._lock:
+            if executor is not self._executor or self._broken:
+                return
+            self._broken = True
+            self._failures += 1
+            delay = min(REBUILD_BACKOFF_MAX_SECONDS, REBUILD_BACKOFF_SECONDS * 2 ** (self._failures - 1))
+            self._rebuild_at = time.monotonic() + delay
+        print(f"Parse pool broke; starting a new one in {delay:.0f}s")
+
+    def _usable_executor(self):
+        """
+        The executor for the next batch, replacing a broken one once its backoff has
+        passed; None while still waiting.
+        """
+        with self._lock:
+            if not self._broken:
+                return self._executor
+            if time.monotonic() < self._rebuild_at:
+                return None
+            broken, self._executor = self._executor, self._new_executor()
+            self._broken = False
+            self.rebuilds += 1
+            executor = self._executor
+        broken.shutdown(wait=False, cancel_futures=True)
+        return executor
+
+    def _fail(self, batch, error):
+        # A child that died (or a pool shut down) must not take the request with it:
+        # classify inline instead
+        print(f"Parse pool failed ({error!r}); parsing {len(batch)} fragments inline")
+        self._classify_inline(batch)
+
+    def _classify_inline(self, batch):
+        from orchestrator import classify_fragment
+        for part, future in batch:
+            try:
+                future.set_result(classify_fragment(part))
+            except BaseException as e:
+                future.set_exception(e)
+
+    def state(self):
+        return {
+            'processes': self.processes,
+            'rebuilds': self.rebuilds,
+            'batches': self.batches,
+            'fragments': self.fragments,
+            'mean_batch_size': self.fragments / self.batches if self.batches else 0.0,
+        }
+
+    def shutdown(self):
+        self._queue.put(None)
+        self._dispatcher.join(timeout=5)
+        self._executor.shutdown(wait=True)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def start_parse_pool(processes=None):
+    """
+    Creates and warms the process-wide pool if SPEAKSPACE_PARSE_PROCESSES > 0.
+    """
+    global _pool
+    processes = PARSE_PROCESSES if processes is None else processes
+    if processes <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = ParsePool(processes).warm_up()
+        return _pool
+
+
+def get_parse_pool():
+    """
+    The running pool, or None when commands are parsed inline.
+    """
+    return _pool
+
+
+def stop_parse_pool():
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown()
@@ -0,0 +1,339 @@
+import os
+import time
+import random
+import socket
+import threading
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+import metrics
+from transport import ConnectFailed
+
+# Quota-aware wrapper around Google API calls.
+#
+# Every execute() goes through three layers:
+#   1. a token bucket per (Google user, API) that spends quota units per call,
+#      so bursts are smoothed instead of tripping Gmail's per-user limits;
+#   2. retries with jittered exponential backoff that honour Retry-After
+#      on 429/5xx and rate-limit 403s; calls that change state (sending an
+#      email, inserting an event) are only retried when the failed attempt
+#      certainly did not take effect, so a lost response cannot send twice;
+#   3. a circuit breaker per API that fails fast while the upstream is down.
+
+# Quota units spent by each call (Gmail documents messages.send as 100 units)
+CALL_UNITS = {
+    'gmail.send': 100,
+    'calendar.insert': 1,
+    'calendar.list': 1,
+}
+
+# Per-user budgets: (units refilled per second, bucket capacity)
+QUOTAS = {
+    'gmail': (
+        float(os.environ.get('SPEAKSPACE_GMAIL_UNITS_PER_SECOND', 250)),
+        float(os.environ.get('SPEAKSPACE_GMAIL_BURST_UNITS', 2500)),
+    ),
+    'calendar': (
+        float(os.environ.get('SPEAKSPACE_CALENDAR_UNITS_PER_SECOND', 10)),
+        float(os.environ.get('SPEAKSPACE_CALENDAR_BURST_UNITS', 100)),
+    ),
+}
+
+MAX_RETRIES = int(os.environ.get('SPEAKSPACE_GOOGLE_MAX_RETRIES', 4))
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 32
+# Longest we wait for the bucket (or a Retry-After) before giving up on a call
+MAX_WAIT_SECONDS = 60
+
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_RESET_SECONDS = 30
+
+RETRIABLE_STATUSES = {429, 500, 502, 503, 504}
+# Calls that are not safe to repeat once Google may have received them
+NON_IDEMPOTENT_APIS = frozenset({'gmail.send', 'calendar.insert'})
+# Answers that mean Google rejected the call without acting on it
+NOT_APPLIED_STATUSES = {429, 503}
+RATE_LIMIT_REASONS = ('rateLimitExceeded', 'userRateLimitExceeded')
+
+
+class QuotaExhausted(Exception):
+    """Raised when a call would have to wait longer than MAX_WAIT_SECONDS for quota."""
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling Google while the API's circuit breaker is open."""
+
+    def __init__(self, api, retry_after):
+        super().__init__(f"{api} is unavailable; retry in {retry_after:.0f}s")
+        self.api = api
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    :param rate: Units added per second
+    :param capacity: Maximum units held (largest burst)
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.waits = 0
+        self.waited_seconds = 0.0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, units, max_wait=MAX_WAIT_SECONDS):
+        """
+        Takes units from the bucket and returns how long the caller must sleep first.
+        Calls larger than the bucket (e.g. a batch) are allowed and leave it in debt.
+        """
+        with self._lock:
+            self._refill()
+            needed = min(units, self.capacity)
+            wait = max(0.0, (needed - self.tokens) / self.rate)
+            if wait > max_wait:
+                raise QuotaExhausted(f"Quota exhausted; {wait:.1f}s until {units:g} units are available")
+            self.tokens -= units
+            if wait:
+                self.waits += 1
+                self.waited_seconds += wait
+            return wait
+
+    def acquire(self, units, max_wait=MAX_WAIT_SECONDS):
+        wait = self.reserve(units, max_wait)
+        if wait:
+            time.sleep(wait)
+
+    def state(self):
+        with self._lock:
+            self._refill()
+            return {
+                'tokens': round(self.tokens, 2),
+                'capacity': self.capacity,
+                'rate_per_second': self.rate,
+                'utilisation': round(1 - self.tokens / self.capacity, 3),
+                'waits': self.waits,
+                'waited_seconds': round(self.waited_seconds, 3),
+            }
+
+
+class CircuitBreaker:
+    """
+    Opens after BREAKER_FAILURE_THRESHOLD consecutive upstream failures and
+    lets a single trial call through once BREAKER_RESET_SECONDS have passed.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_seconds=BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            remaining = self.opened_at + self.reset_seconds - time.monotonic()
+            if self.state == self.OPEN and remaining <= 0:
+                # Let one trial call through; others keep failing fast until it reports back
+                self.state = self.HALF_OPEN
+                return
+            raise CircuitOpenError(self.name, max(remaining, 0))
+
+    def abandon_trial(self):
+        """
+        Returns a half-open breaker to open when its trial call never reached
+        the upstream (e.g. no quota), so the next caller can make the trial.
+        """
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+_buckets = {}    # (user, api family) -> TokenBucket
+_breakers = {}   # api family -> CircuitBreaker
+_registry_lock = threading.Lock()
+
+
+def _family(api):
+    return api.split('.', 1)[0]
+
+
+def get_bucket(api, user='me'):
+    key = (user, _family(api))
+    with _registry_lock:
+        bucket = _buckets.get(key)
+        if bucket is None:
+            rate, capacity = QUOTAS[key[1]]
+            bucket = _buckets[key] = TokenBucket(rate, capacity)
+        return bucket
+
+
+def get_breaker(api):
+    family = _family(api)
+    with _registry_lock:
+        breaker = _breakers.get(family)
+        if breaker is None:
+            breaker = _breakers[family] = CircuitBreaker(family)
+        return breaker
+
+
+def reset():
+    """
+    Forgets all limiter and breaker state (tests, credential changes).
+    """
+    with _registry_lock:
+        _buckets.clear()
+        _breakers.clear()
+
+
+def limiter_state():
+    """
+    Snapshot of every bucket and breaker, e.g. for a status endpoint.
+    """
+    with _registry_lock:
+        buckets = dict(_buckets)
+        breakers = dict(_breakers)
+    return {
+        'buckets': {f"{user}:{family}": bucket.state() for (user, family), bucket in buckets.items()},
+        'breakers': {
+            family: {'state': breaker.state, 'consecutive_failures': breaker.failures}
+            for family, breaker in breakers.items()
+        },
+    }
+
+
+def _is_rate_limited(error):
+    content = error.content.decode('utf-8', 'replace') if isinstance(error.content, bytes) else str(error.content)
+    return getattr(error.resp, 'status', None) == 403 and any(reason in content for reason in RATE_LIMIT_REASONS)
+
+
+def _is_retriable(error):
+    """
+    Returns True for failures worth retrying: 429/5xx, rate-limit 403s and transport errors.
+    """
+    if isinstance(error, HttpError):
+        return getattr(error.resp, 'status', None) in RETRIABLE_STATUSES or _is_rate_limited(error)
+    return isinstance(error, (httplib2.HttpLib2Error, socket.timeout, ConnectionError, TimeoutError))
+
+
+def not_applied(error):
+    """
+    Returns True if the failed call certainly did not take effect: Google turned it
+    away (429, 503, rate-limit 403), the connection was never opened, or the
+    breaker or quota limiter stopped it before it was made.
+    A read timeout, a dropped connection or a 500 may come after the call succeeded.
+    """
+    if isinstance(error, HttpError):
+        return getattr(error.resp, 'status', None) in NOT_APPLIED_STATUSES or _is_rate_limited(error)
+    return isinstance(error, (ConnectFailed, ConnectionRefusedError, httplib2.ServerNotFoundError,
+                              CircuitOpenError, QuotaExhausted))
+
+
+def may_have_applied(error):
+    """
+    Returns True for an upstream failure after which the call may still have taken
+    effect (read timeout, dropped connection, 500): repeating it could act twice.
+    """
+    return _is_retriable(error) and not not_applied(error)
+
+
+def _retry_after(error):
+    """
+    Seconds requested by a Retry-After header, or None.
+    """
+    resp = getattr(error, 'resp', None)
+    value = resp.get('retry-after') if isinstance(resp, dict) else None
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except (TypeError, ValueError):
+        # HTTP-date form is rare for Google APIs; fall back to our own backoff
+        return None
+
+
+def backoff_delay(attempt):
+    """
+    Full-jitter exponential backoff for the given retry attempt (0-based).
+    """
+    return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * (2 ** attempt)))
+
+
+def execute(request, api, user='me', units=None, max_retries=None):
+    """
+    Executes a googleapiclient request (or batch) under the quota limiter,
+    retry policy and circuit breaker for the API.
+    :param request: Object with an execute() method
+    :param api: Key of CALL_UNITS, e.g. 'gmail.send'
+    :param user: Google account the quota is charged to
+    :param units: Quota units to spend (defaults to CALL_UNITS[api])
+    """
+    bucket = get_bucket(api, user)
+    breaker = get_breaker(api)
+    units = CALL_UNITS.get(api, 1) if units is None else units
+    max_retries = MAX_RETRIES if max_retries is None else max_retries
+
+    attempt = 0
+    while True:
+        breaker.before_call()
+        try:
+            with metrics.stage('quota_wait'):
+                bucket.acquire(units)
+        except BaseException:
+            breaker.abandon_trial()
+            raise
+        try:
+            with metrics.timer(metrics.GOOGLE_CALL_SECONDS, api=api):
+                result = request.execute()
+        except Exception as e:
+            status = getattr(getattr(e, 'resp', None), 'status', None)
+            metrics.inc(metrics.GOOGLE_ERRORS, api=api, status=status or type(e).__name__)
+            if not _is_retriable(e):
+                # The upstream answered; the request itself was bad
+                breaker.record_success()
+                raise
+            breaker.record_failure()
+            if attempt >= max_retries:
+                raise
+            if api in NON_IDEMPOTENT_APIS and not not_applied(e):
+                # Google may have sent the email or created the event; a retry could do it twice
+                raise
+            delay = _retry_after(e)
+            if delay is None:
+                delay = backoff_delay(attempt)
+            elif delay > MAX_WAIT_SECONDS:
+                raise
+            metrics.inc(metrics.GOOGLE_RETRIES, api=api)
+            print(f"Retrying {api} after {type(e).__name__} in {delay:.2f}s (attempt {attempt + 1}/{max_retries})")
+            time.sleep(delay)
+            attempt += 1
+            continue
+        breaker.record_success()
+        return result
@@ -0,0 +1,169 @@
+import re
+from datetime import timedelta
+
+from dateutil.relativedelta import relativedelta
+from dateutil.rrule import rrulestr
+
+from date_intent import _CLOCK_RE, _NUMBER_WORDS, WEEKDAYS
+
+# Recurrence detection for reminder fragments.
+#
+# "every day at 8pm", "twice daily" or "every Monday for 4 weeks" become one
+# RFC 5545 RRULE, so a recurring reminder is a single Calendar event instead of
+# one event (and one parse and one API call) per occurrence. The recurrence
+# phrase is removed before date detection; whatever is left ("at 8pm") gives
+# the time of the first occurrence.
+#
+# A frequency word alone does not make a reminder: "headaches daily" or "dizzy
+# on mondays" report symptoms and stay doctor summaries. Only fragments with a
+# reminder cue (a clock time, or a word from REMINDER_WORDS) repeat.
+
+WEEKDAY_CODES = ['MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU']
+
+# Instructions and treatments that mark a repeating fragment as a reminder
+REMINDER_WORDS = (
+    'take', 'remind', 'check', 'measure', 'test', 'inject', 'apply', 'use', 'drink', 'do',
+    'walk', 'stretch', 'exercise', 'call', 'book', 'schedule', 'refill',
+    'pill', 'pills', 'tablet', 'tablets', 'capsule', 'capsules', 'medicine', 'medication', 'meds',
+    'dose', 'doses', 'insulin', 'antibiotics', 'vitamin', 'inhaler', 'drops', 'physio', 'physiotherapy',
+)
+_REMINDER_WORD_RE = re.compile(r'\b(?:' + '|'.join(REMINDER_WORDS) + r')\b', re.IGNORECASE)
+
+# First occurrence when the fragment names a recurrence but no time of day
+DEFAULT_HOUR = 9
+_PART_OF_DAY_HOURS = {'morning': 8, 'afternoon': 14, 'evening': 19, 'night': 21}
+
+_NUMBER = r'(?:\d+|' + '|'.join(_NUMBER_WORDS) + r')'
+_WEEKDAY = r'(?:' + '|'.join(WEEKDAYS) + r')'
+
+_REPEAT_RE = re.compile(
+    # "twice daily", "3 times a day"
+    r'\b(?:(?P<twice>once|twice|thrice)|(?P<times>' + _NUMBER + r')\s+times)\s+'
+    r'(?:daily|a\s+day|per\s+day|each\s+day|every\s+day)\b'
+    # "every other day", "every 2 weeks"
+    r'|\b(?:every|each)\s+(?:(?P<other>other)|(?P<n>' + _NUMBER + r'))\s+(?P<n_unit>hour|day|week|month)s?\b'
+    # "every monday, wednesday & friday", "every tuesday and thursday", "on mondays"
+    r'|\b(?:every|each)\s+(?P<days>' + _WEEKDAY + r's?(?:\s*(?:,|&|/|\bor\b|\band\b)\s*' + _WEEKDAY + r')*)s?\b'
+    r'|\bon\s+(?P<plural_day>' + _WEEKDAY + r')s\b'
+    # "every day", "each evening", "every weekday"
+    r'|\b(?:every|each)\s+(?P<unit>hour|day|week|month|weekday|morning|afternoon|evening|night)\b'
+    r'|\b(?P<ly>hourly|daily|nightly|weekly|monthly)\b',
+    re.IGNORECASE
+)
+_LIMIT_RE = re.compile(
+    r'\bfor\s+(?:the\s+next\s+)?(?P<count>' + _NUMBER + r')\s+(?P<unit>time|dose|day|week|month)s?\b',
+    re.IGNORECASE
+)
+
+_FREQ_BY_UNIT = {'hour': 'HOURLY', 'day': 'DAILY', 'week': 'WEEKLY', 'month': 'MONTHLY'}
+_FREQ_BY_LY = {'hourly': 'HOURLY', 'daily': 'DAILY', 'nightly': 'DAILY', 'weekly': 'WEEKLY', 'monthly': 'MONTHLY'}
+
+
+def _number(text):
+    text = text.lower()
+    return int(text) if text.isdigit() else _NUMBER_WORDS[text]
+
+
+def _weekday_codes(text):
+    return [WEEKDAY_CODES[WEEKDAYS.index(day.lower())] for day in re.findall(_WEEKDAY, text, re.IGNORECASE)]
+
+
+def has_reminder_cue(fragment):
+    """
+    True if the fragment asks for something to be done: it names a clock time or a reminder word.
+    """
+    return bool(_CLOCK_RE.search(fragment) or _REMINDER_WORD_RE.search(fragment))
+
+
+def extract_recurrence(fragment):
+    """
+    Finds a recurrence phrase in a command fragment.
+    :return: (recurrence, remainder). recurrence is None when the fragment does not
+             repeat; otherwise a dict with freq, interval, byday, limit and hour.
+             remainder is the fragment without the recurrence phrase, for date detection.
+    """
+    match = _REPEAT_RE.search(fragment)
+    if match is None:
+        return None, fragment
+
+    recurrence = {'freq': 'DAILY', 'interval': 1, 'byday': [], 'limit': None, 'hour': None}
+    if match.group('twice') or match.group('times'):
+        per_day = {'once': 1, 'twice': 2, 'thrice': 3}.get((match.group('twice') or '').lower()) \
+            or _number(match.group('times'))
+        if per_day < 1 or 24 % per_day:
+            return None, fragment
+        # Evenly spaced doses starting from the first one
+        if per_day > 1:
+            recurrence.update(freq='HOURLY', interval=24 // per_day)
+    elif match.group('n_unit'):
+        recurrence['freq'] = _FREQ_BY_UNIT[match.group('n_unit').lower()]
+        recurrence['interval'] = 2 if match.group('other') else _number(match.group('n'))
+        if recurrence['interval'] < 1:
+            return None, fragment
+    elif match.group('days') or match.group('plural_day'):
+        recurrence['freq'] = 'WEEKLY'
+        recurrence['byday'] = _weekday_codes(match.group('days') or match.group('plural_day'))
+    elif match.group('unit'):
+        unit = match.group('unit').lower()
+        if unit == 'weekday':
+            recurrence['byday'] = WEEKDAY_CODES[:5]
+        elif unit in _PART_OF_DAY_HOURS:
+            recurrence['hour'] = _PART_OF_DAY_HOURS[unit]
+        else:
+            recurrence['freq'] = _FREQ_BY_UNIT[unit]
+    else:
+        ly = match.group('ly').lower()
+        recurrence['freq'] = _FREQ_BY_LY[ly]
+        if ly == 'nightly':
+            recurrence['hour'] = _PART_OF_DAY_HOURS['night']
+
+    remainder = fragment[:match.start()] + fragment[match.end():]
+    limit = _LIMIT_RE.search(remainder)
+    if limit:
+        recurrence['limit'] = (_number(limit.group('count')), limit.group('unit').lower())
+        remainder = remainder[:limit.start()] + remainder[limit.end():]
+
+    return recurrence, ' '.join(remainder.split())
+
+
+def _rule_text(recurrence, count=None):
+    parts = [f"FREQ={recurrence['freq']}"]
+    if recurrence['interval'] > 1:
+        parts.append(f"INTERVAL={recurrence['interval']}")
+    if recurrence['byday']:
+        parts.append('BYDAY=' + ','.join(recurrence['byday']))
+    if count is not None:
+        parts.append(f'COUNT={count}')
+    return 'RRULE:' + ';'.join(parts)
+
+
+def default_start(recurrence, now):
+    """
+    First occurrence for a recurrence whose fragment gave no date: the next
+    DEFAULT_HOUR (or the named part of the day) after now.
+    """
+    hour = recurrence['hour'] if recurrence['hour'] is not None else DEFAULT_HOUR
+    start = now.replace(hour=hour, minute=0, second=0, microsecond=0)
+    return start if start > now else start + timedelta(days=1)
+
+
+def build_rrule(recurrence, start):
+    """
+    Resolves a recurrence against its first requested time.
+    :return: (first occurrence, 'RRULE:...' string for the Calendar event)
+    """
+    rule = rrulestr(_rule_text(recurrence), dtstart=start)
+    # Calendar counts DTSTART as an occurrence, so move it onto the rule ("every monday" from a Saturday)
+    start = rule.after(start, inc=True)
+
+    count = None
+    if recurrence['limit'] is not None:
+        n, unit = recurrence['limit']
+        if unit in ('time', 'dose'):
+            count = n
+        else:
+            # "for 4 weeks": the occurrences inside that window
+            end = start + relativedelta(**{unit + 's': n})
+            count = len(rrulestr(_rule_text(recurrence), dtstart=start).between(start, end, inc=False)) + 1
+    return start, _rule_text(recurrence, count)
+
@@ -0,0 +1,153 @@
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+from date_intent import DATE_WORDS, WEEKDAYS
+
+# Single-pass segmentation of dictated commands.
+#
+# One precompiled scanner walks the transcript once, left to right, and emits
+#   - fragments, split at conjunctions and sequencing words ("and", "also",
+#     "then", "after that"), sentence punctuation (". ; ! ?") and line breaks,
+#   - the email addresses in it,
+#   - for each fragment, the date/time-like tokens it contains, so fragments
+#     without any skip the date classifier.
+# Ordinary words are not tokens at all: fragments are the text between two
+# boundaries, which keeps the Python-level work per transcript small.
+# A comma or "&" alone does not split ("every monday, wednesday & friday"),
+# and "and" between two weekdays joins them instead of splitting. A full stop
+# after an abbreviation ("Dr. Smith") or an initial ("J. Smith") does not split.
+
+Fragment = namedtuple('Fragment', ['text', 'start', 'end', 'times'])
+
+_CONNECTORS = r'and\s+then|after\s+that|as\s+well\s+as|and|also|then|afterwards|additionally|finally'
+
+# Words that make a fragment worth handing to the date classifier (besides numbers):
+# everything date_intent's pre-filter looks for, plus recurrence words
+TIME_WORDS = tuple(DATE_WORDS) + (
+    'every', 'each', 'daily', 'nightly', 'hourly', 'weekly', 'monthly', 'twice', 'thrice',
+    'weekdays', 'weekday', *(day + 's' for day in WEEKDAYS),
+)
+_WEEKDAY_WORDS = frozenset(WEEKDAYS) | {day + 's' for day in WEEKDAYS}
+
+# Words whose trailing "." is not the end of a sentence
+ABBREVIATIONS = frozenset({'dr', 'mr', 'mrs', 'ms', 'st', 'vs', 'etc', 'prof', 'jr', 'sr', 'approx', 'no'})
+
+
+def _trie_pattern(words):
+    """
+    Regex matching any of `words`, nested by shared prefix ("mon(?:day|th)?...").
+    re tries the alternatives of a flat "a|b|c" one by one at every word start;
+    the trie form decides each character once.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        optional = '' in node
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        return '(?:' + body + ')?' if optional else body
+
+    return build(trie)
+
+# Only the tokens that matter; ordinary words are skipped by the regex engine
+# itself and end up in whatever fragment surrounds them
+_TOKEN_RE = re.compile(
+    r'(?<![\w.+-])(?P<email>[\w.+-]+@[\w-]+(?:\.[\w-]+)+)'
+    r'|\b(?P<connector>' + _CONNECTORS + r')\b'
+    # Numbers and clock times: "7pm", "7:30 p.m.", "19:00", "140/90", "5th"
+    r'|\b(?P<number>\d+(?:[:./]\d+)*(?:\s*(?:[ap]m\b|[ap]\.m\.)|st\b|nd\b|rd\b|th\b)?)'
+    r'|\b(?P<time>' + _trie_pattern(set(TIME_WORDS)) + r')\b'
+    r'|(?P<stop>[.!?]+(?=\s|$)|;|\n)',
+    re.IGNORECASE
+)
+_HAS_WORD_RE = re.compile(r'\w')
+_EDGE_CHARS = ' \t\r\n,:'
+
+
+def _is_abbreviation(text, dot):
+    """True if the "." at index `dot` ends an abbreviation or a single capital initial."""
+    start = dot
+    while start > 0 and text[start - 1].isalpha():
+        start -= 1
+    word = text[start:dot]
+    return word.lower() in ABBREVIATIONS or (len(word) == 1 and word.isupper())
+
+
+def _between(text, start, end):
+    """True if only spaces and commas separate two tokens."""
+    return not text[start:end].strip(' \t,')
+
+
+@lru_cache(maxsize=256)
+def segment(text):
+    """
+    Splits a transcript into fragments and pulls out email addresses, in one pass.
+    Cached, so the endpoint's email lookup and the orchestrator share one scan.
+    :return: (fragments, emails). fragments is a tuple of Fragment(text, start, end, times)
+             where times holds the fragment's date/time-like tokens; emails a tuple of addresses.
+    """
+    fragments = []
+    emails = []
+    times = []
+    start = 0              # where the fragment being built begins
+    held = None            # "and" right after a weekday: splits unless a weekday follows
+    last_weekday_end = -1
+
+    def close(end):
+        raw = text[start:end]
+        stripped = raw.strip(_EDGE_CHARS)
+        if stripped and _HAS_WORD_RE.search(stripped):
+            offset = start + raw.index(stripped)
+            fragments.append(Fragment(stripped, offset, offset + len(stripped), tuple(times)))
+        times.clear()
+
+    for match in _TOKEN_RE.finditer(text):
+        kind = match.lastgroup
+
+        if held is not None:
+            if not (kind == 'time' and match.group().lower() in _WEEKDAY_WORDS
+                    and _between(text, held.end(), match.start())):
+                close(held.start())
+                start = held.end()
+            held = None
+
+        if kind == 'time':
+            value = match.group()
+            times.append(value)
+            if value.lower() in _WEEKDAY_WORDS:
+                last_weekday_end = match.end()
+        elif kind == 'number':
+            times.append(match.group())
+        elif kind == 'email':
+            emails.append(match.group())
+        elif kind == 'connector' and match.group().lower() == 'and' \
+                and last_weekday_end >= 0 and _between(text, last_weekday_end, match.start()):
+            # Decided by the next token: "monday and thursday" stays together
+            held = match
+        elif kind == 'stop' and match.group() == '.' and _is_abbreviation(text, match.start()):
+            continue
+        else:
+            close(match.start())
+            start = match.end()
+
+    if held is not None:
+        close(held.start())
+        start = held.end()
+    close(len(text))
+    return tuple(fragments), tuple(emails)
+
+
+def find_email(text):
+    """
+    The first email address in a transcript, or None.
+    """
+    emails = segment(text)[1]
+    return emails[0] if emails else None
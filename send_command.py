@@ -1,11 +1,35 @@
 import requests
 import argparse
+import json
+import math
 import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
 
 # Default settings
 DEFAULT_URL = "http://localhost:8000/process-command"
 DEFAULT_DOCTOR = "starlight9219@gmail.com"
 
+# Load mode (--load): replays a corpus of commands against the server.
+#
+#   closed loop  --concurrency clients, each sending its next request as soon
+#                as the previous one answered (measures capacity)
+#   open loop    --rate requests/second on a fixed schedule whatever the server
+#                does; latency counts from the scheduled send time, so a backed-up
+#                server shows up as latency instead of quietly lowering the rate
+#
+# Every client thread keeps its own keep-alive session. Each request gets a
+# fresh Idempotency-Key so the server's replay cache never answers for it.
+
+# Fields a corpus line's text is taken from, first match wins
+CORPUS_TEXT_FIELDS = ("text", "prompt", "summary", "body", "title")
+LOAD_TIMEOUT_SECONDS = 30
+
 def send_to_speakspace(text, doctor_email, url):
     print(f"Sending: '{text}'")
     print(f"To: {doctor_email}")
@@ -33,11 +57,259 @@ def send_to_speakspace(text, doctor_email, url):
     except Exception as e:
         print(f"\nERROR: {e}")
 
+def load_corpus(path, doctor_email=DEFAULT_DOCTOR):
+    """
+    Reads commands to replay: JSON lines (text from CORPUS_TEXT_FIELDS, optional
+    doctor_email) or plain text, one command per line.
+    :return: [(text, doctor_email)]
+    """
+    corpus = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                entry = line
+            if not isinstance(entry, dict):
+                corpus.append((str(entry), doctor_email))
+                continue
+            text = next((entry[field] for field in CORPUS_TEXT_FIELDS if entry.get(field)), None)
+            if text:
+                corpus.append((text, entry.get("doctor_email") or doctor_email))
+    if not corpus:
+        raise ValueError(f"No commands found in {path}")
+    return corpus
+
+def build_payload(url, text, doctor_email):
+    """
+    Request body for the endpoint `url` points at (/send-summary or /process-command).
+    """
+    if urlparse(url).path.rstrip("/").endswith("/send-summary"):
+        return {"doctor_email": doctor_email, "summary": text}
+    return {"text": text, "doctor_email": doctor_email}
+
+def percentile(sorted_samples, p):
+    """
+    Nearest-rank percentile of already sorted samples (p in 0..1).
+    """
+    if not sorted_samples:
+        return None
+    rank = max(1, math.ceil(p * len(sorted_samples)))
+    return sorted_samples[min(rank, len(sorted_samples)) - 1]
+
+class LoadRecorder:
+    """
+    Collects per-request outcomes from the client threads.
+    """
+
+    def __init__(self):
+        self.latencies = []     # seconds, one per finished request (failed ones included)
+        self.ok = 0
+        self.errors = {}        # "HTTP 503" / exception name -> count
+        self._lock = threading.Lock()
+
+    def record(self, latency, error=None):
+        with self._lock:
+            self.latencies.append(latency)
+            if error is None:
+                self.ok += 1
+            else:
+                self.errors[error] = self.errors.get(error, 0) + 1
+
+    def report(self, elapsed):
+        with self._lock:
+            samples = sorted(self.latencies)
+            ok, errors = self.ok, dict(self.errors)
+
+        def ms(value):
+            return round(value * 1000, 3) if value is not None else None
+
+        return {
+            "requests": len(samples),
+            "ok": ok,
+            "failed": len(samples) - ok,
+            "errors": errors,
+            "duration_seconds": round(elapsed, 3),
+            "throughput_rps": round(len(samples) / elapsed, 2) if elapsed > 0 else 0.0,
+            "latency_ms": {
+                "p50": ms(percentile(samples, 0.50)),
+                "p95": ms(percentile(samples, 0.95)),
+                "p99": ms(percentile(samples, 0.99)),
+                "mean": ms(sum(samples) / len(samples)) if samples else None,
+                "max": ms(samples[-1] if samples else None),
+            },
+        }
+
+def _new_session():
+    session = requests.Session()
+    # One keep-alive connection per client thread, reused for all its requests
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1, max_retries=0)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+class _LoadClient:
+    """
+    Sends requests over a per-thread keep-alive session and records them.
+    """
+
+    def __init__(self, url, recorder, tenant=None, timeout=LOAD_TIMEOUT_SECONDS, tenant_key=None):
+        self.url = url
+        self.recorder = recorder
+        self.headers = {"X-Tenant-ID": tenant} if tenant else {}
+        if tenant and tenant_key:
+            self.headers["X-Tenant-Key"] = tenant_key
+        self.timeout = timeout
+        self._local = threading.local()
+        self.sessions = []
+        self._sessions_lock = threading.Lock()
+
+    def _session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = _new_session()
+            with self._sessions_lock:
+                self.sessions.append(session)
+        return session
+
+    def send(self, payload, started=None):
+        """
+        :param started: perf_counter the latency counts from (default: now)
+        """
+        started = time.perf_counter() if started is None else started
+        headers = {**self.headers, "Idempotency-Key": uuid.uuid4().hex}
+        error = None
+        try:
+            response = self._session().post(self.url, json=payload, headers=headers, timeout=self.timeout)
+            response.content  # read the body so the connection goes back to the pool
+            if response.status_code >= 400:
+                error = f"HTTP {response.status_code}"
+        except requests.exceptions.RequestException as e:
+            error = type(e).__name__
+        self.recorder.record(time.perf_counter() - started, error)
+
+    def close(self):
+        for session in self.sessions:
+            session.close()
+
+def run_load(url, corpus, mode="closed", concurrency=8, rate=None, duration=None, total=None,
+             tenant=None, timeout=LOAD_TIMEOUT_SECONDS, tenant_key=None):
+    """
+    Replays `corpus` ([(text, doctor_email)], cycled) against `url`.
+    Stops after `duration` seconds or `total` requests, whichever comes first.
+    :param mode: "closed" (`concurrency` clients back to back) or "open" (`rate` requests/second,
+                 at most `concurrency` in flight; the rest wait and their wait counts as latency)
+    :return: The report dict (see LoadRecorder.report) plus the run settings
+    """
+    if duration is None and total is None:
+        raise ValueError("Give a duration or a number of requests")
+    if mode == "open" and not rate:
+        raise ValueError("Open-loop mode needs a rate")
+    payloads = [build_payload(url, text, doctor_email) for text, doctor_email in corpus]
+    recorder = LoadRecorder()
+    client = _LoadClient(url, recorder, tenant, timeout, tenant_key)
+    counter = iter(range(total if total is not None else sys.maxsize))
+    counter_lock = threading.Lock()
+
+    start = time.perf_counter()
+    deadline = start + duration if duration is not None else None
+
+    def next_index():
+        if deadline is not None and time.perf_counter() >= deadline:
+            return None
+        with counter_lock:
+            return next(counter, None)
+
+    try:
+        if mode == "closed":
+            def closed_client():
+                while True:
+                    i = next_index()
+                    if i is None:
+                        return
+                    client.send(payloads[i % len(payloads)])
+
+            threads = [threading.Thread(target=closed_client, daemon=True) for _ in range(concurrency)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        elif mode == "open":
+            with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="speakspace-load") as pool:
+                interval = 1.0 / rate
+                while True:
+                    i = next_index()
+                    if i is None:
+                        break
+                    scheduled = start + i * interval
+                    delay = scheduled - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                    if deadline is not None and scheduled >= deadline:
+                        break
+                    pool.submit(client.send, payloads[i % len(payloads)], scheduled)
+        else:
+            raise ValueError(f"Unknown load mode: {mode}")
+    finally:
+        client.close()
+
+    report = recorder.report(time.perf_counter() - start)
+    report.update({
+        "url": url,
+        "mode": mode,
+        "concurrency": concurrency,
+        "target_rate_rps": rate if mode == "open" else None,
+        "connections": len(client.sessions),
+        "corpus_size": len(corpus),
+        "tenant": tenant,
+        "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    })
+    return report
+
+def print_report(report):
+    latency = report["latency_ms"]
+    print(f"{report['mode']}-loop load on {report['url']}: {report['requests']} requests "
+          f"in {report['duration_seconds']}s ({report['throughput_rps']} req/s)")
+    print(f"  ok {report['ok']}, failed {report['failed']}"
+          + "".join(f", {error}: {count}" for error, count in sorted(report["errors"].items())))
+    print(f"  latency ms  p50 {latency['p50']}  p95 {latency['p95']}  p99 {latency['p99']}  max {latency['max']}")
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Send a command to SpeakSpace Orchestrator")
-    parser.add_argument("text", help="The natural language text")
+    parser.add_argument("text", nargs="?", help="The natural language text")
     parser.add_argument("--doctor", default=DEFAULT_DOCTOR, help="Doctor's email address")
-    parser.add_argument("--url", default=DEFAULT_URL, help="Server URL")
-    
+    parser.add_argument("--url", default=DEFAULT_URL, help="Server URL (/process-command or /send-summary)")
+    load = parser.add_argument_group("load mode")
+    load.add_argument("--load", metavar="CORPUS", help="Replay commands from a JSONL or text file")
+    load.add_argument("--mode", choices=("closed", "open"), default="closed",
+                      help="closed: N clients back to back; open: fixed arrival rate")
+    load.add_argument("--concurrency", type=int, default=8, help="Clients (closed) or max in flight (open)")
+    load.add_argument("--rate", type=float, help="Requests per second (open loop)")
+    load.add_argument("--duration", type=float, help="Seconds to run")
+    load.add_argument("--requests", type=int, help="Requests to send")
+    load.add_argument("--tenant", help="X-Tenant-ID header to send")
+    load.add_argument("--tenant-key", help="X-Tenant-Key header to send with --tenant")
+    load.add_argument("--json", metavar="FILE", help="Write the report as JSON to FILE ('-' for stdout)")
+
     args = parser.parse_args()
-    send_to_speakspace(args.text, args.doctor, args.url)
+
+    if args.load:
+        if args.duration is None and args.requests is None:
+            args.duration = 30
+        report = run_load(args.url, load_corpus(args.load, args.doctor), mode=args.mode,
+                          concurrency=args.concurrency, rate=args.rate, duration=args.duration,
+                          total=args.requests, tenant=args.tenant, tenant_key=args.tenant_key)
+        if args.json == "-":
+            print(json.dumps(report, indent=2))
+        else:
+            print_report(report)
+            if args.json:
+                with open(args.json, "w") as f:
+                    json.dump(report, f, indent=2)
+    elif args.text:
+        send_to_speakspace(args.text, args.doctor, args.url)
+    else:
+        parser.error("give the text to send, or --load CORPUS")
@@ -0,0 +1,151 @@
+import html
+import time
+import string
+from datetime import datetime
+
+# Precompiled email templates.
+#
+# Each template's plain-text and HTML skeletons are split into static chunks
+# and slots once, at import time; rendering only escapes the dynamic values
+# and joins. Slots are written as {name} or {name:escaper} where the escaper
+# (see HTML_ESCAPERS) decides how the value is escaped in the HTML version.
+# Plain-text slots are inserted as-is.
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+HTML_ESCAPERS = {
+    '': html.escape,
+    'multiline': lambda value: html.escape(value).replace('\n', '<br>'),
+    'raw': lambda value: value,
+}
+
+_TEXT_METADATA = """Patient Name: {patient_name}
+Patient ID: {patient_id}
+Date: {date}
+--------------------
+"""
+
+_HTML_OPEN = "<div style='font-family: Arial, sans-serif; color: #333;'>\n"
+
+_HTML_METADATA = """<div style='background-color: #f4f4f4; padding: 10px; border-radius: 5px; margin-bottom: 20px;'>
+<p><strong>Patient Name:</strong> {patient_name}</p>
+<p><strong>Patient ID:</strong> {patient_id}</p>
+<p><strong>Date:</strong> {date:raw}</p>
+</div>
+"""
+
+_HTML_BODY = """<h3>{title}</h3>
+<div style='line-height: 1.5;'>{{summary:multiline}}</div>
+<br><hr>
+<p style='font-size: 12px; color: #888;'>Generated by SpeakSpace Health Assistant</p>
+</div>"""
+
+_TEXT_BODY = """{title}:
+{{summary}}"""
+
+
+class CompiledTemplate:
+    """
+    A template source parsed once into (literal, slot, escaper) parts.
+    """
+
+    def __init__(self, source, escapers=None):
+        self.source = source
+        self._parts = []
+        for literal, field, spec, _conversion in string.Formatter().parse(source):
+            if field is None:
+                self._parts.append((literal, None, None))
+            else:
+                escape = escapers[spec or ''] if escapers is not None else None
+                self._parts.append((literal, field, escape))
+
+    def render(self, values):
+        out = []
+        for literal, field, escape in self._parts:
+            out.append(literal)
+            if field is not None:
+                value = values[field]
+                out.append(escape(value) if escape is not None else value)
+        return "".join(out)
+
+
+class EmailTemplate:
+    """
+    Plain-text and HTML versions of one email, with and without the patient metadata block.
+    """
+
+    def __init__(self, name, title):
+        self.name = name
+        text_body = _TEXT_BODY.format(title=title)
+        html_body = _HTML_BODY.format(title=html.escape(title))
+        self.text = {
+            True: CompiledTemplate(_TEXT_METADATA + text_body),
+            False: CompiledTemplate(text_body),
+        }
+        self.html = {
+            True: CompiledTemplate(_HTML_OPEN + _HTML_METADATA + html_body, HTML_ESCAPERS),
+            False: CompiledTemplate(_HTML_OPEN + html_body, HTML_ESCAPERS),
+        }
+
+    def render(self, summary, patient_name=None, patient_id=None, include_metadata=True, timestamp=None):
+        """
+        Returns a tuple of (plain_text, html_content).
+        """
+        values = {
+            'summary': summary,
+            'patient_name': patient_name if patient_name else 'N/A',
+            'patient_id': patient_id if patient_id else 'N/A',
+            'date': timestamp or current_timestamp(),
+        }
+        return self.text[include_metadata].render(values), self.html[include_metadata].render(values)
+
+
+TEMPLATES = {
+    'summary': EmailTemplate('summary', 'Summary Report'),
+    'symptom_report': EmailTemplate('symptom_report', 'Symptom Report'),
+    'reminder_confirmation': EmailTemplate('reminder_confirmation', 'Reminder Confirmation'),
+}
+
+_timestamp_cache = (None, '')
+
+
+def current_timestamp():
+    """
+    The current local time as TIMESTAMP_FORMAT, formatted at most once per second.
+    """
+    global _timestamp_cache
+    second = int(time.time())
+    cached_second, formatted = _timestamp_cache
+    if cached_second != second:
+        formatted = datetime.fromtimestamp(second).strftime(TIMESTAMP_FORMAT)
+        _timestamp_cache = (second, formatted)
+    return formatted
+
+
+def get_template(name):
+    try:
+        return TEMPLATES[name]
+    except KeyError:
+        raise ValueError(f"Unknown email template: {name}")
+
+
+def render(name, summary, patient_name=None, patient_id=None, include_metadata=True):
+    """
+    Renders a named template. Returns a tuple of (plain_text, html_content).
+    """
+    return get_template(name).render(summary, patient_name, patient_id, include_metadata)
+
+
+def render_many(name, items, include_metadata=True):
+    """
+    Renders many emails with one template and one timestamp.
+    :param items: Iterable of dicts with summary and optional patient_name/patient_id
+    :return: List of (plain_text, html_content) tuples
+    """
+    template = get_template(name)
+    timestamp = current_timestamp()
+    return [
+        template.render(item['summary'], item.get('patient_name'), item.get('patient_id'),
+                        include_metadata, timestamp)
+        for item in items
+    ]
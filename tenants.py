@@ -0,0 +1,349 @@
+import os
+import hmac
+import json
+import hashlib
+import threading
+from collections import OrderedDict, namedtuple
+
+from google.oauth2.credentials import Credentials
+
+import metrics
+import google_services
+from auth_config import SCOPES
+from credential_manager import CredentialManager, token_file_lock
+
+# Patients ("tenants") served by one deployment, each with their own profile
+# and Google account.
+#
+# The registry is a JSON-lines file, one profile per line:
+#   {"tenant_id": "p-1001", "patient_name": "Jane D", "patient_id": "1001",
+#    "token_file": "tokens/p-1001.json", "key_sha256": "<sha256 hex of the tenant key>"}
+# ("token": {...authorized user info...} may replace "token_file"). Relative
+# token files are resolved next to the registry. Updates are appends: a later
+# line for a tenant replaces the earlier one, {"tenant_id": ..., "deleted": true}
+# removes it. In memory we only keep tenant_id -> offset of its latest line;
+# profiles are read on demand, and lines appended by another process are
+# indexed on the next lookup without rereading the file.
+#
+# Google clients are built per tenant on first use and kept for the
+# TENANT_CLIENT_CACHE_SIZE most recently used tenants; past that the least
+# recently used tenant's clients and credentials are dropped, so memory does
+# not grow with the number of patients.
+#
+# Requests name their tenant with the X-Tenant-ID header and prove they may act
+# for it with the X-Tenant-Key header, checked against the profile's key_sha256
+# (only the hash is stored). A profile without key_sha256 accepts no requests.
+# Without X-Tenant-ID the single-patient setup is used: DEFAULT_PATIENT and
+# token.json / GOOGLE_TOKEN_DATA.
+
+TENANT_DB = os.environ.get('SPEAKSPACE_TENANT_DB', 'tenants.jsonl')
+TENANT_CLIENT_CACHE_SIZE = int(os.environ.get('SPEAKSPACE_TENANT_CLIENT_CACHE', 256))
+TENANT_HEADER = 'X-Tenant-ID'
+TENANT_KEY_HEADER = 'X-Tenant-Key'
+
+Patient = namedtuple('Patient', ['name', 'patient_id', 'tenant_id'], defaults=(None,))
+
+# Patient the summaries are about when a request names no tenant
+DEFAULT_PATIENT = Patient("Anusha S", "54321")
+
+
+class UnknownTenant(LookupError):
+    """Raised for a tenant id that is not in the registry."""
+
+
+class TenantAuthError(PermissionError):
+    """Raised when a request names a tenant without that tenant's key."""
+
+
+class TenantRegistry:
+    """
+    :param path: JSON-lines file holding the tenant profiles
+    """
+
+    def __init__(self, path=TENANT_DB):
+        self.path = path
+        self._offsets = {}      # tenant_id -> byte offset of its latest line
+        self._indexed = 0       # bytes of the file indexed so far
+        self._file_id = None    # (st_dev, st_ino) of the indexed file
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        """
+        Indexes lines appended since the last call; starts over if the file was replaced or truncated.
+        """
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            self._offsets, self._indexed, self._file_id = {}, 0, None
+            return
+        file_id = (stat.st_dev, stat.st_ino)
+        if file_id != self._file_id or stat.st_size < self._indexed:
+            self._offsets, self._indexed, self._file_id = {}, 0, file_id
+        if stat.st_size == self._indexed:
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(self._indexed)
+            offset = self._indexed
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break   # a write still in progress; picked up next time
+                try:
+                    record = json.loads(line)
+                    tenant_id = record['tenant_id']
+                except (ValueError, KeyError, TypeError):
+                    if line.strip():
+                        print(f"Skipping malformed tenant record at byte {offset} of {self.path}")
+                else:
+                    if record.get('deleted'):
+                        self._offsets.pop(tenant_id, None)
+                    else:
+                        self._offsets[tenant_id] = offset
+                offset += len(line)
+        self._indexed = offset
+
+    def version(self, tenant_id):
+        """
+        Offset of the tenant's current profile line (changes whenever it is updated), or None.
+        """
+        with self._lock:
+            self._refresh()
+            return self._offsets.get(tenant_id)
+
+    def get(self, tenant_id):
+        """
+        The tenant's profile dict, or None if it is not registered.
+        """
+        with self._lock:
+            self._refresh()
+            offset = self._offsets.get(tenant_id)
+            if offset is None:
+                return None
+            with open(self.path, 'rb') as f:
+                f.seek(offset)
+                return json.loads(f.readline())
+
+    def put(self, profile):
+        """
+        Adds or replaces a tenant's profile (appends a line).
+        """
+        if not profile.get('tenant_id'):
+            raise ValueError("Tenant profile needs a tenant_id")
+        self._append(profile)
+
+    def delete(self, tenant_id):
+        self._append({'tenant_id': tenant_id, 'deleted': True})
+
+    def _append(self, record):
+        line = json.dumps(record, separators=(',', ':')) + '\n'
+        with token_file_lock(self.path), open(self.path, 'a') as f:
+            f.write(line)
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return len(self._offsets)
+
+    def token_path(self, profile):
+        token_file = profile.get('token_file')
+        if not token_file:
+            return None
+        return os.path.join(os.path.dirname(os.path.abspath(self.path)), token_file)
+
+
+class _TenantClients:
+    """
+    One tenant's credentials, shared HTTP transport and built API clients.
+    """
+
+    def __init__(self, tenant_id, version, creds, manager):
+        self.tenant_id = tenant_id
+        self.version = version
+        self.creds = creds
+        self.manager = manager
+        self.http = google_services.new_http(creds, manager)
+        self.services = {}      # (api, version) -> client
+        self.lock = threading.Lock()
+
+    def service(self, api, version):
+        with self.lock:
+            service = self.services.get((api, version))
+            if service is None:
+                with metrics.stage('discovery_build'):
+                    service = google_services.build_service(api, version, self.creds, http=self.http)
+                google_services.set_quota_user(service, self.tenant_id)
+                self.services[(api, version)] = service
+            return service
+
+    def close(self):
+        self.manager.stop()
+        close = getattr(self.http, 'close', None)
+        if close is not None:
+            close()
+
+
+class TenantClientCache:
+    """
+    LRU of per-tenant Google clients.
+    :param registry: TenantRegistry the tenants' tokens are looked up in
+    :param capacity: Tenants whose clients are kept built
+    """
+
+    def __init__(self, registry, capacity=TENANT_CLIENT_CACHE_SIZE):
+        self.registry = registry
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()   # tenant_id -> _TenantClients, least recently used first
+        self._lock = threading.Lock()
+
+    def _load(self, tenant_id, version):
+        profile = self.registry.get(tenant_id)
+        if profile is None:
+            raise UnknownTenant(f"Unknown tenant: {tenant_id}")
+        token_path = self.registry.token_path(profile)
+        with metrics.stage('load_credentials'):
+            if token_path is not None:
+                creds = Credentials.from_authorized_user_file(token_path, SCOPES)
+            elif profile.get('token'):
+                creds = Credentials.from_authorized_user_info(profile['token'], SCOPES)
+            else:
+                raise UnknownTenant(f"Tenant {tenant_id} has no Google token")
+        # No background refresh thread per tenant: the token is refreshed on the
+        # request path when it expired (single-flight, saved back to token_file)
+        return _TenantClients(tenant_id, version, creds, CredentialManager(creds, token_path))
+
+    def clients(self, tenant_id):
+        """
+        The tenant's clients, loading its credentials on first use or after its profile changed.
+        """
+        version = self.registry.version(tenant_id)
+        if version is None:
+            raise UnknownTenant(f"Unknown tenant: {tenant_id}")
+        with self._lock:
+            entry = self._entries.get(tenant_id)
+            if entry is not None and entry.version == version:
+                self._entries.move_to_end(tenant_id)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        # Credentials are read outside the lock so other tenants are not held up
+        loaded = self._load(tenant_id, version)
+        evicted = []
+        with self._lock:
+            entry = self._entries.get(tenant_id)
+            if entry is not None and entry.version == version:
+                # Another thread loaded it meanwhile
+                self._entries.move_to_end(tenant_id)
+                evicted.append(loaded)
+            else:
+                if entry is not None:
+                    evicted.append(entry)
+                entry = self._entries[tenant_id] = loaded
+                while len(self._entries) > self.capacity:
+                    evicted.append(self._entries.popitem(last=False)[1])
+                    self.evictions += 1
+        for stale in evicted:
+            stale.close()
+        return entry
+
+    def get_service(self, tenant_id, api, version):
+        return self.clients(tenant_id).service(api, version)
+
+    def clear(self):
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for entry in entries:
+            entry.close()
+
+    def state(self):
+        with self._lock:
+            return {
+                'cached_tenants': len(self._entries),
+                'capacity': self.capacity,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+_registry = None
+_clients = None
+_tenants_lock = threading.Lock()
+
+
+def get_tenant_registry():
+    global _registry
+    with _tenants_lock:
+        if _registry is None:
+            _registry = TenantRegistry(TENANT_DB)
+        return _registry
+
+
+def get_tenant_clients():
+    global _clients
+    registry = get_tenant_registry()
+    with _tenants_lock:
+        if _clients is None:
+            _clients = TenantClientCache(registry, TENANT_CLIENT_CACHE_SIZE)
+        return _clients
+
+
+def get_tenant_service(tenant_id, api, version):
+    """
+    The tenant's client for an API, built on first use (see TenantClientCache).
+    """
+    return get_tenant_clients().get_service(tenant_id, api, version)
+
+
+def hash_tenant_key(key):
+    """
+    The key_sha256 value to store in a profile for the tenant key `key`.
+    """
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def authenticate_tenant(tenant_id, key):
+    """
+    Checks that `key` is the tenant's key before anything is done on its behalf.
+    :raises UnknownTenant: The tenant is not registered
+    :raises TenantAuthError: The key is missing or wrong, or the profile has none
+    """
+    profile = get_tenant_registry().get(tenant_id)
+    if profile is None:
+        raise UnknownTenant(f"Unknown tenant: {tenant_id}")
+    expected = profile.get('key_sha256')
+    if not expected or not key or not hmac.compare_digest(hash_tenant_key(key), str(expected).lower()):
+        raise TenantAuthError(f"Missing or wrong {TENANT_KEY_HEADER} for tenant {tenant_id}")
+
+
+def get_patient(tenant_id=None):
+    """
+    The Patient a request is about: the tenant's profile, or DEFAULT_PATIENT without a tenant.
+    """
+    if tenant_id is None:
+        return DEFAULT_PATIENT
+    profile = get_tenant_registry().get(tenant_id)
+    if profile is None:
+        raise UnknownTenant(f"Unknown tenant: {tenant_id}")
+    return Patient(profile.get('patient_name') or tenant_id, profile.get('patient_id') or tenant_id, tenant_id)
+
+
+def reset_tenants():
+    """
+    Drops the registry index and every cached tenant client.
+    """
+    global _registry, _clients
+    with _tenants_lock:
+        clients, _registry, _clients = _clients, None, None
+    if clients is not None:
+        clients.clear()
+
+
+def tenant_state():
+    return {
+        'registered_tenants': len(get_tenant_registry()),
+        **get_tenant_clients().state(),
+    }
@@ -0,0 +1,113 @@
+from datetime import datetime
+from unittest.mock import MagicMock, patch
+from googleapiclient.errors import HttpError
+
+from calendar_client import build_event_body, create_events_batch
+
+
+class FakeBatch:
+    """
+    Stand-in for BatchHttpRequest: answers each queued request via the callback.
+    """
+
+    def __init__(self, callback, responder):
+        self.callback = callback
+        self.responder = responder
+        self.requests = []
+
+    def add(self, request, request_id=None):
+        self.requests.append(request_id)
+
+    def execute(self):
+        for request_id in self.requests:
+            response, exception = self.responder(int(request_id))
+            self.callback(request_id, response, exception)
+
+
+def _http_error(status):
+    resp = MagicMock()
+    resp.status = status
+    return HttpError(resp=resp, content=b'error')
+
+
+def _events(n):
+    return [{'summary': f'reminder {i}', 'start_time': datetime(2026, 10, 18, 8 + i)} for i in range(n)]
+
+
+def test_create_events_batch_single_request():
+    """
+    All inserts go out in one batch and come back in order.
+    """
+    service = MagicMock()
+    batches = []
+
+    def new_batch(callback=None):
+        batch = FakeBatch(callback, lambda i: ({'htmlLink': f'link{i}'}, None))
+        batches.append(batch)
+        return batch
+
+    service.new_batch_http_request.side_effect = new_batch
+
+    results = create_events_batch(service, _events(3))
+
+    assert len(batches) == 1
+    assert [r['htmlLink'] for r in results] == ['link0', 'link1', 'link2']
+    # No individual fallback calls
+    service.events.return_value.insert.return_value.execute.assert_not_called()
+
+
+def test_create_events_batch_falls_back_for_rejected_items():
+    """
+    Only the item the batch rejected is retried individually.
+    """
+    service = MagicMock()
+    service.new_batch_http_request.side_effect = lambda callback=None: FakeBatch(
+        callback, lambda i: (None, _http_error(503)) if i == 1 else ({'htmlLink': f'link{i}'}, None)
+    )
+    service.events.return_value.insert.return_value.execute.return_value = {'htmlLink': 'retried'}
+
+    results = create_events_batch(service, _events(3))
+
+    assert [r['htmlLink'] for r in results] == ['link0', 'retried', 'link2']
+    assert service.events.return_value.insert.return_value.execute.call_count == 1
+
+
+@patch('rate_limit.time.sleep')
+def test_create_events_batch_does_not_repeat_inserts_google_may_have_made(mock_sleep):
+    """
+    A batch that timed out may have created its events: nothing is inserted again.
+    """
+    service = MagicMock()
+    batch = MagicMock()
+    batch.execute.side_effect = TimeoutError("read timed out")
+    service.new_batch_http_request.return_value = batch
+
+    results = create_events_batch(service, _events(2))
+
+    assert all(isinstance(r, TimeoutError) for r in results)
+    assert batch.execute.call_count == 1
+    service.events.return_value.insert.return_value.execute.assert_not_called()
+
+
+@patch('calendar_client.MAX_BATCH_SIZE', 2)
+def test_create_events_batch_chunks_large_requests():
+    service = MagicMock()
+    batches = []
+
+    def new_batch(callback=None):
+        batch = FakeBatch(callback, lambda i: ({'htmlLink': f'link{i}'}, None))
+        batches.append(batch)
+        return batch
+
+    service.new_batch_http_request.side_effect = new_batch
+
+    results = create_events_batch(service, _events(5))
+
+    assert [len(b.requests) for b in batches] == [2, 2, 1]
+    assert len(results) == 5
+
+
+def test_build_event_body_adds_recurrence():
+    body = build_event_body('take insulin', datetime(2026, 10, 18, 20, 0), recurrence='RRULE:FREQ=DAILY')
+    assert body['recurrence'] == ['RRULE:FREQ=DAILY']
+    assert 'recurrence' not in build_event_body('take insulin', datetime(2026, 10, 18, 20, 0))
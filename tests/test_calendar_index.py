@@ -0,0 +1,177 @@
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock, patch
+
+import pytest
+from googleapiclient.errors import HttpError
+
+import orchestrator
+from calendar_index import CalendarIndex, normalise_title
+
+
+def _event(event_id, summary, start, minutes=30, **extra):
+    return {
+        'id': event_id,
+        'status': 'confirmed',
+        'summary': summary,
+        'start': {'dateTime': start.isoformat()},
+        'end': {'dateTime': (start + timedelta(minutes=minutes)).isoformat()},
+        'htmlLink': f'https://calendar.example.com/{event_id}',
+        **extra,
+    }
+
+
+class FakeCalendar:
+    """
+    Answers events.list from queued pages; records the parameters of each call.
+    """
+
+    def __init__(self):
+        self.pages = []
+        self.calls = []
+
+    def events(self):
+        return self
+
+    def list(self, **params):
+        self.calls.append(params)
+        request = MagicMock()
+        page = self.pages.pop(0)
+        if isinstance(page, Exception):
+            request.execute.side_effect = page
+        else:
+            request.execute.return_value = page
+        return request
+
+
+def _gone():
+    resp = MagicMock()
+    resp.status = 410
+    return HttpError(resp=resp, content=b'{"error": {"code": 410, "message": "Sync token is no longer valid"}}')
+
+
+TOMORROW_7PM = (datetime.now() + timedelta(days=1)).replace(hour=19, minute=0, second=0, microsecond=0)
+
+
+@pytest.fixture
+def calendar():
+    return FakeCalendar()
+
+
+@pytest.fixture
+def index(calendar):
+    with patch.dict('rate_limit.QUOTAS', {'calendar': (1e9, 1e9)}):
+        yield CalendarIndex(lambda: calendar)
+
+
+def test_full_sync_pages_through_calendar(index, calendar):
+    calendar.pages = [
+        {'items': [_event('a', 'take insulin at 7pm', TOMORROW_7PM)], 'nextPageToken': 'p2'},
+        {'items': [_event('b', 'dentist', TOMORROW_7PM + timedelta(days=3)),
+                   {'id': 'c', 'status': 'confirmed', 'summary': 'holiday', 'start': {'date': '2026-12-24'},
+                    'end': {'date': '2026-12-25'}}],
+         'nextSyncToken': 'sync-1'},
+    ]
+
+    assert index.sync() is True
+
+    assert index.sync_token == 'sync-1'
+    assert index.state()['events'] == 2  # the all-day event is not a reminder
+    assert calendar.calls[1]['pageToken'] == 'p2'
+    assert 'syncToken' not in calendar.calls[0]
+
+
+def test_incremental_sync_applies_changes(index, calendar):
+    calendar.pages = [{'items': [_event('a', 'take insulin', TOMORROW_7PM),
+                                 _event('b', 'dentist', TOMORROW_7PM)], 'nextSyncToken': 'sync-1'},
+                      {'items': [{'id': 'a', 'status': 'cancelled'},
+                                 _event('c', 'blood test', TOMORROW_7PM)], 'nextSyncToken': 'sync-2'}]
+    index.sync()
+    index.sync()
+
+    assert calendar.calls[1]['syncToken'] == 'sync-1'
+    assert index.sync_token == 'sync-2'
+    assert index.find('take insulin') == []
+    assert [e.event_id for e in index.find('blood test')] == ['c']
+    assert index.state()['incremental_syncs'] == 1
+
+
+def test_expired_sync_token_triggers_full_sync(index, calendar):
+    calendar.pages = [{'items': [_event('a', 'take insulin', TOMORROW_7PM)], 'nextSyncToken': 'sync-1'},
+                      _gone(),
+                      {'items': [_event('b', 'dentist', TOMORROW_7PM)], 'nextSyncToken': 'sync-2'}]
+    index.sync()
+    index.sync()
+
+    assert index.sync_token == 'sync-2'
+    assert index.find('take insulin') == []
+    assert index.state()['full_syncs'] == 2
+
+
+def test_find_duplicate_matches_reworded_reminders(index, calendar):
+    assert index.find_duplicate('take insulin at 7pm', TOMORROW_7PM) is None  # not synced yet
+
+    calendar.pages = [{'items': [
+        _event('a', 'Take insulin at 7pm', TOMORROW_7PM),
+        _event('b', 'walk every day at 8am', TOMORROW_7PM.replace(hour=8), recurrence=['RRULE:FREQ=DAILY']),
+    ], 'nextSyncToken': 'sync-1'}]
+    index.sync()
+
+    assert index.find_duplicate('remind me to take insulin tomorrow at 19:00', TOMORROW_7PM)['id'] == 'a'
+    assert index.find_duplicate('take insulin at 9pm', TOMORROW_7PM + timedelta(hours=2)) is None
+    assert index.find_duplicate('take metformin at 7pm', TOMORROW_7PM) is None
+    # A one-off reminder on an occurrence of an existing series
+    assert index.find_duplicate('walk at 8am', TOMORROW_7PM.replace(hour=8) + timedelta(days=4))['id'] == 'b'
+    # The same series again, or a different one
+    assert index.find_duplicate('walk daily', TOMORROW_7PM.replace(hour=8), 'RRULE:FREQ=DAILY')['id'] == 'b'
+    assert index.find_duplicate('walk weekly', TOMORROW_7PM.replace(hour=8), 'RRULE:FREQ=WEEKLY') is None
+
+
+def test_old_events_are_evicted_and_size_is_capped(calendar):
+    now = datetime.now()
+    calendar.pages = [{'items': [
+        _event('old', 'physio', now - timedelta(days=5)),
+        _event('ended-series', 'antibiotics', now - timedelta(days=9), recurrence=['RRULE:FREQ=DAILY;COUNT=5']),
+        *[_event(f'e{i}', f'reminder {i}', now + timedelta(days=i)) for i in range(1, 6)],
+    ], 'nextSyncToken': 'sync-1'}]
+    index = CalendarIndex(lambda: calendar, retention_days=2, max_events=3)
+    with patch.dict('rate_limit.QUOTAS', {'calendar': (1e9, 1e9)}):
+        index.sync()
+
+    assert index.find('physio') == [] and index.find('antibiotics') == []
+    # Over the cap, the earliest events go first
+    assert sorted(e.event_id for t in ('reminder 3', 'reminder 4', 'reminder 5') for e in index.find(t)) == \
+        ['e3', 'e4', 'e5']
+    assert index.state()['events'] == 3
+
+
+def test_not_authorised_skips_sync():
+    index = CalendarIndex(lambda: None)
+    assert index.sync() is False
+    assert not index.ready
+
+
+def test_normalise_title():
+    assert normalise_title("Please remind me to take insulin at 7pm!") == "take insulin"
+    assert normalise_title("take insulin every day at 8pm for 2 weeks") == "take insulin"
+
+
+@patch('orchestrator.get_calendar_service')
+@patch('orchestrator.create_event')
+def test_process_command_skips_existing_reminder(mock_create_event, mock_get_cal, index, calendar):
+    calendar.pages = [{'items': [_event('a', 'take insulin at 7pm', TOMORROW_7PM)], 'nextSyncToken': 'sync-1'}]
+    index.sync()
+    mock_create_event.return_value = _event('new', 'blood test at 9am', TOMORROW_7PM.replace(hour=9))
+
+    with patch('orchestrator.get_calendar_index', return_value=index), \
+         patch('orchestrator.extract_datetime', side_effect=lambda text: TOMORROW_7PM if '7pm' in text
+               else TOMORROW_7PM.replace(hour=9)):
+        results = orchestrator.process_command("take insulin at 7pm and blood test at 9am", "doc@example.com")
+        # The reminder created above is in the index straight away
+        again = orchestrator.process_command("blood test at 9am", "doc@example.com")
+
+    mock_create_event.assert_called_once()
+    assert mock_create_event.call_args.kwargs['summary'] == 'blood test at 9am'
+    assert results['actions'][0] == {'type': 'calendar', 'text': 'take insulin at 7pm', 'status': 'duplicate',
+                                     'link': 'https://calendar.example.com/a'}
+    assert results['parsed_intents'][0].startswith('Skipped Duplicate Calendar Event')
+    assert again['actions'][0]['status'] == 'duplicate'
@@ -0,0 +1,111 @@
+import httplib2
+import pytest
+from unittest.mock import MagicMock, patch
+from googleapiclient.errors import HttpError
+
+import coalescer
+import orchestrator
+from coalescer import SummaryCoalescer
+
+
+def test_summaries_within_window_become_one_email():
+    send = MagicMock(return_value={'id': 'msg1'})
+    summaries = SummaryCoalescer(send, window_seconds=0.05, max_items=10)
+
+    futures = [
+        summaries.add("doc@example.com", "p1", "I have a headache"),
+        summaries.add("doc@example.com", "p1", "Now I feel dizzy"),
+        summaries.add("other@example.com", "p1", "Rash on my arm"),
+    ]
+
+    assert [f.result(timeout=2) for f in futures] == [{'id': 'msg1'}] * 3
+    assert send.call_count == 2
+    send.assert_any_call("doc@example.com", "p1", ["I have a headache", "Now I feel dizzy"])
+    assert summaries.stats()['sends_saved'] == 1
+
+
+def test_size_cap_sends_immediately():
+    send = MagicMock(return_value={'id': 'msg1'})
+    summaries = SummaryCoalescer(send, window_seconds=60, max_items=2)
+
+    summaries.add("doc@example.com", "p1", "one")
+    first = summaries.add("doc@example.com", "p1", "two")
+
+    assert first.done()
+    send.assert_called_once_with("doc@example.com", "p1", ["one", "two"])
+
+
+def test_close_flushes_pending_and_send_errors_reach_futures():
+    send = MagicMock(side_effect=RuntimeError("Gmail down"))
+    summaries = SummaryCoalescer(send, window_seconds=60, max_items=10)
+    future = summaries.add("doc@example.com", "p1", "one")
+
+    summaries.close()
+
+    with pytest.raises(RuntimeError):
+        future.result(timeout=0)
+    assert summaries.stats()['pending_summaries'] == 0
+
+
+def test_failed_send_is_handed_over_and_not_counted_as_saved():
+    send = MagicMock(side_effect=[RuntimeError("Gmail down"), {'id': 'msg2'}])
+    on_failure = MagicMock(return_value='requeued')
+    summaries = SummaryCoalescer(send, window_seconds=60, max_items=2, on_failure=on_failure)
+
+    summaries.add("doc@example.com", "p1", "one")
+    summaries.add("doc@example.com", "p1", "two")
+    summaries.add("doc@example.com", "p1", "three")
+    summaries.add("doc@example.com", "p1", "four")
+
+    on_failure.assert_called_once()
+    assert on_failure.call_args.args[:3] == ("doc@example.com", "p1", ["one", "two"])
+    stats = summaries.stats()
+    assert stats['emails_sent'] == 1 and stats['sends_saved'] == 1
+    assert stats['failed_sends'] == 1 and stats['summaries_failed'] == 2
+
+
+@patch('coalescer.COALESCE_WINDOW_SECONDS', 60)
+@patch('orchestrator.get_job_queue')
+@patch('orchestrator.send_email')
+@patch('orchestrator.get_gmail_service', return_value=MagicMock())
+def test_failed_coalesced_email_goes_to_the_job_queue(mock_gmail, mock_send_email, mock_get_queue):
+    mock_send_email.side_effect = HttpError(resp=httplib2.Response({'status': '429'}), content=b'Rate limited')
+    try:
+        orchestrator.process_command("I have a headache", "doc@example.com")
+        orchestrator.process_command("I feel dizzy", "doc@example.com")
+    finally:
+        coalescer.close_summary_coalescer()
+
+    mock_get_queue.return_value.enqueue.assert_called_once_with([
+        {"type": "email", "text": "- I have a headache\n- I feel dizzy", "to": "doc@example.com"}
+    ])
+
+
+@patch('coalescer.COALESCE_WINDOW_SECONDS', 60)
+@patch('orchestrator.get_job_queue')
+@patch('orchestrator.send_email', side_effect=TimeoutError("read timed out"))
+@patch('orchestrator.get_gmail_service', return_value=MagicMock())
+def test_coalesced_email_google_may_have_sent_is_not_requeued(mock_gmail, mock_send_email, mock_get_queue):
+    try:
+        orchestrator.process_command("I have a headache", "doc@example.com")
+    finally:
+        coalescer.close_summary_coalescer()
+
+    mock_get_queue.return_value.enqueue.assert_not_called()
+
+
+@patch('coalescer.COALESCE_WINDOW_SECONDS', 60)
+@patch('orchestrator.send_email', return_value={'id': 'msg1'})
+@patch('orchestrator.get_gmail_service', return_value=MagicMock())
+def test_process_command_coalesces_summaries(mock_gmail, mock_send_email):
+    try:
+        first = orchestrator.process_command("I have a headache", "doc@example.com")
+        orchestrator.process_command("I feel dizzy", "doc@example.com")
+        assert first["email_status"] == "Queued"
+        mock_send_email.assert_not_called()
+    finally:
+        coalescer.close_summary_coalescer()
+
+    mock_send_email.assert_called_once()
+    text_body = mock_send_email.call_args.kwargs['text_body']
+    assert "- I have a headache\n- I feel dizzy" in text_body
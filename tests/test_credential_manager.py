@@ -0,0 +1,91 @@
+import json
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+from credential_manager import CredentialManager
+
+
+def _utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class FakeCreds:
+    """
+    Stands in for google.oauth2 Credentials; each refresh takes a while and issues a new token.
+    """
+
+    def __init__(self, expires_in=-10, refresh_token='refresh-1'):
+        self.token = 'token-0'
+        self.refresh_token = refresh_token
+        self.expiry = _utcnow() + timedelta(seconds=expires_in)
+        self.refresh_calls = 0
+        self._lock = threading.Lock()
+
+    @property
+    def valid(self):
+        return self.token is not None and self.expiry > _utcnow()
+
+    def refresh(self, request):
+        time.sleep(0.05)
+        with self._lock:
+            self.refresh_calls += 1
+            self.token = f'token-{self.refresh_calls}'
+        self.expiry = _utcnow() + timedelta(hours=1)
+
+    def to_json(self):
+        return json.dumps({'token': self.token, 'refresh_token': self.refresh_token,
+                           'expiry': self.expiry.isoformat() + 'Z'})
+
+
+def test_concurrent_callers_share_one_refresh(tmp_path):
+    creds = FakeCreds()
+    manager = CredentialManager(creds, str(tmp_path / 'token.json'))
+
+    threads = [threading.Thread(target=manager.ensure_valid) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert creds.refresh_calls == 1
+    assert json.loads((tmp_path / 'token.json').read_text())['token'] == 'token-1'
+
+
+def test_token_refreshed_by_another_process_is_reused(tmp_path):
+    token_path = str(tmp_path / 'token.json')
+    first = FakeCreds()
+    CredentialManager(first, token_path).refresh()
+
+    # A second worker still holding the old token picks up the saved one
+    second = FakeCreds()
+    persisted = []
+    CredentialManager(second, token_path, on_persist=lambda: persisted.append(True)).refresh()
+
+    assert second.refresh_calls == 0
+    assert second.token == 'token-1'
+    assert persisted == []
+
+
+def test_fresh_token_is_not_refreshed():
+    creds = FakeCreds(expires_in=3600)
+    CredentialManager(creds).ensure_valid()
+    CredentialManager(creds).refresh()
+    assert creds.refresh_calls == 0
+
+
+@patch('credential_manager.random.uniform', return_value=0)
+def test_background_refresh_runs_before_expiry(mock_uniform):
+    # Still valid, but inside the refresh margin
+    creds = FakeCreds(expires_in=60)
+    manager = CredentialManager(creds, margin=300).start()
+    try:
+        deadline = time.time() + 2
+        while creds.refresh_calls == 0 and time.time() < deadline:
+            time.sleep(0.01)
+    finally:
+        manager.stop()
+
+    assert creds.refresh_calls == 1
+    assert manager.state()['refreshes'] == 1
@@ -0,0 +1,165 @@
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+import date_intent
+from date_cache import RelativeDateCache, normalise
+from date_intent import _dateparser_fallback
+
+# Phrases that miss date_intent's fast path and reach dateparser
+PHRASES = [
+    "blood test on the 5th of next month",
+    "20 minutes from now",
+    "follow up next week",
+    "march 3rd at 10",
+    "i may have a rash",
+]
+
+
+def _sweep(start, hours, step_minutes):
+    now = start
+    while now < start + timedelta(hours=hours):
+        yield now
+        now += timedelta(minutes=step_minutes, seconds=11)
+
+
+class CountingParser:
+    """
+    Deterministic stand-in for dateparser, counting its calls:
+      "at 23:30"   next occurrence of 23:30 (flips inside the 23:00 bucket)
+      "tomorrow"   9:00 the next day
+      "in 2h"      reference + 2 hours
+    """
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, fragment, now):
+        self.calls += 1
+        fragment = fragment.lower()
+        if "23:30" in fragment:
+            candidate = now.replace(hour=23, minute=30, second=0, microsecond=0)
+            return candidate if candidate > now else candidate + timedelta(days=1)
+        if "tomorrow" in fragment:
+            return now.replace(hour=9, minute=0, second=0, microsecond=0) + timedelta(days=1)
+        if "in 2h" in fragment:
+            return now + timedelta(hours=2)
+        return None
+
+
+def test_cached_results_match_the_parser_across_midnight():
+    parser = CountingParser()
+    cache = RelativeDateCache(parser, max_entries=100)
+    for now in _sweep(datetime(2026, 10, 17, 21, 0), 5, 3):
+        for fragment in ("call the clinic at 23:30", "Tomorrow", "in 2h", "my knee hurts"):
+            assert cache.resolve(fragment, now) == CountingParser()(fragment, now), (fragment, now)
+
+    state = cache.state()
+    assert state['hits'] > 0.8 * (state['hits'] + state['misses'] + state['uncacheable'])
+    # 23:30 passes inside the 23:00 bucket: never cached there, parsed every time
+    assert state['uncacheable'] > 0
+
+
+def test_midnight_starts_a_new_bucket():
+    parser = CountingParser()
+    cache = RelativeDateCache(parser, bucket_minutes=120)
+    before = datetime(2026, 10, 17, 23, 59, 59, 500000)
+    after = datetime(2026, 10, 18, 0, 0, 0, 1)
+
+    assert cache.bucket_bounds(before) == (datetime(2026, 10, 17, 22), datetime(2026, 10, 18))
+    assert cache.bucket_bounds(after) == (datetime(2026, 10, 18), datetime(2026, 10, 18, 2))
+    for _ in range(3):
+        assert cache.resolve("tomorrow", before) == datetime(2026, 10, 18, 9)
+        assert cache.resolve("tomorrow", after) == datetime(2026, 10, 19, 9)
+
+
+def test_rules_are_relative_not_absolute():
+    parser = CountingParser()
+    cache = RelativeDateCache(parser)
+    now = datetime(2026, 10, 17, 10, 5)
+    cache.resolve("in 2h", now)
+    cache.resolve("in 2h", now + timedelta(minutes=1))   # stores the rule
+    calls = parser.calls
+
+    later = now + timedelta(minutes=40, seconds=7, microseconds=3)
+    assert cache.resolve("IN  2h!", later) == later + timedelta(hours=2)
+    assert parser.calls == calls
+    assert cache.state()['rules_stored'] == 1
+
+
+def test_fragments_seen_once_cost_one_parse():
+    parser = CountingParser()
+    cache = RelativeDateCache(parser)
+    now = datetime(2026, 10, 17, 10, 5)
+    for i in range(50):
+        cache.resolve(f"bp was 140/{i}", now)
+    assert parser.calls == 50
+    assert cache.state()['misses'] == 50
+
+
+def test_size_is_bounded_least_recently_used_first():
+    parser = CountingParser()
+    cache = RelativeDateCache(parser, max_entries=3)
+    now = datetime(2026, 10, 17, 10, 5)
+    for fragment in ("a", "b", "c"):
+        cache.resolve(fragment, now)
+    cache.resolve("a", now)          # second sighting stores a rule; "a" is the most recently used
+    cache.resolve("d", now)
+
+    state = cache.state()
+    assert state['entries'] == 3 and state['evictions'] == 1 and state['rules_stored'] == 1
+    calls = parser.calls
+    cache.resolve("a", now)          # kept: served from its rule
+    assert parser.calls == calls and cache.state()['hits'] == 1
+    cache.resolve("b", now)          # evicted: a first sighting again
+    assert cache.state()['misses'] == 6 and parser.calls == calls + 1
+
+
+def test_disabled_cache_always_parses():
+    parser = CountingParser()
+    cache = RelativeDateCache(parser, max_entries=0)
+    now = datetime(2026, 10, 17, 10, 5)
+    for _ in range(3):
+        cache.resolve("tomorrow", now)
+    assert parser.calls == 3 and cache.state()['entries'] == 0
+
+
+def test_normalise():
+    assert normalise("  Blood test   on the 5th!  ") == "blood test on the 5th"
+
+
+@pytest.fixture
+def local_timezone(monkeypatch):
+    """
+    Runs a test under a given system time zone.
+    """
+    def use(name):
+        monkeypatch.setenv('TZ', name)
+        time.tzset()
+
+    yield use
+    monkeypatch.undo()
+    time.tzset()
+
+
+@pytest.mark.parametrize("zone, start", [
+    ("America/New_York", datetime(2026, 3, 7, 22, 0)),    # clocks go forward 2026-03-08 02:00
+    ("Europe/London", datetime(2026, 10, 24, 22, 0)),     # clocks go back 2026-10-25 02:00
+])
+def test_cached_dateparser_results_match_uncached_across_dst(local_timezone, zone, start):
+    local_timezone(zone)
+    cache = RelativeDateCache(_dateparser_fallback, max_entries=100)
+    for now in _sweep(start, 8, 23):
+        for fragment in PHRASES:
+            assert cache.resolve(fragment, now) == _dateparser_fallback(fragment, now), (fragment, now)
+    assert cache.state()['hits'] > 0
+
+
+def test_extract_datetime_uses_the_cache():
+    date_intent.clear_date_cache()
+    now = datetime(2026, 10, 17, 10, 5)
+    before = date_intent.date_cache_state()['hits']
+    results = {date_intent.extract_datetime("20 minutes from now", now=now + timedelta(minutes=i)) for i in range(4)}
+    assert results == {now + timedelta(minutes=20 + i) for i in range(4)}
+    assert date_intent.date_cache_state()['hits'] == before + 2
@@ -0,0 +1,82 @@
+import pytest
+from datetime import datetime
+from unittest.mock import patch
+
+import date_intent
+from date_intent import extract_datetime, MODE_FAST, MODE_LEGACY
+
+# Saturday evening
+NOW = datetime(2026, 10, 17, 20, 30)
+
+
+@pytest.mark.parametrize("fragment, expected", [
+    ("take insulin at 7pm", datetime(2026, 10, 18, 19, 0)),
+    ("metformin at 9pm", datetime(2026, 10, 17, 21, 0)),
+    ("check sugar tomorrow 8am", datetime(2026, 10, 18, 8, 0)),
+    ("at 7:30 p.m. call the clinic", datetime(2026, 10, 18, 19, 30)),
+    ("see doctor on monday", datetime(2026, 10, 19, 0, 0)),
+    ("next monday at 10am", datetime(2026, 10, 19, 10, 0)),
+    ("saturday at noon", datetime(2026, 10, 24, 12, 0)),
+    ("in 2 hours take pills", datetime(2026, 10, 17, 22, 30)),
+    ("at 19:00", datetime(2026, 10, 18, 19, 0)),
+])
+def test_fast_path_resolves_common_phrasings(fragment, expected):
+    with patch('date_intent.search_dates') as mock_search:
+        assert extract_datetime(fragment, now=NOW, mode=MODE_FAST) == expected
+    mock_search.assert_not_called()
+
+
+@pytest.mark.parametrize("fragment, expected", [
+    ("dentist on march 3 at 5pm", datetime(2027, 3, 3, 17, 0)),
+    ("take pills on the 20th at 7pm", datetime(2026, 10, 20, 19, 0)),
+    ("call 12/11 at 3pm", datetime(2026, 12, 11, 15, 0)),
+    ("in 3 days at 5pm", datetime(2026, 10, 20, 17, 0)),
+])
+def test_explicit_dates_are_not_dropped(fragment, expected):
+    """
+    A time on an explicit date is left to dateparser instead of becoming the next occurrence of that time.
+    """
+    now = datetime(2026, 10, 17, 10, 0)
+    assert date_intent.fast_path(fragment, now) is None
+    assert extract_datetime(fragment, now=now, mode=MODE_FAST) == expected
+
+
+def test_next_weekday_said_on_that_weekday_is_a_week_away():
+    friday = datetime(2026, 10, 16, 10, 0)
+    with patch('date_intent.search_dates') as mock_search:
+        assert extract_datetime("dentist next friday at 3pm", now=friday, mode=MODE_FAST) == datetime(2026, 10, 23, 15, 0)
+    mock_search.assert_not_called()
+    # Without "next" it is still today's 3pm
+    assert date_intent.fast_path("dentist friday at 3pm", friday) == datetime(2026, 10, 16, 15, 0)
+
+
+def test_past_references_go_to_dateparser():
+    friday = datetime(2026, 10, 16, 10, 0)
+    assert date_intent.fast_path("i had a fever yesterday at 5pm", friday) is None
+    assert extract_datetime("i had a fever yesterday at 5pm", now=friday, mode=MODE_FAST) == datetime(2026, 10, 15, 17, 0)
+
+
+def test_plain_summary_skips_dateparser():
+    """
+    Fragments without digits or date words never reach dateparser.
+    """
+    with patch('date_intent.search_dates') as mock_search:
+        assert extract_datetime("i have some allergic on my hand", now=NOW) is None
+    mock_search.assert_not_called()
+
+
+def test_fallback_is_language_restricted():
+    with patch('date_intent.search_dates', return_value=[('may', datetime(2027, 5, 17))]) as mock_search:
+        assert extract_datetime("i may have a rash", now=NOW) == datetime(2027, 5, 17)
+    assert mock_search.call_args.kwargs['languages'] == date_intent.LANGUAGES
+
+
+@pytest.mark.parametrize("fragment", [
+    "take insulin at 7pm",
+    "i have some allergic on my hand",
+])
+def test_fast_mode_matches_legacy_for_existing_cases(fragment):
+    """
+    The orchestrator test command classifies the same way in both modes.
+    """
+    assert extract_datetime(fragment, mode=MODE_FAST) == extract_datetime(fragment, mode=MODE_LEGACY)
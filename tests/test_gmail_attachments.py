@@ -0,0 +1,144 @@
+import email
+import io
+import json
+import os
+import subprocess
+import sys
+import textwrap
+from email import policy
+from unittest.mock import patch
+
+import pytest
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from googleapiclient.errors import MediaUploadSizeError
+
+from benchmarks.fake_google import FakeGoogleServer
+from gmail_client import send_email_with_attachments, write_mime_message
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Peak RSS growth allowed while sending a 50 MB attachment. Reading it whole
+# (plus its base64 copy) would need well over 100 MB.
+RSS_BUDGET_MB = 40
+
+
+def _gmail(server, lift_size_limit=True):
+    doc = json.loads(get_static_doc('gmail', 'v1'))
+    doc['rootUrl'] = server.url
+    if lift_size_limit:
+        # Gmail caps messages at 35 MB; the fake accepts anything
+        del doc['resources']['users']['resources']['messages']['methods']['send']['mediaUpload']['maxSize']
+    return build_from_document(doc, credentials=Credentials(token='token'))
+
+
+@pytest.fixture
+def fake_google():
+    with FakeGoogleServer() as server, patch.dict('rate_limit.QUOTAS', {'gmail': (1e9, 1e9)}):
+        yield server
+
+
+def test_mime_message_carries_body_and_attachments(tmp_path):
+    report = tmp_path / 'report.pdf'
+    report.write_bytes(os.urandom(300_000))
+    notes = io.BytesIO('Blutdruck: 120/80'.encode())
+    notes.name = 'notes.txt'
+
+    out = io.BytesIO()
+    write_mime_message(out, 'doc@example.com', 'Monthly report', 'See attached.', '<p>See attached.</p>',
+                       attachments=[str(report), notes, ('bericht-ä.pdf', io.BytesIO(b'%PDF-1.4'))])
+    message = email.message_from_bytes(out.getvalue(), policy=policy.default)
+
+    assert message['to'] == 'doc@example.com'
+    assert message['subject'] == 'Monthly report'
+    assert message.get_body(('plain',)).get_content().strip() == 'See attached.'
+    assert message.get_body(('html',)).get_content().strip() == '<p>See attached.</p>'
+    attachments = list(message.iter_attachments())
+    assert [a.get_filename() for a in attachments] == ['report.pdf', 'notes.txt', 'bericht-ä.pdf']
+    assert attachments[0].get_content_type() == 'application/pdf'
+    assert attachments[0].get_content() == report.read_bytes()
+    assert attachments[1].get_content().strip() == 'Blutdruck: 120/80'
+    assert attachments[2].get_content() == b'%PDF-1.4'
+
+
+def test_small_message_uploads_in_one_request(tmp_path, fake_google):
+    report = tmp_path / 'report.pdf'
+    report.write_bytes(b'%PDF-1.4 tiny')
+
+    result = send_email_with_attachments(_gmail(fake_google), 'doc@example.com', 'Report', 'Attached',
+                                         [str(report)])
+
+    assert result['id'].startswith('fake-msg-')
+    assert fake_google.requests == 1
+    assert fake_google.uploaded_bytes == 0
+
+
+def test_large_message_uses_resumable_upload_and_cleans_up(tmp_path, fake_google):
+    report = tmp_path / 'scan.pdf'
+    report.write_bytes(os.urandom(600_000))
+
+    with patch('gmail_client.tempfile.tempdir', str(tmp_path)):
+        result = send_email_with_attachments(_gmail(fake_google), 'doc@example.com', 'Scan', 'Attached',
+                                             [str(report)], chunk_size=256 * 1024)
+
+    assert result['id'].startswith('fake-msg-')
+    # one request opens the session, then ~800 KB of base64 MIME in 256 KB chunks
+    assert fake_google.requests == 5
+    assert fake_google.uploaded_bytes > 800_000
+    assert os.listdir(tmp_path) == ['scan.pdf']
+
+
+@pytest.mark.skipif(not os.path.exists('/proc/self/statm'), reason='samples RSS from /proc')
+def test_50mb_attachment_streams_in_bounded_memory(tmp_path):
+    # Runs in a fresh interpreter so earlier tests do not skew the RSS samples
+    script = textwrap.dedent(f"""
+        import json, os, sys, threading
+        sys.path.insert(0, {REPO_ROOT!r})
+        from unittest.mock import patch
+        from benchmarks.fake_google import FakeGoogleServer
+        from tests.test_gmail_attachments import _gmail
+        from gmail_client import send_email_with_attachments
+
+        def rss():
+            with open('/proc/self/statm') as f:
+                return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+        path = os.path.join({str(tmp_path)!r}, 'scan.pdf')
+        with open(path, 'wb') as f:
+            for _ in range(50):
+                f.write(os.urandom(1024 * 1024))
+
+        peak, done = [0], threading.Event()
+        def sample():
+            while not done.wait(0.002):
+                peak[0] = max(peak[0], rss())
+
+        with FakeGoogleServer() as server, patch.dict('rate_limit.QUOTAS', {{'gmail': (1e9, 1e9)}}):
+            gmail = _gmail(server)
+            before = rss()
+            sampler = threading.Thread(target=sample)
+            sampler.start()
+            result = send_email_with_attachments(gmail, 'doc@example.com', 'Scan', 'Attached', [path])
+            done.set()
+            sampler.join()
+        print(json.dumps({{'id': result['id'], 'uploaded': server.uploaded_bytes,
+                          'rss_growth_mb': (max(peak[0], rss()) - before) / 2 ** 20}}))
+    """)
+    completed = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, timeout=300)
+    assert completed.returncode == 0, completed.stderr
+
+    outcome = json.loads(completed.stdout.strip().splitlines()[-1])
+    assert outcome['id'].startswith('fake-msg-')
+    assert outcome['uploaded'] > 50 * 1024 * 1024 * 4 // 3
+    assert outcome['rss_growth_mb'] < RSS_BUDGET_MB
+
+
+def test_message_over_gmail_limit_is_rejected_before_upload(tmp_path, fake_google):
+    with patch('gmail_client.tempfile.tempdir', str(tmp_path)):
+        with pytest.raises(MediaUploadSizeError):
+            send_email_with_attachments(_gmail(fake_google, lift_size_limit=False), 'doc@example.com', 'Huge',
+                                        'Attached', [('scan.pdf', io.BytesIO(b'\0' * (27 * 1024 * 1024)))])
+
+    assert fake_google.requests == 0
+    assert os.listdir(tmp_path) == []
@@ -61,3 +61,39 @@ def test_send_email_failure():
     
     with pytest.raises(HttpError):
         send_email(mock_service, "doc@test.com", "Subj", "Body")
+
+def test_send_emails_batch_falls_back_for_rejected_items():
+    """
+    Batched sends map responses back in order and retry only rejected items.
+    """
+    from gmail_client import send_emails_batch
+    from googleapiclient.errors import HttpError
+
+    rejected = MagicMock()
+    rejected.status = 429
+
+    class FakeBatch:
+        def __init__(self, callback):
+            self.callback = callback
+            self.ids = []
+
+        def add(self, request, request_id=None):
+            self.ids.append(request_id)
+
+        def execute(self):
+            for request_id in self.ids:
+                if request_id == '2':
+                    self.callback(request_id, None, HttpError(resp=rejected, content=b'Rate limited'))
+                else:
+                    self.callback(request_id, {'id': f'msg{request_id}'}, None)
+
+    mock_service = MagicMock()
+    batches = []
+    mock_service.new_batch_http_request.side_effect = lambda callback=None: batches.append(FakeBatch(callback)) or batches[-1]
+    mock_service.users.return_value.messages.return_value.send.return_value.execute.return_value = {'id': 'retried'}
+
+    messages = [{'to': f'doc{i}@test.com', 'subject': 'Subj', 'text_body': 'Body'} for i in range(5)]
+    results = send_emails_batch(mock_service, messages, batch_size=2, max_parallel_batches=2)
+
+    assert len(batches) == 3
+    assert [r['id'] for r in results] == ['msg0', 'msg1', 'retried', 'msg3', 'msg4']
@@ -0,0 +1,113 @@
+import threading
+import pytest
+from unittest.mock import MagicMock, patch
+
+import google_services
+
+
+@pytest.fixture(autouse=True)
+def isolated_registry(tmp_path, monkeypatch):
+    """
+    Run each test in an empty directory with a clean registry.
+    """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv('GOOGLE_TOKEN_DATA', raising=False)
+    google_services.clear_cache()
+    yield
+    google_services.clear_cache()
+
+
+@patch('google_services.build_service')
+@patch('google_services.load_credentials')
+def test_service_built_once(mock_load, mock_build):
+    """
+    Repeated calls reuse the same client and do not reload credentials.
+    """
+    mock_load.return_value = MagicMock()
+    mock_build.side_effect = lambda api, version, creds: MagicMock()
+
+    first = google_services.get_service('gmail', 'v1')
+    second = google_services.get_service('gmail', 'v1')
+
+    assert first is second
+    assert mock_load.call_count == 1
+    assert mock_build.call_count == 1
+
+
+@patch('google_services.build_service')
+@patch('google_services.load_credentials')
+def test_service_rebuilt_when_credentials_change(mock_load, mock_build, monkeypatch):
+    """
+    A new GOOGLE_TOKEN_DATA value invalidates the cached client.
+    """
+    mock_load.return_value = MagicMock()
+    mock_build.side_effect = lambda api, version, creds: MagicMock()
+
+    monkeypatch.setenv('GOOGLE_TOKEN_DATA', '{"token": "a"}')
+    first = google_services.get_service('calendar', 'v3')
+    monkeypatch.setenv('GOOGLE_TOKEN_DATA', '{"token": "b"}')
+    second = google_services.get_service('calendar', 'v3')
+
+    assert first is not second
+    assert mock_load.call_count == 2
+
+
+@patch('google_services.build_service')
+@patch('google_services.load_credentials')
+def test_concurrent_callers_share_one_build(mock_load, mock_build):
+    """
+    Threads racing on a cold registry end up with a single client.
+    """
+    mock_load.return_value = MagicMock()
+    mock_build.side_effect = lambda api, version, creds: MagicMock()
+
+    seen = []
+    threads = [
+        threading.Thread(target=lambda: seen.append(google_services.get_service('gmail', 'v1')))
+        for _ in range(8)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert mock_build.call_count == 1
+    assert all(s is seen[0] for s in seen)
+
+
+def test_discovery_document_is_bundled():
+    """
+    Clients are built from the static discovery document shipped with googleapiclient.
+    """
+    doc = google_services.get_discovery_document('gmail', 'v1')
+    assert doc['name'] == 'gmail'
+    assert google_services.get_discovery_document('gmail', 'v1') is doc
+
+
+@patch('google_services.InstalledAppFlow')
+def test_non_interactive_credentials_never_start_login_flow(mock_flow, tmp_path):
+    """
+    Server warm-up must not block on a browser login when no token is stored.
+    """
+    (tmp_path / google_services.CREDENTIALS_FILE).write_text('{}')
+
+    assert google_services.get_credentials(interactive=False) is None
+    mock_flow.from_client_secrets_file.assert_not_called()
+
+
+@patch('google_services.build_service')
+@patch('google_services.load_credentials')
+def test_warm_up_builds_clients_before_first_request(mock_load, mock_build):
+    import warmup
+
+    mock_load.return_value = MagicMock()
+    mock_build.side_effect = lambda api, version, creds: MagicMock()
+
+    timings = warmup.warm_up()
+
+    assert set(timings) == {'date_parser', 'google_clients', 'templates'}
+    mock_load.assert_called_once_with(False)
+    assert mock_build.call_count == len(warmup.GOOGLE_APIS)
+    # Requests now reuse the warmed clients
+    google_services.get_service('gmail', 'v1')
+    assert mock_build.call_count == len(warmup.GOOGLE_APIS)
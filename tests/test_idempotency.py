@@ -0,0 +1,188 @@
+import asyncio
+import time
+import pytest
+from unittest.mock import MagicMock, patch
+from fastapi import HTTPException
+
+import idempotency
+from idempotency import DiskStore, IdempotencyCache, request_key
+from main import ExecuteRequest, SummaryRequest, process_command_endpoint, send_summary_endpoint
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache():
+    idempotency.reset_idempotency_cache()
+    yield
+    idempotency.reset_idempotency_cache()
+
+
+def test_request_key_prefers_explicit_key_and_hashes_canonical_body():
+    key, ttl = request_key("send-summary", "abc", {"summary": "x"})
+    assert key == "send-summary:key:abc"
+    assert ttl == idempotency.KEY_TTL_SECONDS
+
+    first, ttl = request_key("send-summary", None, {"a": 1, "b": 2})
+    second, _ = request_key("send-summary", None, {"b": 2, "a": 1})
+    assert first == second
+    assert ttl == idempotency.HASH_TTL_SECONDS
+    assert request_key("process-command", None, {"a": 1, "b": 2})[0] != first
+
+
+def test_lru_evicts_oldest_and_ttl_expires():
+    cache = IdempotencyCache(max_entries=2)
+    cache.put("a", 1, ttl=60)
+    cache.put("b", 2, ttl=60)
+    cache.get("a")
+    cache.put("c", 3, ttl=60)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+
+    cache.put("d", 4, ttl=-1)
+    assert cache.get("d") is None
+
+
+def test_disk_store_survives_new_cache(tmp_path):
+    path = str(tmp_path / "idempotency.db")
+    IdempotencyCache(store=DiskStore(path)).put("k", {"id": "msg1"}, ttl=60)
+
+    assert IdempotencyCache(store=DiskStore(path)).get("k") == {"id": "msg1"}
+
+
+def test_concurrent_duplicates_share_one_execution():
+    cache = IdempotencyCache()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"id": "msg1"}
+
+    async def scenario():
+        return await asyncio.gather(*(cache.run("k", 60, compute) for _ in range(5)))
+
+    outcomes = asyncio.run(scenario())
+
+    assert len(calls) == 1
+    assert [replayed for _, replayed in outcomes].count(False) == 1
+    assert all(result == {"id": "msg1"} for result, _ in outcomes)
+    assert cache.stats()['collapsed'] == 4
+
+
+def test_failures_are_not_cached():
+    cache = IdempotencyCache()
+    compute = MagicMock(side_effect=[RuntimeError("Gmail down"), {"id": "msg1"}])
+
+    async def run():
+        return compute()
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(cache.run("k", 60, run))
+    assert asyncio.run(cache.run("k", 60, run)) == ({"id": "msg1"}, False)
+
+
+def test_duplicate_during_a_slow_store_write_waits_for_the_result(tmp_path):
+    cache = IdempotencyCache(store=DiskStore(str(tmp_path / "idempotency.db")))
+    slow_put = cache.put
+    cache.put = lambda *args: (time.sleep(0.2), slow_put(*args))
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        return {"id": "msg1"}
+
+    async def scenario():
+        first = asyncio.create_task(cache.run("k", 60, compute))
+        await asyncio.sleep(0.05)   # first has computed and is writing its result
+        return await asyncio.gather(first, cache.run("k", 60, compute))
+
+    outcomes = asyncio.run(scenario())
+
+    assert len(calls) == 1
+    assert outcomes == [({"id": "msg1"}, False), ({"id": "msg1"}, True)]
+
+
+@patch('main.get_gmail_service', return_value=MagicMock())
+@patch('main.send_email', return_value={'id': 'msg1'})
+def test_send_summary_retry_sends_once(mock_send_email, mock_get_gmail):
+    request = SummaryRequest(doctor_email="doc@example.com", summary="Rash")
+
+    first = asyncio.run(send_summary_endpoint(request, idempotency_key="retry-1"))
+    second = asyncio.run(send_summary_endpoint(request, idempotency_key="retry-1"))
+    # Without a key the body hash is used
+    asyncio.run(send_summary_endpoint(request))
+    asyncio.run(send_summary_endpoint(request))
+    asyncio.run(send_summary_endpoint(SummaryRequest(doctor_email="doc@example.com", summary="Fever")))
+
+    assert first == second == {"success": True, "gmail_message_id": "msg1", "sent_to": "doc@example.com"}
+    assert mock_send_email.call_count == 3
+
+
+@patch('main.get_gmail_service', return_value=MagicMock())
+@patch('main.send_email', side_effect=[RuntimeError("Gmail down"), {'id': 'msg1'}])
+def test_send_summary_error_is_retried(mock_send_email, mock_get_gmail):
+    request = SummaryRequest(doctor_email="doc@example.com", summary="Rash")
+
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(send_summary_endpoint(request, idempotency_key="retry-2"))
+    assert exc_info.value.status_code == 500
+
+    response = asyncio.run(send_summary_endpoint(request, idempotency_key="retry-2"))
+    assert response["gmail_message_id"] == "msg1"
+
+
+@patch('main.process_command', return_value={"parsed_intents": {}, "actions": []})
+def test_process_command_retry_runs_once(mock_process):
+    request = ExecuteRequest(text="remind me at 7pm to take insulin", doctor_email="doc@example.com")
+
+    asyncio.run(process_command_endpoint(request, idempotency_key="cmd-1"))
+    asyncio.run(process_command_endpoint(request, idempotency_key="cmd-1"))
+
+    mock_process.assert_called_once()
+
+
+_FIRST_RUN = {
+    "calendar_event": "http://cal/1", "email_status": None, "email_error": "Rate limited",
+    "parsed_intents": ["Created Calendar Event: insulin at 7pm at 2026-10-16T19:00:00"],
+    "actions": [
+        {"type": "calendar", "text": "insulin at 7pm", "start_time": "2026-10-16T19:00:00",
+         "status": "ok", "link": "http://cal/1"},
+        {"type": "email", "text": "I feel dizzy", "status": "error", "error": "Rate limited", "retriable": True},
+    ],
+}
+
+
+@patch('orchestrator.run_action', return_value={"id": "msg1"})
+@patch('main.process_command', return_value=_FIRST_RUN)
+def test_process_command_retry_reruns_only_actions_google_turned_away(mock_process, mock_run_action):
+    request = ExecuteRequest(text="insulin at 7pm and I feel dizzy", doctor_email="doc@example.com")
+
+    first = asyncio.run(process_command_endpoint(request, idempotency_key="cmd-2"))
+    second = asyncio.run(process_command_endpoint(request, idempotency_key="cmd-2"))
+    third = asyncio.run(process_command_endpoint(request, idempotency_key="cmd-2"))
+
+    assert first["results"]["email_error"] == "Rate limited"
+    assert second == third
+    assert second["results"]["email_status"] == "Sent" and "email_error" not in second["results"]
+    assert [a["status"] for a in second["results"]["actions"]] == ["ok", "ok"]
+    # The calendar event is replayed; only the email is sent again, and only once
+    mock_process.assert_called_once()
+    mock_run_action.assert_called_once_with({"type": "email", "text": "I feel dizzy", "to": "doc@example.com"})
+    assert idempotency.get_idempotency_cache().stats()['resumed'] == 1
+
+
+@patch('orchestrator.run_action')
+@patch('main.process_command', return_value={"email_error": "Timed out after 30s", "actions": [
+    {"type": "email", "text": "I feel dizzy", "status": "timeout", "error": "Timed out after 30s"},
+    {"type": "calendar", "text": "insulin at 7pm", "start_time": "2026-10-16T19:00:00",
+     "status": "error", "error": "Connection reset", "retriable": False},
+]})
+def test_process_command_actions_google_may_have_run_are_replayed_as_is(mock_process, mock_run_action):
+    request = ExecuteRequest(text="insulin at 7pm and I feel dizzy", doctor_email="doc@example.com")
+
+    first = asyncio.run(process_command_endpoint(request, idempotency_key="cmd-3"))
+    second = asyncio.run(process_command_endpoint(request, idempotency_key="cmd-3"))
+
+    assert first == second
+    mock_process.assert_called_once()
+    mock_run_action.assert_not_called()
@@ -0,0 +1,147 @@
+import asyncio
+import json
+import time
+import pytest
+from unittest.mock import MagicMock, patch
+
+from job_queue import JobQueue, STATUS_DONE, STATUS_FAILED, STATUS_QUEUED
+from main import ExecuteRequest, process_command_endpoint, job_status_endpoint
+
+ACTIONS = [
+    {"type": "calendar", "text": "take insulin at 7pm", "start_time": "2026-10-18T19:00:00"},
+    {"type": "email", "text": "i have a rash", "to": "doc@example.com"},
+]
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "jobs.db")
+
+
+def test_job_runs_all_actions(db_path):
+    handler = MagicMock(side_effect=[{"link": "http://calendar/1"}, {"id": "msg1"}])
+    queue = JobQueue(db_path, handler, workers=0)
+
+    job_id = queue.enqueue(ACTIONS)
+    assert queue.get(job_id)['status'] == STATUS_QUEUED
+
+    assert queue.run_pending() == 1
+    job = queue.get(job_id)
+    assert job['status'] == STATUS_DONE
+    assert [a['result'] for a in job['actions']] == [{"link": "http://calendar/1"}, {"id": "msg1"}]
+    # Handlers receive the planned action without bookkeeping fields
+    assert handler.call_args_list[0].args[0] == ACTIONS[0]
+
+
+@patch('job_queue.RETRY_BASE_SECONDS', 0)
+def test_failed_action_is_retried_without_resending_others(db_path):
+    handler = MagicMock(side_effect=[{"link": "http://calendar/1"}, RuntimeError("Gmail down"), {"id": "msg1"}])
+    queue = JobQueue(db_path, handler, workers=0)
+    job_id = queue.enqueue(ACTIONS)
+
+    queue.run_job(*queue.claim())
+    job = queue.get(job_id)
+    assert job['status'] == STATUS_QUEUED
+    assert job['actions'][1]['error'] == "Gmail down"
+
+    queue.run_job(*queue.claim())
+    job = queue.get(job_id)
+    assert job['status'] == STATUS_DONE
+    # The calendar event was not created twice
+    assert handler.call_count == 3
+
+
+@patch('job_queue.RETRY_BASE_SECONDS', 0)
+def test_action_that_may_have_gone_out_is_not_run_again(db_path):
+    handler = MagicMock(side_effect=[{"link": "http://calendar/1"}, TimeoutError("read timed out")])
+    queue = JobQueue(db_path, handler, workers=0)
+    job_id = queue.enqueue(ACTIONS)
+
+    queue.run_job(*queue.claim())
+
+    job = queue.get(job_id)
+    assert job['status'] == STATUS_FAILED
+    assert job['actions'][1]['status'] == 'unknown'
+    assert queue.claim() is None
+    assert handler.call_count == 2
+
+
+@patch('job_queue.RETRY_BASE_SECONDS', 0)
+def test_job_fails_after_max_attempts(db_path):
+    queue = JobQueue(db_path, MagicMock(side_effect=RuntimeError("Gmail down")), workers=0, max_attempts=2)
+    job_id = queue.enqueue(ACTIONS[1:])
+
+    queue.run_job(*queue.claim())
+    queue.run_job(*queue.claim())
+
+    job = queue.get(job_id)
+    assert job['status'] == STATUS_FAILED
+    assert job['attempts'] == 2
+
+
+def test_abandoned_job_is_resumed_after_restart(db_path):
+    """
+    A job claimed by a worker that died is picked up by a new process once its lease expires.
+    """
+    crashed = JobQueue(db_path, MagicMock(), workers=0)
+    job_id = crashed.enqueue(ACTIONS[1:])
+    with patch('job_queue.LEASE_SECONDS', -1):
+        assert crashed.claim() is not None
+
+    handler = MagicMock(return_value={"id": "msg1"})
+    restarted = JobQueue(db_path, handler, workers=0)
+    assert restarted.run_pending() == 1
+    assert restarted.get(job_id)['status'] == STATUS_DONE
+
+
+@patch('job_queue.LEASE_RENEW_SECONDS', 0.05)
+@patch('job_queue.LEASE_SECONDS', 0.3)
+def test_job_running_longer_than_its_lease_is_not_claimed_twice(db_path):
+    """
+    The running worker keeps renewing its lease, so a slow job is not taken for abandoned.
+    """
+    claimed_by_other = []
+    other = JobQueue(db_path, MagicMock(), workers=0)
+
+    def slow_send(action):
+        for _ in range(8):
+            time.sleep(0.1)
+            claimed_by_other.append(other.claim())
+        return {"id": "msg1"}
+
+    queue = JobQueue(db_path, slow_send, workers=0)
+    job_id = queue.enqueue(ACTIONS[1:])
+    assert queue.run_pending() == 1
+
+    assert claimed_by_other == [None] * 8
+    job = queue.get(job_id)
+    assert job['status'] == STATUS_DONE and job['attempts'] == 1
+
+
+def test_background_workers_drain_queue(db_path):
+    queue = JobQueue(db_path, MagicMock(return_value={"id": "msg1"}), workers=2).start()
+    try:
+        job_ids = [queue.enqueue(ACTIONS[1:]) for _ in range(5)]
+        for _ in range(100):
+            if all(queue.get(j)['status'] == STATUS_DONE for j in job_ids):
+                break
+            time.sleep(0.02)
+        assert all(queue.get(j)['status'] == STATUS_DONE for j in job_ids)
+    finally:
+        queue.stop()
+
+
+def test_process_command_async_mode_returns_202(db_path):
+    queue = JobQueue(db_path, MagicMock(), workers=0)
+    with patch('main.get_job_queue', return_value=queue):
+        request = ExecuteRequest(text="take insulin at 7pm and i have a rash",
+                                 doctor_email="doc@example.com", async_mode=True)
+        response = asyncio.run(process_command_endpoint(request))
+        assert response.status_code == 202
+
+        body = json.loads(response.body)
+        job = asyncio.run(job_status_endpoint(body['job_id']))
+
+    assert job['status'] == STATUS_QUEUED
+    assert [a['type'] for a in job['actions']] == ['calendar', 'email']
+    assert job['actions'][1]['to'] == 'doc@example.com'
@@ -0,0 +1,192 @@
+import asyncio
+import json
+import threading
+import time
+import pytest
+from unittest.mock import MagicMock, patch
+from fastapi import HTTPException
+
+import executor
+import idempotency
+from main import app, SummaryRequest, _iter_lines, send_summary_endpoint, send_summaries_endpoint
+
+SLOW_CALL_SECONDS = 0.3
+
+
+@pytest.fixture(autouse=True)
+def fresh_executor():
+    """
+    Give each test its own executor so saturation does not leak between tests.
+    """
+    yield executor.configure_executor(max_workers=8, max_queue=8)
+    executor.configure_executor()
+
+
+@pytest.fixture(autouse=True)
+def fresh_idempotency_cache():
+    idempotency.reset_idempotency_cache()
+    yield
+    idempotency.reset_idempotency_cache()
+
+
+def _slow_send(**kwargs):
+    time.sleep(SLOW_CALL_SECONDS)
+    return {'id': 'msg-' + kwargs['to']}
+
+
+async def _send_many(n):
+    requests = [
+        SummaryRequest(doctor_email=f"doc{i}@example.com", summary="Feeling dizzy")
+        for i in range(n)
+    ]
+    return await asyncio.gather(*(send_summary_endpoint(r) for r in requests))
+
+
+@patch('main.get_gmail_service', return_value=MagicMock())
+@patch('main.send_email', side_effect=_slow_send)
+def test_concurrent_requests_do_not_serialize(mock_send_email, mock_get_gmail):
+    """
+    N concurrent /send-summary calls finish in about the time of one slow Gmail call.
+    """
+    n = 6
+    start = time.perf_counter()
+    responses = asyncio.run(_send_many(n))
+    elapsed = time.perf_counter() - start
+
+    assert mock_send_email.call_count == n
+    assert all(r['success'] for r in responses)
+    assert elapsed < SLOW_CALL_SECONDS * 2, f"{n} requests took {elapsed:.2f}s"
+
+
+@patch('main.get_gmail_service', return_value=MagicMock())
+def test_saturated_executor_returns_503(mock_get_gmail):
+    """
+    When every worker is busy and the queue is full, requests are rejected, not queued.
+    """
+    executor.configure_executor(max_workers=1, max_queue=0)
+    release = threading.Event()
+
+    def blocked_send(**kwargs):
+        release.wait(5)
+        return {'id': 'msg'}
+
+    async def scenario():
+        first = asyncio.ensure_future(send_summary_endpoint(
+            SummaryRequest(doctor_email="doc@example.com", summary="Rash")))
+        await asyncio.sleep(0.05)
+        # A different body; an identical one would just wait for the first send
+        with pytest.raises(HTTPException) as exc_info:
+            await send_summary_endpoint(SummaryRequest(doctor_email="doc@example.com", summary="Fever"))
+        release.set()
+        await first
+        return exc_info.value
+
+    with patch('main.send_email', side_effect=blocked_send):
+        error = asyncio.run(scenario())
+
+    assert error.status_code == 503
+    assert error.headers["Retry-After"]
+
+
+@patch('main.get_gmail_service', return_value=MagicMock())
+@patch('main.send_emails_batch')
+def test_send_summaries_reports_per_item_status(mock_send_batch, mock_get_gmail):
+    """
+    /send-summaries renders every item and returns results in request order.
+    """
+    mock_send_batch.return_value = [{'id': 'msg0'}, RuntimeError("Invalid recipient"), {'id': 'msg2'}]
+    requests = [
+        SummaryRequest(doctor_email=f"doc{i}@example.com", summary=f"note {i}", patient_name=f"Patient {i}")
+        for i in range(3)
+    ]
+
+    response = asyncio.run(send_summaries_endpoint(requests))
+
+    messages = mock_send_batch.call_args.args[1]
+    assert [m['to'] for m in messages] == ["doc0@example.com", "doc1@example.com", "doc2@example.com"]
+    assert "Patient 1" in messages[1]['text_body']
+    assert response['sent'] == 2 and response['failed'] == 1
+    assert response['results'][0]['gmail_message_id'] == 'msg0'
+    assert response['results'][1] == {"success": False, "sent_to": "doc1@example.com", "error": "Invalid recipient"}
+
+
+async def _asgi_post(path, chunks):
+    """
+    Sends a POST with the given body chunks straight through the ASGI app.
+    Returns (status, body bytes).
+    """
+    messages = [{'type': 'http.request', 'body': chunk, 'more_body': True} for chunk in chunks]
+    messages.append({'type': 'http.request', 'body': b'', 'more_body': False})
+    sent = []
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        await asyncio.sleep(3600)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'POST',
+        'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'',
+        'root_path': '', 'headers': [(b'content-type', b'application/x-ndjson')],
+        'client': ('127.0.0.1', 1234), 'server': ('testserver', 80),
+    }
+    await app(scope, receive, send)
+    status = next(m['status'] for m in sent if m['type'] == 'http.response.start')
+    body = b''.join(m.get('body', b'') for m in sent if m['type'] == 'http.response.body')
+    return status, body
+
+
+def test_process_command_stream_runs_lines_concurrently_with_bounded_in_flight():
+    """
+    Each NDJSON command gets its own result line; at most STREAM_MAX_IN_FLIGHT run at once.
+    """
+    lock = threading.Lock()
+    running = {'now': 0, 'peak': 0}
+
+    def slow_process(text, doctor_email, tenant_id=None):
+        with lock:
+            running['now'] += 1
+            running['peak'] = max(running['peak'], running['now'])
+        time.sleep(0.1)
+        with lock:
+            running['now'] -= 1
+        return {"parsed_intents": [text]}
+
+    lines = [json.dumps({"text": f"note {i}", "doctor_email": "doc@example.com"}).encode() + b"\n" for i in range(6)]
+    lines.append(b'{"text": "no email here"}\n')
+    # Split one line across chunks to exercise reassembly
+    chunks = lines[:2] + [lines[2][:5], lines[2][5:]] + lines[3:]
+
+    with patch('main.process_command', side_effect=slow_process), patch('main.STREAM_MAX_IN_FLIGHT', 2):
+        status, body = asyncio.run(_asgi_post('/process-command/stream', chunks))
+
+    assert status == 200
+    results = [json.loads(line) for line in body.decode().splitlines()]
+    assert sorted(r['line'] for r in results) == list(range(7))
+    by_line = {r['line']: r for r in results}
+    assert by_line[3]['results']['parsed_intents'] == ["note 3"]
+    assert by_line[6]['success'] is False and by_line[6]['status'] == 400
+    assert running['peak'] == 2
+
+
+async def _collect_lines(chunks):
+    async def stream():
+        for chunk in chunks:
+            yield chunk
+    return [line async for line in _iter_lines(stream())]
+
+
+def test_iter_lines_reassembles_lines_across_chunks():
+    chunks = [b"a\nbb", b"b", b"\n", b"c\nd\ne", b"ee\n\nf"]
+    assert asyncio.run(_collect_lines(chunks)) == [b"a", b"bbb", b"c", b"d", b"eee", b"", b"f"]
+
+
+def test_iter_lines_handles_many_lines_per_chunk_and_bounds_partial_lines():
+    chunk = b"".join(b"line %d\n" % i for i in range(50000))
+    assert asyncio.run(_collect_lines([chunk])) == [b"line %d" % i for i in range(50000)]
+
+    with patch('main.STREAM_MAX_LINE_BYTES', 10), pytest.raises(ValueError):
+        asyncio.run(_collect_lines([b"ok\n", b"x" * 6, b"x" * 6]))
@@ -0,0 +1,54 @@
+import asyncio
+import pytest
+from unittest.mock import MagicMock, patch
+
+import metrics
+import orchestrator
+from main import metrics_endpoint
+
+
+@pytest.fixture(autouse=True)
+def fresh_metrics():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+def test_histogram_and_counter_render_as_prometheus_text():
+    metrics.observe(metrics.STAGE_SECONDS, 0.003, stage='render')
+    metrics.observe(metrics.STAGE_SECONDS, 0.2, stage='render')
+    metrics.inc(metrics.GOOGLE_RETRIES, api='gmail.send')
+    metrics.inc(metrics.GOOGLE_RETRIES, api='gmail.send')
+
+    text = metrics.render_prometheus()
+
+    assert '# TYPE speakspace_stage_seconds histogram' in text
+    assert 'speakspace_stage_seconds_bucket{stage="render",le="0.0025"} 0' in text
+    assert 'speakspace_stage_seconds_bucket{stage="render",le="0.005"} 1' in text
+    assert 'speakspace_stage_seconds_bucket{stage="render",le="+Inf"} 2' in text
+    assert 'speakspace_stage_seconds_count{stage="render"} 2' in text
+    assert 'speakspace_google_retries_total{api="gmail.send"} 2' in text
+
+
+@patch('metrics.ENABLED', False)
+def test_disabled_metrics_record_nothing():
+    with metrics.stage('render'):
+        pass
+    metrics.inc(metrics.GOOGLE_RETRIES, api='gmail.send')
+
+    assert metrics.stage('render') is metrics.timer(metrics.STAGE_SECONDS)
+    assert metrics.render_prometheus() == '\n'
+
+
+@patch('orchestrator.send_email', return_value={'id': 'msg1'})
+@patch('orchestrator.get_gmail_service', return_value=MagicMock())
+@patch('orchestrator.get_calendar_service', return_value=MagicMock())
+@patch('orchestrator.create_event', side_effect=RuntimeError("Calendar down"))
+def test_process_command_records_stages_and_action_errors(mock_create_event, mock_cal, mock_gmail, mock_send):
+    orchestrator.process_command("Remind me at 5pm to take medicine and I have a headache", "doc@example.com")
+
+    text = asyncio.run(metrics_endpoint()).body.decode()
+
+    for stage in ('plan_command', 'date_parse', 'format_email_body', 'await_action', 'process_command'):
+        assert f'speakspace_stage_seconds_count{{stage="{stage}"}}' in text
+    assert 'speakspace_action_errors_total{status="error",type="calendar"} 1' in text
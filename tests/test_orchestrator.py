@@ -1,7 +1,8 @@
+import time
 import pytest
 from datetime import datetime
 from unittest.mock import MagicMock, patch
-from orchestrator import process_command
+from orchestrator import process_command, retry_failed_actions
 
 @patch('orchestrator.get_calendar_service')
 @patch('orchestrator.get_gmail_service')
@@ -52,3 +53,134 @@ def test_process_command_split(mock_send_email, mock_create_event, mock_get_gmai
     # 3. Check Results Structure
     assert results['calendar_event'] is not None
     assert results['email_status'] == 'Sent'
+
+
+SLOW_CALL_SECONDS = 0.3
+
+@patch('orchestrator.get_calendar_service')
+@patch('orchestrator.get_gmail_service')
+@patch('orchestrator.create_events_batch')
+@patch('orchestrator.send_email')
+def test_process_command_actions_run_concurrently(mock_send_email, mock_create_batch, mock_get_gmail, mock_get_cal):
+    """
+    Three reminders plus the doctor email cost about one round trip, not four.
+    """
+    def slow_batch(service, events):
+        time.sleep(SLOW_CALL_SECONDS)
+        return [{'htmlLink': f"http://calendar.google.com/{e['summary']}"} for e in events]
+
+    def slow_send(**kwargs):
+        time.sleep(SLOW_CALL_SECONDS)
+        return {'id': 'msg123'}
+
+    mock_create_batch.side_effect = slow_batch
+    mock_send_email.side_effect = slow_send
+
+    text = "take insulin at 7pm and metformin at 9pm and check sugar tomorrow 8am and i feel tired"
+    start = time.perf_counter()
+    results = process_command(text, "doc@example.com")
+    elapsed = time.perf_counter() - start
+
+    # All three reminders go out in a single batch call
+    assert mock_create_batch.call_count == 1
+    assert len(mock_create_batch.call_args.args[1]) == 3
+    assert results['email_status'] == 'Sent'
+    assert [a['status'] for a in results['actions']] == ['ok', 'ok', 'ok', 'ok']
+    assert elapsed < SLOW_CALL_SECONDS * 2, f"took {elapsed:.2f}s"
+
+
+@patch('orchestrator.get_calendar_service')
+@patch('orchestrator.get_gmail_service')
+@patch('orchestrator.create_events_batch')
+@patch('orchestrator.send_email')
+def test_process_command_partial_failure(mock_send_email, mock_create_batch, mock_get_gmail, mock_get_cal):
+    """
+    A failed calendar insert is reported without affecting the others or the email.
+    """
+    mock_create_batch.return_value = [
+        {'htmlLink': 'http://calendar.google.com/event123'},
+        RuntimeError("Calendar quota exceeded"),
+    ]
+    mock_send_email.return_value = {'id': 'msg123'}
+
+    results = process_command("take insulin at 7pm and metformin at 9pm and my rash is worse", "doc@example.com")
+
+    assert results['calendar_error'] == "Calendar quota exceeded"
+    assert results['calendar_event'] == 'http://calendar.google.com/event123'
+    assert results['email_status'] == 'Sent'
+    statuses = {a['text']: a['status'] for a in results['actions']}
+    assert statuses['metformin at 9pm'] == 'error'
+    assert statuses['take insulin at 7pm'] == 'ok'
+    # Not a quota or connection error, so Google may have acted on it
+    assert [a.get('retriable') for a in results['actions'] if a['status'] == 'error'] == [False]
+
+
+@patch('orchestrator.get_calendar_service')
+@patch('orchestrator.get_gmail_service')
+@patch('orchestrator.create_events_batch')
+@patch('orchestrator.send_email')
+def test_retry_failed_actions_reruns_only_what_google_turned_away(mock_send_email, mock_create_batch,
+                                                                mock_get_gmail, mock_get_cal):
+    """
+    A retried command keeps its created event and re-runs the insert that got a 429,
+    but not the one whose connection dropped (it may exist already).
+    """
+    import httplib2
+    from googleapiclient.errors import HttpError
+    mock_create_batch.return_value = [
+        {'htmlLink': 'http://calendar.google.com/event1'},
+        HttpError(httplib2.Response({'status': '429'}), b'rate limited'),
+        ConnectionResetError("Connection reset"),
+    ]
+    mock_send_email.return_value = {'id': 'msg1'}
+    results = process_command("take insulin at 7pm and metformin at 9pm and aspirin at 10pm", "doc@example.com")
+    assert [a.get('retriable') for a in results['actions']] == [None, True, False]
+
+    with patch('orchestrator._create_calendar_event', return_value={'htmlLink': 'http://calendar.google.com/event2'}) \
+            as mock_create_event, patch('orchestrator.get_calendar_index', return_value=None):
+        retried = retry_failed_actions(results, "doc@example.com")
+
+    mock_create_event.assert_called_once()
+    assert mock_create_event.call_args[0][0] == 'metformin at 9pm'
+    assert [a['status'] for a in retried['actions']] == ['ok', 'ok', 'error']
+    assert retried['actions'][1]['link'] == 'http://calendar.google.com/event2'
+    assert retried['calendar_error'] == "Connection reset"
+    # The earlier result is left untouched
+    assert results['actions'][1]['status'] == 'error'
+
+
+@patch('orchestrator.ACTION_TIMEOUT_SECONDS', 0.1)
+@patch('orchestrator.get_gmail_service')
+@patch('orchestrator.send_email')
+def test_process_command_action_timeout(mock_send_email, mock_get_gmail):
+    """
+    An upstream call that outlives the action timeout is reported as an email_error.
+    """
+    mock_send_email.side_effect = lambda **kwargs: time.sleep(0.5) or {'id': 'late'}
+
+    results = process_command("my rash is worse", "doc@example.com")
+
+    assert results['email_status'] is None
+    assert 'Timed out' in results['email_error']
+    assert results['actions'][0]['status'] == 'timeout'
+
+
+@patch('orchestrator.get_calendar_service')
+@patch('orchestrator.get_gmail_service')
+@patch('orchestrator.create_event')
+@patch('orchestrator.send_email')
+def test_recurring_reminder_is_one_event(mock_send_email, mock_create_event, mock_get_gmail, mock_get_cal):
+    """
+    "every day at 8pm" becomes a single event with an RRULE, reported in parsed_intents.
+    """
+    mock_create_event.return_value = {'htmlLink': 'http://calendar.google.com/event123'}
+
+    results = process_command("take insulin every day at 8pm for 2 weeks", "doc@example.com")
+
+    mock_create_event.assert_called_once()
+    kwargs = mock_create_event.call_args.kwargs
+    assert kwargs['recurrence'] == 'RRULE:FREQ=DAILY;COUNT=14'
+    assert (kwargs['start_time'].hour, kwargs['start_time'].minute) == (20, 0)
+    assert results['actions'][0]['recurrence'] == 'RRULE:FREQ=DAILY;COUNT=14'
+    assert 'RRULE:FREQ=DAILY;COUNT=14' in results['parsed_intents'][0]
+    mock_send_email.assert_not_called()
@@ -0,0 +1,88 @@
+import threading
+from concurrent.futures.process import BrokenProcessPool
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+import parse_pool
+from orchestrator import classify_fragment, plan_command
+from parse_pool import ParsePool
+
+COMMANDS = [
+    "take insulin at 7pm and my rash is worse",
+    "blood test on the 5th of next month, also I slept badly",
+    "walk every monday and thursday at 7am",
+    "follow up appointment march 3rd at 10",
+]
+
+
+@pytest.fixture(scope='module')
+def pool():
+    # One real child process; started once for the module since it loads dateparser
+    pool = ParsePool(processes=1, window_seconds=0.05).warm_up()
+    yield pool
+    pool.shutdown()
+
+
+def test_pool_classifies_like_inline_parsing(pool):
+    inline = [plan_command(command) for command in COMMANDS]
+
+    with patch('orchestrator.get_parse_pool', return_value=pool):
+        pooled = [plan_command(command) for command in COMMANDS]
+
+    def strip_seconds(plans):
+        # "take insulin at 7pm" etc. are relative to now; compare to the minute
+        return [([(text, start.replace(second=0, microsecond=0), rrule) for text, start, rrule in calendar], notes)
+                for calendar, notes in plans]
+
+    assert strip_seconds(pooled) == strip_seconds(inline)
+
+
+def test_fragments_from_concurrent_requests_share_batches(pool):
+    batches_before, fragments_before = pool.batches, pool.fragments
+    barrier = threading.Barrier(4)
+    results = [None] * 4
+
+    def request(i):
+        barrier.wait()
+        results[i] = pool.classify(["take insulin at 7pm", f"see doctor on monday {i}"])
+
+    threads = [threading.Thread(target=request, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert pool.fragments - fragments_before == 8
+    assert pool.batches - batches_before < 4
+    assert all(r[0][0].hour == 19 for r in results)
+
+
+def test_broken_pool_falls_back_to_inline_parsing_then_is_rebuilt():
+    broken, healthy = MagicMock(), MagicMock()
+    broken.submit.side_effect = BrokenProcessPool("child died")
+    done = parse_pool.Future()
+    done.set_result([("pooled", None)])
+    healthy.submit.return_value = done
+
+    with patch('parse_pool.ProcessPoolExecutor', side_effect=[broken, healthy]) as factory:
+        pool = ParsePool(processes=1)
+        try:
+            first = [("take insulin at 7pm", parse_pool.Future())]
+            pool._submit(first)
+            assert first[0][1].result(timeout=1) == classify_fragment("take insulin at 7pm")
+
+            # Backing off: parsed inline without touching a pool
+            second = [("see doctor on monday", parse_pool.Future())]
+            pool._submit(second)
+            assert second[0][1].result(timeout=1) == classify_fragment("see doctor on monday")
+            assert factory.call_count == 1 and broken.submit.call_count == 1
+
+            pool._rebuild_at = 0
+            third = [("take insulin at 7pm", parse_pool.Future())]
+            pool._submit(third)
+            assert third[0][1].result(timeout=1) == ("pooled", None)
+            broken.shutdown.assert_called_once()
+            assert pool.state()['rebuilds'] == 1 and pool._failures == 0
+        finally:
+            pool.shutdown()
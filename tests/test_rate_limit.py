@@ -0,0 +1,148 @@
+import pytest
+import httplib2
+from unittest.mock import MagicMock, patch
+from googleapiclient.errors import HttpError
+
+import rate_limit
+from rate_limit import TokenBucket, CircuitBreaker, CircuitOpenError, QuotaExhausted
+from transport import ConnectFailed
+
+
+@pytest.fixture(autouse=True)
+def clean_limiter():
+    rate_limit.reset()
+    yield
+    rate_limit.reset()
+
+
+def _http_error(status, headers=None, content=b'error'):
+    resp = httplib2.Response(dict({'status': str(status)}, **(headers or {})))
+    return HttpError(resp=resp, content=content)
+
+
+def _request(*outcomes):
+    request = MagicMock()
+    request.execute.side_effect = list(outcomes)
+    return request
+
+
+def test_token_bucket_smooths_bursts():
+    bucket = TokenBucket(rate=100, capacity=200)
+    assert bucket.reserve(100) == 0
+    assert bucket.reserve(100) == 0
+    # Bucket is empty: the next call waits for one call's worth of refill
+    assert bucket.reserve(100) == pytest.approx(1.0, abs=0.05)
+    assert bucket.state()['waits'] == 1
+
+
+def test_token_bucket_rejects_excessive_waits():
+    bucket = TokenBucket(rate=1, capacity=1)
+    bucket.reserve(1)
+    with pytest.raises(QuotaExhausted):
+        bucket.reserve(1, max_wait=0.1)
+
+
+@patch('rate_limit.time.sleep')
+def test_execute_retries_5xx_then_succeeds(mock_sleep):
+    request = _request(_http_error(503), _http_error(500), {'items': []})
+
+    assert rate_limit.execute(request, 'calendar.list') == {'items': []}
+    assert request.execute.call_count == 3
+    assert mock_sleep.call_count == 2
+
+
+@patch('rate_limit.time.sleep')
+def test_execute_honours_retry_after(mock_sleep):
+    request = _request(_http_error(429, {'retry-after': '7'}), {'id': 'msg1'})
+
+    rate_limit.execute(request, 'gmail.send')
+
+    mock_sleep.assert_called_once_with(7.0)
+
+
+@patch('rate_limit.time.sleep')
+def test_execute_retries_rate_limit_403_but_not_other_4xx(mock_sleep):
+    limited = _request(_http_error(403, content=b'{"error": {"errors": [{"reason": "userRateLimitExceeded"}]}}'),
+                       {'id': 'msg1'})
+    assert rate_limit.execute(limited, 'gmail.send') == {'id': 'msg1'}
+
+    denied = _request(_http_error(403, content=b'Access Denied'))
+    with pytest.raises(HttpError):
+        rate_limit.execute(denied, 'gmail.send')
+    assert denied.execute.call_count == 1
+
+
+@patch('rate_limit.time.sleep')
+@pytest.mark.parametrize("error", [_http_error(500), _http_error(504), TimeoutError("read timed out"),
+                                   ConnectionResetError("connection reset")])
+def test_sends_are_not_retried_when_google_may_have_received_them(mock_sleep, error):
+    request = _request(error, {'id': 'msg2'})
+
+    with pytest.raises(type(error)):
+        rate_limit.execute(request, 'gmail.send')
+
+    assert request.execute.call_count == 1
+    # Still a failure of the upstream, as far as the breaker is concerned
+    assert rate_limit.limiter_state()['breakers']['gmail']['consecutive_failures'] == 1
+
+
+@patch('rate_limit.time.sleep')
+@pytest.mark.parametrize("error", [_http_error(503), _http_error(429), ConnectFailed("refused"),
+                                   ConnectionRefusedError("refused")])
+def test_inserts_are_retried_when_google_turned_them_away(mock_sleep, error):
+    request = _request(error, {'id': 'event1'})
+
+    assert rate_limit.execute(request, 'calendar.insert') == {'id': 'event1'}
+    assert request.execute.call_count == 2
+
+
+@patch('rate_limit.time.sleep')
+def test_circuit_opens_after_repeated_failures(mock_sleep):
+    failing = MagicMock()
+    failing.execute.side_effect = _http_error(503)
+
+    for _ in range(rate_limit.BREAKER_FAILURE_THRESHOLD):
+        with pytest.raises(HttpError):
+            rate_limit.execute(failing, 'calendar.insert', max_retries=0)
+
+    with pytest.raises(CircuitOpenError):
+        rate_limit.execute(failing, 'calendar.insert')
+    assert failing.execute.call_count == rate_limit.BREAKER_FAILURE_THRESHOLD
+    assert rate_limit.limiter_state()['breakers']['calendar']['state'] == CircuitBreaker.OPEN
+
+
+def test_circuit_half_open_trial_closes_on_success():
+    breaker = CircuitBreaker('gmail', failure_threshold=1, reset_seconds=0)
+    breaker.record_failure()
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_quota_exhausted_during_half_open_trial_does_not_wedge_the_breaker():
+    breaker = rate_limit.get_breaker('gmail.send')
+    breaker.reset_seconds = 0
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    bucket = rate_limit.get_bucket('gmail.send')
+
+    with patch.object(bucket, 'reserve', side_effect=QuotaExhausted("no quota")):
+        with pytest.raises(QuotaExhausted):
+            rate_limit.execute(_request({'id': 1}), 'gmail.send')
+    assert breaker.state == CircuitBreaker.OPEN
+
+    # Quota is back: the next call makes the trial and closes the breaker
+    assert rate_limit.execute(_request({'id': 2}), 'gmail.send') == {'id': 2}
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_buckets_are_keyed_by_user_and_api():
+    rate_limit.execute(_request({'id': 1}), 'gmail.send', user='alice')
+    rate_limit.execute(_request({'id': 2}), 'calendar.insert', user='alice')
+    rate_limit.execute(_request({'id': 3}), 'gmail.send', user='bob')
+
+    buckets = rate_limit.limiter_state()['buckets']
+    assert set(buckets) == {'alice:gmail', 'alice:calendar', 'bob:gmail'}
+    capacity = rate_limit.QUOTAS['gmail'][1]
+    assert buckets['alice:gmail']['tokens'] == pytest.approx(capacity - 100, abs=1)
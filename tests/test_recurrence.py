@@ -0,0 +1,74 @@
+import pytest
+from datetime import datetime
+from dateutil.rrule import rrulestr
+
+from date_intent import extract_datetime
+from orchestrator import plan_command
+from recurrence import extract_recurrence, build_rrule, default_start, has_reminder_cue
+
+# Saturday evening
+NOW = datetime(2026, 10, 17, 20, 30)
+
+
+def _resolve(fragment):
+    recurrence, remainder = extract_recurrence(fragment)
+    start = extract_datetime(remainder, now=NOW) or default_start(recurrence, NOW)
+    return build_rrule(recurrence, start)
+
+
+@pytest.mark.parametrize("fragment, start, rrule", [
+    ("take insulin every day at 8pm", datetime(2026, 10, 18, 20, 0), "RRULE:FREQ=DAILY"),
+    ("take metformin twice daily", datetime(2026, 10, 18, 9, 0), "RRULE:FREQ=HOURLY;INTERVAL=12"),
+    ("physio every Monday for 4 weeks", datetime(2026, 10, 19, 9, 0), "RRULE:FREQ=WEEKLY;BYDAY=MO;COUNT=4"),
+    ("antibiotics 3 times a day for 5 days", datetime(2026, 10, 18, 9, 0), "RRULE:FREQ=HOURLY;INTERVAL=8;COUNT=15"),
+    ("vitamin d every other day at 9am", datetime(2026, 10, 18, 9, 0), "RRULE:FREQ=DAILY;INTERVAL=2"),
+    ("walk every monday, wednesday & friday at 7am", datetime(2026, 10, 19, 7, 0),
+     "RRULE:FREQ=WEEKLY;BYDAY=MO,WE,FR"),
+    ("check sugar every morning", datetime(2026, 10, 18, 8, 0), "RRULE:FREQ=DAILY"),
+    ("every weekday at 8:30am stretch", datetime(2026, 10, 19, 8, 30), "RRULE:FREQ=DAILY;BYDAY=MO,TU,WE,TH,FR"),
+    ("take pills every 8 hours for 10 doses", datetime(2026, 10, 18, 9, 0), "RRULE:FREQ=HOURLY;INTERVAL=8;COUNT=10"),
+    ("insulin nightly for a week", datetime(2026, 10, 17, 21, 0), "RRULE:FREQ=DAILY;COUNT=7"),
+])
+def test_recurring_phrasings(fragment, start, rrule):
+    assert _resolve(fragment) == (start, rrule)
+
+
+@pytest.mark.parametrize("fragment", [
+    "take insulin at 7pm",
+    "i have some allergic on my hand",
+    "my rash is worse every time I eat nuts",
+    "take it 5 times a day",  # does not divide the day evenly
+])
+def test_non_recurring_fragments(fragment):
+    assert extract_recurrence(fragment) == (None, fragment)
+
+
+def test_count_covers_the_requested_window():
+    start, rrule = _resolve("physio every Monday for 4 weeks")
+    occurrences = list(rrulestr(rrule, dtstart=start))
+
+    assert len(occurrences) == 4
+    assert all(dt.weekday() == 0 and dt.hour == 9 for dt in occurrences)
+    assert occurrences[-1] == datetime(2026, 11, 9, 9, 0)
+
+
+@pytest.mark.parametrize("text", [
+    "i have been having headaches daily",
+    "my rash gets worse every morning",
+    "i wake up coughing every night",
+    "i feel dizzy on mondays",
+])
+def test_repeating_symptoms_are_summaries(text):
+    assert not has_reminder_cue(text)
+    assert plan_command(text) == ([], [text])
+
+
+@pytest.mark.parametrize("text", [
+    "take metformin twice daily",
+    "every weekday at 8:30am stretch",
+    "physio every Monday for 4 weeks",
+    "remind me to check my sugar every morning",
+])
+def test_repeating_reminders_need_a_cue(text):
+    calendar_intents, summaries = plan_command(text)
+    assert summaries == [] and calendar_intents[0][2].startswith("RRULE:")
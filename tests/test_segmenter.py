@@ -0,0 +1,59 @@
+from unittest.mock import patch
+
+import pytest
+
+from orchestrator import plan_command
+from segmenter import find_email, segment
+
+
+def _texts(text):
+    return [fragment.text for fragment in segment(text)[0]]
+
+
+@pytest.mark.parametrize("text, fragments", [
+    ("take insulin at 7pm and i have some allergic on my hand",
+     ["take insulin at 7pm", "i have some allergic on my hand"]),
+    ("...then at 9 take metformin, also my rash is worse; remind me Friday",
+     ["at 9 take metformin", "my rash is worse", "remind me Friday"]),
+    ("I have a headache. After that take paracetamol at 7:30 p.m. tonight!",
+     ["I have a headache", "take paracetamol at 7:30 p.m. tonight"]),
+    ("walk every monday and thursday at 7am and then stretch",
+     ["walk every monday and thursday at 7am", "stretch"]),
+    ("my BP was 140/90\nfeeling dizzy & tired", ["my BP was 140/90", "feeling dizzy & tired"]),
+    ("and  and ", []),
+    ("call Dr. Smith tomorrow at 10am", ["call Dr. Smith tomorrow at 10am"]),
+    ("ask J. Smith about it. take pills at 9pm", ["ask J. Smith about it", "take pills at 9pm"]),
+    ("vitamin d plus calcium at 8pm", ["vitamin d plus calcium at 8pm"]),
+])
+def test_splits_on_conjunctions_punctuation_and_sequencing_words(text, fragments):
+    assert _texts(text) == fragments
+
+
+def test_time_tokens_and_emails_found_in_the_same_pass():
+    fragments, emails = segment("send to dr.smith@clinic.co.uk: my rash is worse and check sugar tomorrow at 8am")
+
+    assert emails == ("dr.smith@clinic.co.uk",)
+    assert [f.times for f in fragments] == [(), ("tomorrow", "8am")]
+    assert fragments[1].text == "check sugar tomorrow at 8am"
+    assert find_email("no address here") is None
+
+
+def test_fragments_without_time_tokens_skip_the_date_classifier():
+    with patch('orchestrator.extract_datetime', return_value=None) as mock_extract:
+        calendar_intents, summaries = plan_command("my rash is worse, also I slept badly; take pills at 9pm")
+
+    assert summaries == ["my rash is worse", "I slept badly", "take pills at 9pm"]
+    mock_extract.assert_called_once_with("take pills at 9pm")
+
+
+def test_abbreviation_keeps_a_reminder_whole():
+    calendar_intents, summaries = plan_command("call Dr. Smith tomorrow at 10am")
+
+    assert summaries == []
+    assert [intent[0] for intent in calendar_intents] == ["call Dr. Smith tomorrow at 10am"]
+
+
+def test_long_transcript_is_scanned_linearly():
+    text = "take insulin at 7pm and my rash is worse. " * 2000
+    fragments, _ = segment(text)
+    assert len(fragments) == 4000
@@ -0,0 +1,132 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from send_command import build_payload, load_corpus, percentile, run_load
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'   # keep-alive
+
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        with server.lock:
+            server.bodies.append(body)
+            server.keys.add(self.headers.get('Idempotency-Key'))
+            server.tenants.add((self.headers.get('X-Tenant-ID'), self.headers.get('X-Tenant-Key')))
+            server.connections.add(self.client_address)
+            n = len(server.bodies)
+        time.sleep(server.delay)
+        status = 503 if server.fail_every and n % server.fail_every == 0 else 200
+        payload = b'{"success": true}'
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    httpd.daemon_threads = True
+    httpd.lock = threading.Lock()
+    httpd.bodies, httpd.keys, httpd.tenants, httpd.connections = [], set(), set(), set()
+    httpd.delay, httpd.fail_every = 0.0, 0
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _url(server, path='/process-command'):
+    return f"http://127.0.0.1:{server.server_address[1]}{path}"
+
+
+def test_load_corpus_reads_jsonl_and_text(tmp_path):
+    corpus = tmp_path / 'corpus.jsonl'
+    corpus.write_text('\n'.join([
+        json.dumps({'text': 'take insulin at 7pm', 'doctor_email': 'a@example.com'}),
+        json.dumps({'request_id': 'user-001', 'title': 'Title only', 'body': 'Body wins'}),
+        json.dumps({'unrelated': 1}),
+        '',
+        'I feel dizzy',
+    ]))
+    assert load_corpus(str(corpus), 'doc@example.com') == [
+        ('take insulin at 7pm', 'a@example.com'),
+        ('Body wins', 'doc@example.com'),
+        ('I feel dizzy', 'doc@example.com'),
+    ]
+
+
+def test_build_payload_follows_the_endpoint():
+    assert build_payload('http://h/send-summary', 'dizzy', 'd@x.com') == {'doctor_email': 'd@x.com', 'summary': 'dizzy'}
+    assert build_payload('http://h/process-command', 'dizzy', 'd@x.com') == {'text': 'dizzy', 'doctor_email': 'd@x.com'}
+
+
+def test_percentile_nearest_rank():
+    samples = list(range(1, 101))
+    assert percentile(samples, 0.50) == 50
+    assert percentile(samples, 0.99) == 99
+    assert percentile(samples, 1.0) == 100
+    assert percentile([7], 0.95) == 7
+    assert percentile([], 0.5) is None
+
+
+def test_closed_loop_reuses_connections_and_breaks_down_errors(server):
+    server.fail_every = 4
+    corpus = [('take insulin at 7pm', 'doc@example.com'), ('I feel dizzy', 'doc@example.com')]
+
+    report = run_load(_url(server), corpus, mode='closed', concurrency=3, total=40, tenant='p-7',
+                      tenant_key='secret-7')
+
+    assert report['requests'] == 40 and len(server.bodies) == 40
+    assert report['ok'] == 30 and report['errors'] == {'HTTP 503': 10}
+    # Each client kept one keep-alive connection
+    assert report['connections'] == 3 and len(server.connections) == 3
+    # Fresh Idempotency-Key per request, so the server's replay cache never answers
+    assert len(server.keys) == 40
+    assert server.tenants == {('p-7', 'secret-7')}
+    # The corpus is cycled: half of the requests carry each command
+    assert server.bodies.count({'text': 'take insulin at 7pm', 'doctor_email': 'doc@example.com'}) == 20
+    latency = report['latency_ms']
+    assert 0 < latency['p50'] <= latency['p95'] <= latency['p99'] <= latency['max']
+    json.dumps(report)
+
+
+def test_open_loop_keeps_the_arrival_rate(server):
+    server.delay = 0.05
+    report = run_load(_url(server, '/send-summary'), [('dizzy', 'doc@example.com')],
+                      mode='open', rate=100, concurrency=16, duration=0.5)
+
+    # ~50 arrivals in 0.5 s although each request takes 50 ms (about 5 in flight)
+    assert 45 <= report['requests'] <= 51
+    assert report['target_rate_rps'] == 100
+    assert report['errors'] == {}
+    assert report['latency_ms']['p50'] >= 50
+    assert server.bodies[0] == {'doctor_email': 'doc@example.com', 'summary': 'dizzy'}
+
+
+def test_open_loop_counts_queueing_as_latency(server):
+    server.delay = 0.05
+    # 100/s offered, but one request in flight can only do ~20/s: the backlog shows up as latency
+    report = run_load(_url(server), [('dizzy', 'doc@example.com')], mode='open', rate=100,
+                      concurrency=1, total=20)
+
+    assert report['requests'] == 20
+    assert report['latency_ms']['max'] > 500
+
+
+def test_connection_errors_are_counted():
+    report = run_load('http://127.0.0.1:9/process-command', [('dizzy', 'doc@example.com')],
+                      concurrency=2, total=4, timeout=2)
+    assert report['ok'] == 0
+    assert report['errors'] == {'ConnectionError': 4}
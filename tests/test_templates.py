@@ -0,0 +1,97 @@
+import re
+import pytest
+from unittest.mock import patch
+
+import templates
+from templates import render, render_many
+from utils import format_email_body
+
+TIMESTAMP = "2026-10-17 09:05:03"
+_real_current_timestamp = templates.current_timestamp
+
+# Output of the original string-assembly format_email_body; must stay byte-identical
+GOLDEN_TEXT = (
+    "Patient Name: Anusha S\n"
+    "Patient ID: 54321\n"
+    "Date: 2026-10-17 09:05:03\n"
+    "--------------------\n"
+    "Summary Report:\n"
+    "Dizzy after breakfast.\n"
+    "BP 120/80 & <rising>"
+)
+GOLDEN_HTML = (
+    "<div style='font-family: Arial, sans-serif; color: #333;'>\n"
+    "<div style='background-color: #f4f4f4; padding: 10px; border-radius: 5px; margin-bottom: 20px;'>\n"
+    "<p><strong>Patient Name:</strong> Anusha S</p>\n"
+    "<p><strong>Patient ID:</strong> 54321</p>\n"
+    "<p><strong>Date:</strong> 2026-10-17 09:05:03</p>\n"
+    "</div>\n"
+    "<h3>Summary Report</h3>\n"
+    "<div style='line-height: 1.5;'>Dizzy after breakfast.<br>BP 120/80 &amp; &lt;rising&gt;</div>\n"
+    "<br><hr>\n"
+    "<p style='font-size: 12px; color: #888;'>Generated by SpeakSpace Health Assistant</p>\n"
+    "</div>"
+)
+GOLDEN_TEXT_NO_METADATA = "Summary Report:\nRash"
+GOLDEN_HTML_NO_METADATA = (
+    "<div style='font-family: Arial, sans-serif; color: #333;'>\n"
+    "<h3>Summary Report</h3>\n"
+    "<div style='line-height: 1.5;'>Rash</div>\n"
+    "<br><hr>\n"
+    "<p style='font-size: 12px; color: #888;'>Generated by SpeakSpace Health Assistant</p>\n"
+    "</div>"
+)
+
+
+@pytest.fixture(autouse=True)
+def fixed_timestamp():
+    with patch('templates.current_timestamp', return_value=TIMESTAMP):
+        yield
+
+
+def test_summary_golden_output():
+    text, html_body = format_email_body(
+        summary="Dizzy after breakfast.\nBP 120/80 & <rising>",
+        patient_name="Anusha S",
+        patient_id="54321"
+    )
+    assert text == GOLDEN_TEXT
+    assert html_body == GOLDEN_HTML
+
+
+def test_summary_golden_output_without_metadata():
+    assert format_email_body("Rash", include_metadata=False) == (GOLDEN_TEXT_NO_METADATA, GOLDEN_HTML_NO_METADATA)
+
+
+def test_patient_fields_are_escaped_in_html_only():
+    text, html_body = render('summary', "ok", patient_name="<b>Eve</b>", patient_id=None)
+    assert "Patient Name: <b>Eve</b>" in text
+    assert "Patient ID: N/A" in text
+    assert "<strong>Patient Name:</strong> &lt;b&gt;Eve&lt;/b&gt;" in html_body
+
+
+def test_named_templates():
+    text, html_body = render('symptom_report', "Headache", include_metadata=False)
+    assert text == "Symptom Report:\nHeadache"
+    assert "<h3>Symptom Report</h3>" in html_body
+
+    text, _ = render('reminder_confirmation', "take insulin at 7pm", include_metadata=False)
+    assert text.startswith("Reminder Confirmation:")
+
+    with pytest.raises(ValueError):
+        render('no_such_template', "x")
+
+
+def test_render_many_matches_single_renders():
+    items = [
+        {"summary": "Dizzy after breakfast.\nBP 120/80 & <rising>", "patient_name": "Anusha S", "patient_id": "54321"},
+        {"summary": "Rash"},
+    ]
+    rendered = render_many('summary', items)
+    assert rendered[0] == (GOLDEN_TEXT, GOLDEN_HTML)
+    assert rendered[1] == render('summary', "Rash")
+
+
+def test_current_timestamp_format():
+    stamp = _real_current_timestamp()
+    assert re.fullmatch(r"\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}", stamp)
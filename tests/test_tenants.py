@@ -0,0 +1,202 @@
+import asyncio
+import json
+from datetime import datetime
+from unittest.mock import patch
+
+import pytest
+from fastapi import HTTPException
+
+import orchestrator
+import tenants
+from google_services import quota_user
+from main import ExecuteRequest, SummaryRequest, process_command_endpoint, send_summary_endpoint
+from tenants import Patient, TenantClientCache, TenantRegistry, UnknownTenant, hash_tenant_key
+
+TOKEN = {'token': 'access', 'refresh_token': 'refresh', 'client_id': 'client', 'client_secret': 'secret'}
+
+
+def _profile(tenant_id, **extra):
+    return {'tenant_id': tenant_id, 'patient_name': f'Patient {tenant_id}', 'patient_id': tenant_id[2:],
+            'token': TOKEN, **extra}
+
+
+@pytest.fixture
+def registry(tmp_path):
+    return TenantRegistry(str(tmp_path / 'tenants.jsonl'))
+
+
+@pytest.fixture
+def shared_registry(tmp_path):
+    """
+    The process-wide registry (used by get_patient / get_tenant_service) on a temporary file.
+    """
+    with patch('tenants.TENANT_DB', str(tmp_path / 'tenants.jsonl')):
+        tenants.reset_tenants()
+        yield tenants.get_tenant_registry()
+        tenants.reset_tenants()
+
+
+def test_registry_follows_appended_updates(registry):
+    assert registry.get('p-1') is None and len(registry) == 0
+
+    registry.put(_profile('p-1'))
+    registry.put(_profile('p-2'))
+    assert registry.get('p-1')['patient_name'] == 'Patient p-1'
+    first_version = registry.version('p-1')
+
+    # Written by another process: a replaced profile, a removal and a half-written line
+    with open(registry.path, 'a') as f:
+        f.write(json.dumps(_profile('p-1', patient_name='Renamed')) + '\n')
+        f.write(json.dumps({'tenant_id': 'p-2', 'deleted': True}) + '\n')
+        f.write('{"tenant_id": "p-3", "pat')
+
+    assert registry.get('p-1')['patient_name'] == 'Renamed'
+    assert registry.version('p-1') != first_version
+    assert registry.get('p-2') is None
+    assert registry.get('p-3') is None
+    assert len(registry) == 1
+
+    with open(registry.path, 'a') as f:
+        f.write('ient_name": "Late"}\n')
+    assert registry.get('p-3')['patient_name'] == 'Late'
+
+
+def test_registry_reindexes_a_replaced_file(registry, tmp_path):
+    registry.put(_profile('p-1'))
+    assert registry.get('p-1') is not None
+
+    replacement = tmp_path / 'new.jsonl'
+    replacement.write_text(json.dumps(_profile('p-9')) + '\n')
+    replacement.replace(registry.path)
+
+    assert registry.get('p-1') is None
+    assert registry.get('p-9')['patient_id'] == '9'
+
+
+def test_client_cache_loads_lazily_and_evicts_least_recently_used(registry):
+    for i in range(3):
+        registry.put(_profile(f'p-{i}'))
+    cache = TenantClientCache(registry, capacity=2)
+
+    gmail = cache.get_service('p-0', 'gmail', 'v1')
+    assert cache.get_service('p-0', 'gmail', 'v1') is gmail
+    calendar = cache.get_service('p-0', 'calendar', 'v3')
+    # One tenant's clients share its credentials and connection pool
+    assert calendar._http is gmail._http
+    assert quota_user(gmail) == 'p-0'
+
+    cache.get_service('p-1', 'gmail', 'v1')
+    first = cache.clients('p-0')          # p-0 is now the most recently used
+    cache.get_service('p-2', 'gmail', 'v1')
+
+    state = cache.state()
+    assert state['cached_tenants'] == 2 and state['evictions'] == 1
+    assert state['hits'] == 3 and state['misses'] == 3
+    assert cache.clients('p-0') is first
+    # p-1 was evicted: its clients are rebuilt on next use
+    assert cache.state()['misses'] == 3
+    cache.get_service('p-1', 'gmail', 'v1')
+    assert cache.state()['misses'] == 4
+
+    with pytest.raises(UnknownTenant):
+        cache.get_service('p-404', 'gmail', 'v1')
+
+
+def test_client_cache_rebuilds_after_profile_change(registry, tmp_path):
+    token_file = tmp_path / 'p-1.json'
+    token_file.write_text(json.dumps(TOKEN))
+    registry.put({'tenant_id': 'p-1', 'token_file': 'p-1.json'})
+    cache = TenantClientCache(registry)
+
+    before = cache.get_service('p-1', 'gmail', 'v1')
+    assert cache.clients('p-1').creds.token == 'access'
+
+    token_file.with_name('p-1-new.json').write_text(json.dumps(dict(TOKEN, token='rotated')))
+    registry.put({'tenant_id': 'p-1', 'token_file': 'p-1-new.json'})
+
+    assert cache.get_service('p-1', 'gmail', 'v1') is not before
+    assert cache.clients('p-1').creds.token == 'rotated'
+    assert cache.state()['cached_tenants'] == 1
+
+
+@patch('orchestrator.get_calendar_index')
+@patch('orchestrator.create_event', return_value={'htmlLink': 'https://calendar.example.com/e1'})
+@patch('orchestrator.send_email', return_value={'id': 'msg1'})
+@patch('orchestrator.get_gmail_service')
+@patch('orchestrator.get_calendar_service')
+def test_process_command_uses_the_tenants_profile_and_account(mock_get_cal, mock_get_gmail, mock_send_email,
+                                                              mock_create_event, mock_index, shared_registry):
+    shared_registry.put(_profile('p-7', patient_name='Jane D', patient_id='7007'))
+
+    with patch('orchestrator.extract_datetime', side_effect=lambda text: datetime(2030, 1, 1, 19) if '7pm' in text
+               else None):
+        results = orchestrator.process_command("take insulin at 7pm and my knee hurts", "doc@example.com", "p-7")
+
+    assert [a['status'] for a in results['actions']] == ['ok', 'ok']
+    mock_get_cal.assert_called_once_with('p-7')
+    mock_get_gmail.assert_called_once_with('p-7')
+    assert 'Jane D' in mock_send_email.call_args.kwargs['text_body']
+    # The duplicate index mirrors the shared account only
+    mock_index.assert_not_called()
+
+    with pytest.raises(UnknownTenant):
+        orchestrator.process_command("my knee hurts", "doc@example.com", "p-404")
+
+
+def test_plan_actions_carry_the_tenant_to_the_job_queue(shared_registry):
+    shared_registry.put(_profile('p-7', patient_name='Jane D'))
+    actions = orchestrator.plan_actions("my knee hurts", "doc@example.com", "p-7")
+    assert actions == [{'type': 'email', 'text': 'my knee hurts', 'to': 'doc@example.com', 'tenant': 'p-7'}]
+
+    with patch('orchestrator.send_email', return_value={'id': 'msg1'}) as mock_send_email, \
+         patch('orchestrator.get_gmail_service') as mock_get_gmail:
+        orchestrator.run_action(actions[0])
+    mock_get_gmail.assert_called_once_with('p-7')
+    assert 'Jane D' in mock_send_email.call_args.kwargs['text_body']
+
+
+def test_get_patient_defaults_without_tenant(shared_registry):
+    assert tenants.get_patient() == Patient("Anusha S", "54321")
+    shared_registry.put(_profile('p-7'))
+    assert tenants.get_patient('p-7') == Patient('Patient p-7', '7', 'p-7')
+
+
+def test_send_summary_unknown_tenant_is_404(shared_registry):
+    request = SummaryRequest(doctor_email="doc@example.com", summary="Feeling dizzy")
+    with patch('main.send_email') as mock_send_email:
+        with pytest.raises(HTTPException) as raised:
+            asyncio.run(send_summary_endpoint(request, tenant_id='p-404'))
+    assert raised.value.status_code == 404
+    mock_send_email.assert_not_called()
+
+
+@pytest.mark.parametrize("key", [None, "wrong"])
+def test_tenant_requests_need_the_tenants_key(shared_registry, key):
+    shared_registry.put(_profile('p-7', key_sha256=hash_tenant_key('secret-7')))
+    shared_registry.put(_profile('p-8'))   # no key registered: refuses every request
+    summary = SummaryRequest(doctor_email="doc@example.com", summary="Feeling dizzy")
+    command = ExecuteRequest(text="my knee hurts", doctor_email="doc@example.com")
+
+    with patch('main.send_email') as mock_send_email, patch('main.process_command') as mock_process:
+        for tenant_id in ('p-7', 'p-8'):
+            with pytest.raises(HTTPException) as raised:
+                asyncio.run(send_summary_endpoint(summary, tenant_id=tenant_id, tenant_key=key))
+            assert raised.value.status_code == 401
+            with pytest.raises(HTTPException) as raised:
+                asyncio.run(process_command_endpoint(command, tenant_id=tenant_id, tenant_key=key))
+            assert raised.value.status_code == 401
+    mock_send_email.assert_not_called()
+    mock_process.assert_not_called()
+
+
+def test_tenant_request_with_its_key_is_sent(shared_registry):
+    shared_registry.put(_profile('p-7', key_sha256=hash_tenant_key('secret-7')))
+    request = SummaryRequest(doctor_email="doc@example.com", summary="Feeling dizzy")
+
+    with patch('main.send_email', return_value={'id': 'msg1'}) as mock_send_email, \
+         patch('main.get_gmail_service') as mock_get_gmail:
+        response = asyncio.run(send_summary_endpoint(request, tenant_id='p-7', tenant_key='secret-7'))
+
+    assert response["gmail_message_id"] == "msg1"
+    mock_get_gmail.assert_called_once_with('p-7')
+    mock_send_email.assert_called_once()
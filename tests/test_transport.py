@@ -0,0 +1,121 @@
+import json
+import socket
+import threading
+from datetime import datetime
+from unittest.mock import MagicMock, patch
+
+import pytest
+import requests
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+
+from benchmarks.fake_google import FakeGoogleServer
+import rate_limit
+from calendar_client import create_events_batch
+from gmail_client import build_message, send_email
+from transport import ConnectFailed, PooledHttp, _to_httplib2
+
+
+@pytest.fixture
+def fake_google():
+    with FakeGoogleServer() as server, \
+         patch.dict('rate_limit.QUOTAS', {'gmail': (1e9, 1e9), 'calendar': (1e9, 1e9)}):
+        yield server
+
+
+def _client(api, version, server, http):
+    doc = json.loads(get_static_doc(api, version))
+    doc['rootUrl'] = server.url
+    return build_from_document(doc, http=http)
+
+
+def test_googleapiclient_requests_share_pooled_connections(fake_google):
+    http = PooledHttp(Credentials(token='token'), pool_size=4)
+    gmail = _client('gmail', 'v1', fake_google, http)
+
+    threads = [threading.Thread(target=send_email, args=(gmail, "doc@example.com", "s", "body"))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    result = send_email(gmail, "doc@example.com", "s", "body")
+
+    assert result['id'].startswith('fake-msg-')
+    assert fake_google.calls == 9
+    assert fake_google.connections <= 4
+
+
+def test_batch_requests_work_over_pooled_transport(fake_google):
+    calendar = _client('calendar', 'v3', fake_google, PooledHttp(Credentials(token='token')))
+
+    results = create_events_batch(calendar, [
+        {"summary": "take insulin", "start_time": datetime(2026, 10, 18, 19, 0)},
+        {"summary": "blood test", "start_time": datetime(2026, 10, 19, 9, 0)},
+    ])
+
+    assert [r['summary'] for r in results] == ["take insulin", "blood test"]
+    assert fake_google.requests == 1
+
+
+def test_401_refreshes_once_and_retries():
+    creds = MagicMock(token='old')
+    creds.before_request.side_effect = lambda request, method, uri, headers: headers.update(
+        authorization=f'Bearer {creds.token}')
+    creds.refresh.side_effect = lambda request: setattr(creds, 'token', 'new')
+    http = PooledHttp(creds)
+    rejected = MagicMock(status_code=401, headers={}, reason='Unauthorized', content=b'')
+    accepted = MagicMock(status_code=200, headers={'Content-Type': 'application/json'}, reason='OK', content=b'{}')
+
+    with patch.object(http.session, 'request', side_effect=[rejected, accepted]) as mock_request:
+        resp, content = http.request('https://example.com/x', 'POST', body='{}')
+
+    assert resp.status == 200 and content == b'{}'
+    creds.refresh.assert_called_once()
+    assert mock_request.call_args.kwargs['headers']['authorization'] == 'Bearer new'
+
+
+def test_response_looks_like_httplib2():
+    response = MagicMock(status_code=404, reason='Not Found', content=b'x',
+                         headers={'Content-Type': 'application/json', 'Content-Encoding': 'gzip',
+                                  'Content-Length': '20', 'Retry-After': '3'})
+
+    resp = _to_httplib2(response)
+
+    assert resp.status == 404 and resp.reason == 'Not Found'
+    assert resp['content-type'] == 'application/json'
+    assert resp.get('retry-after') == '3'
+    assert 'content-encoding' not in resp and 'content-length' not in resp
+
+
+def _closed_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@patch('rate_limit.time.sleep')
+def test_unreachable_google_is_retried_and_opens_the_breaker(mock_sleep):
+    rate_limit.reset()
+    unreachable = MagicMock(url=f'http://127.0.0.1:{_closed_port()}/')
+    gmail = _client('gmail', 'v1', unreachable, PooledHttp(Credentials(token='token')))
+    request = gmail.users().messages().send(userId='me', body=build_message("doc@example.com", "s", "body"))
+
+    try:
+        with pytest.raises(ConnectFailed):
+            rate_limit.execute(request, 'gmail.send')
+
+        assert mock_sleep.call_count == rate_limit.MAX_RETRIES
+        breaker = rate_limit.limiter_state()['breakers']['gmail']
+        assert breaker['consecutive_failures'] == rate_limit.MAX_RETRIES + 1
+        assert breaker['state'] == rate_limit.CircuitBreaker.OPEN
+    finally:
+        rate_limit.reset()
+
+
+def test_read_timeout_is_a_builtin_timeout():
+    http = PooledHttp()
+    with patch.object(http.session, 'request', side_effect=requests.exceptions.ReadTimeout('slow')):
+        with pytest.raises(TimeoutError):
+            http.request('https://example.com/x')
@@ -0,0 +1,148 @@
+import os
+import threading
+
+import httplib2
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+from google.auth.transport.requests import Request
+
+# Pooled keep-alive HTTP transport for the Google API clients.
+#
+# googleapiclient expects an httplib2.Http-like object. PooledHttp provides that
+# interface on top of one requests.Session whose urllib3 pool is thread-safe,
+# so every executor/action thread shares a bounded set of keep-alive TLS
+# connections instead of opening (and handshaking) its own.
+#
+# Transport failures surface as the builtin exceptions httplib2 raises (and
+# rate_limit retries), not as requests' own: ConnectFailed when the connection
+# was never opened, TimeoutError for a read timeout, ConnectionError otherwise.
+#
+# SPEAKSPACE_HTTP_TRANSPORT=httplib2 switches back to one httplib2.Http per thread.
+
+TRANSPORT_POOLED = 'pooled'
+TRANSPORT_HTTPLIB2 = 'httplib2'
+
+TRANSPORT = os.environ.get('SPEAKSPACE_HTTP_TRANSPORT', TRANSPORT_POOLED)
+# Connections kept per host; threads beyond this wait for a free connection
+POOL_SIZE = int(os.environ.get('SPEAKSPACE_HTTP_POOL_SIZE', 20))
+HTTP_TIMEOUT_SECONDS = float(os.environ.get('SPEAKSPACE_HTTP_TIMEOUT', 60))
+# Extra CA bundle, e.g. for a TLS-intercepting proxy or a local test server
+CA_BUNDLE = os.environ.get('SPEAKSPACE_HTTP_CA_BUNDLE')
+
+# Same as googleapiclient's default Http: 308 means "resume incomplete" for uploads
+REDIRECT_CODES = frozenset({300, 301, 302, 303, 307})
+# Responses that make google-auth's transports refresh the token and retry once
+REFRESH_STATUS_CODES = (401,)
+
+
+class ConnectFailed(ConnectionError):
+    """Raised when the connection could not be opened, so the request never reached the server."""
+
+
+class PooledHttp:
+    """
+    httplib2.Http-compatible client over a pooled requests.Session.
+    :param credentials: google-auth credentials applied to every request, or None
+    :param manager: Optional CredentialManager used for (single-flight) refreshes
+    :param pool_size: Keep-alive connections per host
+    """
+
+    redirect_codes = REDIRECT_CODES
+
+    def __init__(self, credentials=None, manager=None, pool_size=POOL_SIZE,
+                 timeout=HTTP_TIMEOUT_SECONDS, ca_bundle=CA_BUNDLE):
+        self.credentials = credentials
+        self.manager = manager
+        self.timeout = timeout
+        self.session = requests.Session()
+        # requests re-reads proxy and CA settings from the environment on every
+        # call (~1.5 ms); resolve them once here instead
+        self.session.trust_env = False
+        self.session.proxies.update(requests.utils.get_environ_proxies('https://www.googleapis.com/'))
+        ca_bundle = ca_bundle or os.environ.get('REQUESTS_CA_BUNDLE') or os.environ.get('CURL_CA_BUNDLE')
+        # pool_block: wait for a free connection rather than opening throwaway ones
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, pool_block=True, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        if ca_bundle:
+            self.session.verify = ca_bundle
+        self._auth_request = Request(self.session)
+        self._refresh_lock = threading.Lock()
+
+    def _authorize(self, method, uri, headers):
+        if self.credentials is None:
+            return None
+        if self.manager is not None:
+            self.manager.ensure_valid()
+        self.credentials.before_request(self._auth_request, method, uri, headers)
+        return self.credentials.token
+
+    def _refresh_after(self, token):
+        """
+        Refreshes after a 401 unless another thread already replaced the token.
+        """
+        if self.manager is not None:
+            self.manager.refresh_if_token(token)
+            return
+        with self._refresh_lock:
+            if self.credentials.token == token:
+                self.credentials.refresh(self._auth_request)
+
+    def request(self, uri, method='GET', body=None, headers=None,
+                redirections=httplib2.DEFAULT_MAX_REDIRECTS, connection_type=None, **kwargs):
+        """
+        Same signature and return value as httplib2.Http.request: (Response, content bytes).
+        """
+        refreshed = False
+        body_position = body.tell() if hasattr(body, 'tell') and hasattr(body, 'seek') else None
+        while True:
+            request_headers = dict(headers or {})
+            token = self._authorize(method, uri, request_headers)
+            try:
+                response = self.session.request(
+                    method, uri, data=body, headers=request_headers, timeout=self.timeout,
+                    allow_redirects=method in ('GET', 'HEAD') and redirections > 0,
+                )
+            except requests.exceptions.RequestException as e:
+                error = _transport_error(e)
+                if error is None:
+                    raise
+                raise error from e
+            if response.status_code in REFRESH_STATUS_CODES and token is not None and not refreshed:
+                self._refresh_after(token)
+                refreshed = True
+                if body_position is not None:
+                    body.seek(body_position)
+                continue
+            return _to_httplib2(response), response.content
+
+    def close(self):
+        self.session.close()
+
+
+def _transport_error(error):
+    """
+    The builtin exception matching a requests transport failure, or None to re-raise it as is.
+    """
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    if isinstance(error, requests.exceptions.ConnectTimeout) or \
+            isinstance(reason, (urllib3.exceptions.NewConnectionError, urllib3.exceptions.ConnectTimeoutError)):
+        return ConnectFailed(str(error))
+    if isinstance(error, requests.exceptions.Timeout):
+        return TimeoutError(str(error))
+    if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError)):
+        return ConnectionError(str(error))
+    return None
+
+
+def _to_httplib2(response):
+    info = {key.lower(): value for key, value in response.headers.items()}
+    # requests already decoded the body; mirror httplib2, which hides the encoding the same way
+    if 'content-encoding' in info:
+        info['-content-encoding'] = info.pop('content-encoding')
+        info.pop('content-length', None)
+    info['status'] = str(response.status_code)
+    resp = httplib2.Response(info)
+    resp.reason = response.reason
+    return resp
@@ -0,0 +1,68 @@
+import os
+import time
+
+import google_services
+from date_intent import extract_datetime
+from utils import format_email_body
+
+# Work done once per server process before it accepts traffic, so the first
+# request does not pay for it: dateparser's language data, Google credentials
+# and discovery documents, and the email templates.
+#
+# Runs from the FastAPI lifespan; SPEAKSPACE_WARMUP=0 skips it (e.g. tests).
+
+WARMUP_ENABLED = os.environ.get('SPEAKSPACE_WARMUP', '1').lower() not in ('0', 'false', 'no')
+
+GOOGLE_APIS = [('gmail', 'v1'), ('calendar', 'v3')]
+
+# Phrases that miss the fast path and reach dateparser, loading its English data
+_DATE_PHRASES = [
+    "take insulin at 7pm",
+    "blood test on the 5th of next month",
+    "follow up appointment march 3rd at 10",
+]
+
+
+def warm_date_parser():
+    for phrase in _DATE_PHRASES:
+        extract_datetime(phrase)
+
+
+def warm_google_clients():
+    """
+    Loads credentials and builds the Gmail and Calendar clients.
+    Never starts the interactive login flow; without stored credentials
+    only the discovery documents are loaded.
+    """
+    for api, version in GOOGLE_APIS:
+        google_services.get_discovery_document(api, version)
+
+    creds = google_services.get_credentials(interactive=False)
+    if creds is None:
+        print("Warm-up: no stored Google credentials; clients will be built on first use")
+        return
+    for api, version in GOOGLE_APIS:
+        google_services.get_service(api, version)
+
+
+def warm_templates():
+    format_email_body("Warm-up", "Warm-up", "0")
+
+
+def warm_up():
+    """
+    Runs every warm-up step and returns {step: seconds}.
+    A failing step is reported and skipped; the server still starts.
+    """
+    timings = {}
+    for name, step in (('date_parser', warm_date_parser),
+                       ('google_clients', warm_google_clients),
+                       ('templates', warm_templates)):
+        start = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            print(f"Warm-up step {name} failed: {e}")
+        timings[name] = time.perf_counter() - start
+    print("Warm-up done: " + ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in timings.items()))
+    return timings